@@ -42,6 +42,8 @@ class AgentJinjaTemplater:
                  CONF.amphora_agent.agent_server_network_dir,
              'agent_request_read_timeout':
                  CONF.amphora_agent.agent_request_read_timeout,
+             'agent_server_threads':
+                 CONF.amphora_agent.agent_server_threads,
              'amphora_id': amphora_id,
              'base_cert_dir': CONF.haproxy_amphora.base_cert_dir,
              'base_path': CONF.haproxy_amphora.base_path,
@@ -52,6 +54,12 @@ class AgentJinjaTemplater:
              'haproxy_cmd': CONF.haproxy_amphora.haproxy_cmd,
              'heartbeat_interval': CONF.health_manager.heartbeat_interval,
              'heartbeat_key': CONF.health_manager.heartbeat_key,
+             'status_poll_interval':
+                 CONF.health_manager.status_poll_interval,
+             'heartbeat_destinations':
+                 CONF.health_manager.heartbeat_destinations,
+             'heartbeat_destination_selection':
+                 CONF.health_manager.heartbeat_destination_selection,
              'use_upstart': CONF.haproxy_amphora.use_upstart,
              'respawn_count': CONF.haproxy_amphora.respawn_count,
              'respawn_interval': CONF.haproxy_amphora.respawn_interval,
@@ -13,3 +13,5 @@
 #    under the License.
 
 VERSION = '1.0'
+# The content encodings of the request bodies decoded by the agent
+CONTENT_ENCODINGS = ['gzip']
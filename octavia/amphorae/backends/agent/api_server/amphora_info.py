@@ -16,8 +16,11 @@ import os
 import re
 import socket
 import subprocess
+import threading
+import time
 
 from oslo_log import log as logging
+from oslo_utils.secretutils import md5
 import pyroute2
 import webob
 
@@ -29,10 +32,67 @@ from octavia.common import exceptions
 
 LOG = logging.getLogger(__name__)
 
+# The network counters of the details are refreshed at most every
+# NETWORKS_MAX_AGE seconds between two interface plugs.
+NETWORKS_MAX_AGE = 10
+
 
 class AmphoraInfo:
     def __init__(self, osutils):
         self._osutils = osutils
+        self._lock = threading.Lock()
+        # Bumped on each update of the amphora (interface plugs, listener
+        # changes...), the cached data of the previous generations are
+        # stale.
+        self._generation = 0
+        self._cache = {}
+        self._package_versions = {}
+
+    def invalidate(self):
+        """Invalidate the cached data after an update of the amphora."""
+        with self._lock:
+            self._generation += 1
+
+    def _get_cached(self, name, compute, max_age=None):
+        """Get data cached until the next update of the amphora.
+
+        :param name: The name of the data.
+        :param compute: The function that computes the data.
+        :param max_age: The maximum age of the cached data in seconds, None
+                        to keep them until the next update.
+        """
+        now = time.monotonic()
+        with self._lock:
+            generation = self._generation
+            cached = self._cache.get(name)
+        if (cached and cached[0] == generation and
+                (max_age is None or now - cached[1] < max_age)):
+            return cached[2]
+        value = compute()
+        with self._lock:
+            self._cache[name] = (generation, now, value)
+        return value
+
+    def _get_package_version(self, name):
+        # The versions are cached until the package database changes
+        stamp = self._osutils.get_package_database_stamp()
+        with self._lock:
+            cached = self._package_versions.get(name)
+        if stamp is not None and cached and cached[0] == stamp:
+            return cached[1]
+        version = self._get_version_of_installed_package(name)
+        with self._lock:
+            self._package_versions[name] = (stamp, version)
+        return version
+
+    @staticmethod
+    def _conditional_response(body):
+        """Build a response that supports the If-None-Match requests."""
+        response = webob.Response(json=body)
+        response.etag = md5(response.body,
+                            usedforsecurity=False).hexdigest()  # nosec
+        response.conditional_response = True
+        return response
 
     def compile_amphora_info(self, extend_lvs_driver=None):
         extend_body = {}
@@ -40,20 +100,22 @@ class AmphoraInfo:
             extend_body = self._get_extend_body_from_lvs_driver(
                 extend_lvs_driver)
         body = {'hostname': socket.gethostname(),
-                'haproxy_version':
-                    self._get_version_of_installed_package('haproxy'),
+                'haproxy_version': self._get_package_version('haproxy'),
                 'api_version': api_server.VERSION}
         if extend_body:
             body.update(extend_body)
-        return webob.Response(json=body)
+        return self._conditional_response(body)
 
     def compile_amphora_details(self, extend_lvs_driver=None):
-        haproxy_loadbalancer_list = sorted(util.get_loadbalancers())
-        haproxy_listener_list = sorted(util.get_listeners())
+        haproxy_loadbalancer_list = self._get_cached(
+            'loadbalancers', lambda: sorted(util.get_loadbalancers()))
+        haproxy_listener_list = self._get_cached(
+            'listeners', lambda: sorted(util.get_listeners()))
         extend_body = {}
         lvs_listener_list = []
         if extend_lvs_driver:
-            lvs_listener_list = util.get_lvs_listeners()
+            lvs_listener_list = self._get_cached(
+                'lvs_listeners', util.get_lvs_listeners)
             extend_data = self._get_extend_body_from_lvs_driver(
                 extend_lvs_driver)
             lvs_count = self._count_lvs_listener_processes(
@@ -68,10 +130,12 @@ class AmphoraInfo:
             sorted(set(haproxy_listener_list + lvs_listener_list))
             if lvs_listener_list else haproxy_listener_list)
         body = {'hostname': socket.gethostname(),
-                'haproxy_version':
-                    self._get_version_of_installed_package('haproxy'),
+                'haproxy_version': self._get_package_version('haproxy'),
                 'api_version': api_server.VERSION,
-                'networks': self._get_networks(),
+                'content_encodings': api_server.CONTENT_ENCODINGS,
+                'networks': self._get_cached(
+                    'networks', self._get_networks,
+                    max_age=NETWORKS_MAX_AGE),
                 'active': True,
                 'haproxy_count':
                     self._count_haproxy_processes(haproxy_loadbalancer_list),
@@ -100,7 +164,7 @@ class AmphoraInfo:
                 'packages': {}}
         if extend_body:
             body.update(extend_body)
-        return webob.Response(json=body)
+        return self._conditional_response(body)
 
     def _get_version_of_installed_package(self, name):
 
@@ -128,7 +192,7 @@ class AmphoraInfo:
         extend_info = extend_lvs_driver.get_subscribed_amp_compile_info()
         extend_data = {}
         for extend in extend_info:
-            package_version = self._get_version_of_installed_package(extend)
+            package_version = self._get_package_version(extend)
             extend_data['%s_version' % extend] = package_version
         return extend_data
 
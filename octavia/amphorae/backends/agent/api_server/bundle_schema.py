@@ -0,0 +1,54 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# This is a JSON schema validation dictionary
+# https://json-schema.org/latest/json-schema-validation.html
+
+MD5SUM_PATTERN = '^[0-9a-f]{32}$'
+
+SUPPORTED_BUNDLE_SCHEMA = {
+    '$schema': 'http://json-schema.org/draft-07/schema#',
+    'title': 'Octavia Amphora Load Balancer Bundle Schema',
+    'description': 'This schema is used to validate a load balancer '
+                   'configuration bundle JSON document sent from a '
+                   'controller.',
+    'type': 'object',
+    'additionalProperties': False,
+    'properties': {
+        'config': {
+            'type': 'string',
+            'description': 'The haproxy configuration file.'
+        },
+        'certificates': {
+            'type': 'object',
+            'description': 'The md5sum of the certificate files, keyed by '
+                           'file name.',
+            'propertyNames': {'pattern': r'^[\w.-]+\.pem$'},
+            'additionalProperties': {
+                'type': 'string',
+                'pattern': MD5SUM_PATTERN
+            }
+        },
+        'contents': {
+            'type': 'object',
+            'description': 'The base64 encoded content of the certificate '
+                           'files, keyed by md5sum.',
+            'propertyNames': {'pattern': MD5SUM_PATTERN},
+            'additionalProperties': {'type': 'string'}
+        },
+        'reload': {
+            'type': 'boolean',
+            'description': 'Reload the load balancer once the configuration '
+                           'is applied.'
+        }
+    }
+}
@@ -0,0 +1,201 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import re
+
+from oslo_log import log as logging
+
+from octavia.amphorae.backends.agent.api_server import haproxy_compatibility
+from octavia.amphorae.backends.agent.api_server import util
+from octavia.amphorae.backends.utils import haproxy_query
+
+LOG = logging.getLogger(__name__)
+
+SECTION_PATTERN = re.compile(r'^(\S+)\s+(\S+)')
+SERVER_PATTERN = re.compile(r'^\s+server\s+(\S+)\s+(\S+)(.*)$')
+
+# Output prefixes of the successful runtime API commands, most of the
+# commands have no output. 'set server <id> addr' reports the changes, i.e.
+# "IP changed from '192.0.2.10' to '192.0.2.11', no need to change the port
+# by 'stats socket command'".
+COMMAND_SUCCESS_PREFIXES = ('New server registered.', 'Server deleted.',
+                            'IP changed from ', 'no need to change the addr')
+
+# The first HAProxy version that supports adding and deleting servers
+# without the experimental mode
+DYNAMIC_SERVERS_VERSION = (2, 5)
+
+
+class Server:
+    """A server line of a HAProxy configuration."""
+
+    def __init__(self, address, options):
+        self.address = address
+        self.weight = None
+        self.disabled = False
+        static_options = []
+        options = iter(options)
+        for option in options:
+            if option == 'weight':
+                self.weight = next(options, None)
+            elif option == 'disabled':
+                self.disabled = True
+            else:
+                static_options.append(option)
+        # The options that can't be updated at runtime
+        self.static_options = static_options
+
+    @property
+    def add_options(self):
+        options = [] if self.weight is None else ['weight', self.weight]
+        return options + self.static_options
+
+
+def parse_servers(config):
+    """Extract the servers of the backends of a HAProxy configuration.
+
+    :param config: The HAProxy configuration.
+    :returns: A tuple of the configuration without the server lines of the
+              backends and of a dict {backend: {server_name: Server}}.
+    """
+    lines = []
+    backends = {}
+    servers = None
+    for line in config.splitlines():
+        if line and not line[0].isspace():
+            match = SECTION_PATTERN.match(line)
+            if match and match.group(1) == 'backend':
+                servers = backends.setdefault(match.group(2), {})
+            else:
+                servers = None
+        elif servers is not None:
+            match = SERVER_PATTERN.match(line)
+            if match:
+                servers[match.group(1)] = Server(match.group(2),
+                                                 match.group(3).split())
+                continue
+        lines.append(line)
+    return '\n'.join(lines), backends
+
+
+def _split_address(address):
+    # IPv6 addresses are not enclosed in brackets, the port is after the
+    # last colon.
+    ip, _, port = address.rpartition(':')
+    return ip, port
+
+
+def _add_server_commands(server_id, server):
+    commands = [' '.join(['add server', server_id, server.address] +
+                         server.add_options)]
+    if 'check' in server.static_options:
+        commands.append(f'enable health {server_id}')
+    if not server.disabled:
+        # Dynamic servers are created in maintenance mode
+        commands.append(f'set server {server_id} state ready')
+    return commands
+
+
+def _del_server_commands(server_id):
+    # HAProxy refuses to delete a server that still has connections, the
+    # configuration is then reloaded.
+    return [f'set server {server_id} state maint',
+            f'del server {server_id}']
+
+
+def get_member_commands(running_config, new_config):
+    """Get the runtime API commands that apply the member changes.
+
+    Address, weight (including the drain of a member with a weight of 0)
+    and admin state changes are applied to the existing servers. Added and
+    deleted members, and the other option changes of a member (e.g. backup),
+    require the dynamic servers of HAProxy 2.5.
+
+    :param running_config: The configuration of the running HAProxy.
+    :param new_config: The new configuration.
+    :returns: The list of commands, or None if the new configuration
+              contains changes that can't be applied at runtime.
+    """
+    running_base, running_backends = parse_servers(running_config)
+    new_base, new_backends = parse_servers(new_config)
+    if running_base != new_base:
+        return None
+
+    commands = []
+    dynamic_servers = False
+    for backend, new_servers in new_backends.items():
+        running_servers = running_backends[backend]
+        for name, server in new_servers.items():
+            server_id = f'{backend}/{name}'
+            running = running_servers.get(name)
+            if running is None:
+                dynamic_servers = True
+                commands.extend(_add_server_commands(server_id, server))
+                continue
+
+            if running.static_options != server.static_options:
+                # The server is replaced
+                dynamic_servers = True
+                commands.extend(_del_server_commands(server_id))
+                commands.extend(_add_server_commands(server_id, server))
+                continue
+            if running.address != server.address:
+                ip, port = _split_address(server.address)
+                commands.append(
+                    f'set server {server_id} addr {ip} port {port}')
+            if running.weight != server.weight:
+                if server.weight is None:
+                    return None
+                commands.append(
+                    f'set server {server_id} weight {server.weight}')
+            if running.disabled != server.disabled:
+                state = 'maint' if server.disabled else 'ready'
+                commands.append(f'set server {server_id} state {state}')
+
+        for name in running_servers.keys() - new_servers.keys():
+            dynamic_servers = True
+            commands.extend(_del_server_commands(f'{backend}/{name}'))
+
+    if (dynamic_servers and haproxy_compatibility.get_haproxy_versions() <
+            DYNAMIC_SERVERS_VERSION):
+        return None
+    return commands
+
+
+def apply_member_changes(lb_id, running_config, new_config):
+    """Apply the member changes of a configuration with the runtime API.
+
+    :param lb_id: The id of the load balancer
+    :param running_config: The configuration of the running HAProxy.
+    :param new_config: The new configuration.
+    :returns: True if the running HAProxy now matches the new
+              configuration, False if it must be reloaded.
+    """
+    commands = get_member_commands(running_config, new_config)
+    if commands is None:
+        return False
+
+    lb_query = haproxy_query.HAProxyQuery(util.haproxy_admin_sock_path(lb_id))
+    for command in commands:
+        try:
+            output = lb_query.run_command(command)
+        except Exception as e:
+            LOG.info("HAProxy runtime API is not available for "
+                     "loadbalancer %s: %s", lb_id, e)
+            return False
+        if output and not output.startswith(COMMAND_SUCCESS_PREFIXES):
+            LOG.info("HAProxy runtime API command '%s' failed for "
+                     "loadbalancer %s: %s", command, lb_id, output)
+            return False
+    LOG.info("Applied %d member changes of loadbalancer %s without "
+             "reloading HAProxy.", len(commands), lb_id)
+    return True
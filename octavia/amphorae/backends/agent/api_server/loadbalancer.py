@@ -12,6 +12,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import base64
+import binascii
 import io
 import os
 import re
@@ -28,6 +30,7 @@ import webob
 from werkzeug import exceptions
 
 from octavia.amphorae.backends.agent.api_server import haproxy_compatibility
+from octavia.amphorae.backends.agent.api_server import haproxy_runtime
 from octavia.amphorae.backends.agent.api_server import util
 from octavia.amphorae.backends.utils import haproxy_query
 from octavia.common import constants as consts
@@ -35,6 +38,8 @@ from octavia.common import utils as octavia_utils
 
 LOG = logging.getLogger(__name__)
 BUFFER = 100
+CONFIG_BUFFER = 65536
+GROUP_PATTERN = re.compile(r"\s+group\s.+")
 
 CONF = cfg.CONF
 
@@ -93,37 +98,36 @@ class Loadbalancer:
         :param amphora_id: The id of the amphora to update
         :param lb_id: The id of the loadbalancer
         """
-        stream = Wrapped(flask.request.stream)
+        return self._upload_haproxy_config(
+            amphora_id, lb_id, Wrapped(flask.request.stream))
+
+    def _upload_haproxy_config(self, amphora_id, lb_id, stream):
         # We have to hash here because HAProxy has a string length limitation
         # in the configuration file "peer <peername>" lines
         peer_name = octavia_utils.base64_sha1_string(amphora_id).rstrip('=')
         if not os.path.exists(util.haproxy_dir(lb_id)):
             os.makedirs(util.haproxy_dir(lb_id))
 
-        name = os.path.join(util.haproxy_dir(lb_id), 'haproxy.cfg.new')
-        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
-        # mode 00600
-        mode = stat.S_IRUSR | stat.S_IWUSR
-        b = stream.read(BUFFER)
-        s_io = io.StringIO()
-        while b:
-            # Write haproxy configuration to StringIO
-            s_io.write(b.decode('utf8'))
-            b = stream.read(BUFFER)
-
-        # Since haproxy user_group is now auto-detected by the amphora agent,
-        # remove it from haproxy configuration in case it was provided
-        # by an older Octavia controller. This is needed in order to prevent
-        # a duplicate entry for 'group' in haproxy configuration, which will
-        # result an error when haproxy starts.
-        new_config = re.sub(r"\s+group\s.+", "", s_io.getvalue())
-
-        # Handle any haproxy version compatibility issues
-        new_config = haproxy_compatibility.process_cfg_for_version_compat(
-            new_config)
-
-        with os.fdopen(os.open(name, flags, mode), 'w') as file:
-            file.write(new_config)
+        new_config = self._read_config(stream)
+        name = self._write_new_config(lb_id, new_config)
+
+        # Skip the validation and the reload of the configuration if it is
+        # already loaded by HAProxy, or if it only contains member changes
+        # that can be applied with the runtime API.
+        running_config = self._get_running_config(lb_id)
+        if running_config is not None:
+            if running_config != new_config:
+                # The running HAProxy will differ from both configurations
+                # if the runtime API fails in the middle of the changes
+                util.set_running_config_md5(lb_id, None)
+            if (running_config == new_config or
+                    haproxy_runtime.apply_member_changes(
+                        lb_id, running_config, new_config)):
+                os.rename(name, util.config_path(lb_id))
+                util.set_running_config_md5(lb_id, self._md5(new_config))
+                res = webob.Response(json={'message': 'OK'}, status=202)
+                res.headers['ETag'] = stream.get_md5()
+                return res
 
         # use haproxy to check the config
         cmd = "haproxy -c -L {peer} -f {config_file} -f {haproxy_ug}".format(
@@ -153,10 +157,6 @@ class Loadbalancer:
 
             if init_system == consts.INIT_SYSTEMD:
                 template = SYSTEMD_TEMPLATE
-                # Render and install the network namespace systemd service
-                util.install_netns_systemd_service()
-                util.run_systemctl_command(
-                    consts.ENABLE, consts.AMP_NETNS_SVC_PREFIX + '.service')
             elif init_system == consts.INIT_UPSTART:
                 template = UPSTART_TEMPLATE
             elif init_system == consts.INIT_SYSVINIT:
@@ -173,6 +173,20 @@ class Loadbalancer:
                            "system.  We can't create the init configuration "
                            "file for the load balancing process."}, status=500)
 
+        res = webob.Response(json={'message': 'OK'}, status=202)
+        res.headers['ETag'] = stream.get_md5()
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        # The service was installed and enabled by a previous upload
+        if os.path.exists(init_path):
+            return res
+
+        if init_system == consts.INIT_SYSTEMD:
+            # Render and install the network namespace systemd service
+            util.install_netns_systemd_service()
+            util.run_systemctl_command(
+                consts.ENABLE, consts.AMP_NETNS_SVC_PREFIX + '.service')
+
         if init_system == consts.INIT_SYSTEMD:
             # mode 00644
             mode = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH
@@ -182,26 +196,25 @@ class Loadbalancer:
                     stat.S_IROTH | stat.S_IXOTH)
 
         hap_major, hap_minor = haproxy_compatibility.get_haproxy_versions()
-        if not os.path.exists(init_path):
-            with os.fdopen(os.open(init_path, flags, mode), 'w') as text_file:
-
-                text = template.render(
-                    peer_name=peer_name,
-                    haproxy_pid=util.pid_path(lb_id),
-                    haproxy_cmd=util.CONF.haproxy_amphora.haproxy_cmd,
-                    haproxy_cfg=util.config_path(lb_id),
-                    haproxy_state_file=util.state_file_path(lb_id),
-                    haproxy_socket=util.haproxy_sock_path(lb_id),
-                    haproxy_user_group_cfg=consts.HAPROXY_USER_GROUP_CFG,
-                    respawn_count=util.CONF.haproxy_amphora.respawn_count,
-                    respawn_interval=(util.CONF.haproxy_amphora.
-                                      respawn_interval),
-                    amphora_netns=consts.AMP_NETNS_SVC_PREFIX,
-                    amphora_nsname=consts.AMPHORA_NAMESPACE,
-                    haproxy_major_version=hap_major,
-                    haproxy_minor_version=hap_minor
-                )
-                text_file.write(text)
+        with os.fdopen(os.open(init_path, flags, mode), 'w') as text_file:
+
+            text = template.render(
+                peer_name=peer_name,
+                haproxy_pid=util.pid_path(lb_id),
+                haproxy_cmd=util.CONF.haproxy_amphora.haproxy_cmd,
+                haproxy_cfg=util.config_path(lb_id),
+                haproxy_state_file=util.state_file_path(lb_id),
+                haproxy_socket=util.haproxy_sock_path(lb_id),
+                haproxy_user_group_cfg=consts.HAPROXY_USER_GROUP_CFG,
+                respawn_count=util.CONF.haproxy_amphora.respawn_count,
+                respawn_interval=(util.CONF.haproxy_amphora.
+                                  respawn_interval),
+                amphora_netns=consts.AMP_NETNS_SVC_PREFIX,
+                amphora_nsname=consts.AMPHORA_NAMESPACE,
+                haproxy_major_version=hap_major,
+                haproxy_minor_version=hap_minor
+            )
+            text_file.write(text)
 
         # Make sure the new service is enabled on boot
         if init_system == consts.INIT_SYSTEMD:
@@ -219,9 +232,116 @@ class Loadbalancer:
                     'message': "Error enabling haproxy-{} service".format(
                         lb_id), 'details': e.output}, status=500)
 
+        return res
+
+    def upload_bundle(self, amphora_id, lb_id, bundle):
+        """Upload the certificates and the haproxy config of a loadbalancer
+
+        The certificates are keyed by md5sum. The bundle is rejected with the
+        list of the missing md5sums if a certificate has neither the expected
+        content on the amphora nor a content in the bundle, nothing is
+        updated in that case. Only the certificates that differ from the
+        amphora are written, HAProxy is then reloaded even if its
+        configuration is unchanged. They are restored if the configuration is
+        rejected.
+
+        :param amphora_id: The id of the amphora to update
+        :param lb_id: The id of the loadbalancer
+        :param bundle: The bundle, see bundle_schema
+        """
+        contents = {}
+        for md5sum, content in bundle.get('contents', {}).items():
+            try:
+                pem = base64.b64decode(content, validate=True)
+            except binascii.Error:
+                pem = None
+            if pem is None or md5(
+                    pem, usedforsecurity=False).hexdigest() != md5sum:  # nosec
+                return webob.Response(json={
+                    'message': 'Invalid request',
+                    'details': "Invalid content for md5sum {}".format(
+                        md5sum)}, status=400)
+            contents[md5sum] = pem
+
+        certificates = {}
+        missing = set()
+        for filename, md5sum in bundle.get('certificates', {}).items():
+            if self._get_certificate_md5(lb_id, filename) == md5sum:
+                continue
+            if md5sum in contents:
+                certificates[filename] = contents[md5sum]
+            else:
+                missing.add(md5sum)
+        if missing:
+            return webob.Response(json={
+                'message': 'Missing certificates',
+                'missing': sorted(missing)}, status=409)
+
+        # The certificates are restored if the configuration is rejected
+        previous = {filename: self._read_certificate(lb_id, filename)
+                    for filename in certificates}
+        running_md5 = util.get_running_config_md5(lb_id)
+        # Writing a certificate clears the MD5 of the running configuration
+        for filename, pem in certificates.items():
+            self._write_certificate(lb_id, filename, pem)
+
         res = webob.Response(json={'message': 'OK'}, status=202)
-        res.headers['ETag'] = stream.get_md5()
+        if 'config' in bundle:
+            res = self._upload_haproxy_config(
+                amphora_id, lb_id,
+                Wrapped(io.BytesIO(bundle['config'].encode('utf-8'))))
+            if res.status_code != 202:
+                self._restore_certificates(lb_id, previous, running_md5)
+                return res
+        if bundle.get('reload'):
+            if self._get_running_config(lb_id) is not None:
+                # The configuration was already loaded or applied with the
+                # runtime API, and no certificate was updated
+                LOG.debug("Skipping the reload of haproxy-%s, its "
+                          "configuration is up to date.", lb_id)
+                return res
+            res = self.start_stop_lb(lb_id, consts.AMP_ACTION_RELOAD)
+        return res
+
+    def update_haproxy_members(self, amphora_id, lb_id):
+        """Apply the member changes of a haproxy config without a reload
+
+        The member changes are applied with the HAProxy runtime API and the
+        configuration is saved for the next restart of HAProxy. Any other
+        change is rejected, the configuration must then be uploaded and
+        reloaded.
+
+        :param amphora_id: The id of the amphora to update
+        :param lb_id: The id of the loadbalancer
+        """
+        self._check_lb_exists(lb_id)
+        stream = Wrapped(flask.request.stream)
+        new_config = self._read_config(stream)
 
+        running_config = self._get_running_config(lb_id)
+        if running_config is None:
+            return webob.Response(json={
+                'message': "Conflict",
+                'details': "The running haproxy-{} is not using the "
+                           "current configuration".format(lb_id)},
+                status=409)
+
+        if running_config != new_config:
+            util.set_running_config_md5(lb_id, None)
+            if not haproxy_runtime.apply_member_changes(
+                    lb_id, running_config, new_config):
+                return webob.Response(json={
+                    'message': "Conflict",
+                    'details': "The configuration changes cannot be "
+                               "applied with the HAProxy runtime API"},
+                    status=409)
+
+        name = self._write_new_config(lb_id, new_config)
+        os.rename(name, util.config_path(lb_id))
+        util.set_running_config_md5(lb_id, self._md5(new_config))
+
+        res = webob.Response(json={'message': 'OK'}, status=202)
+        res.headers['ETag'] = stream.get_md5()
         return res
 
     def start_stop_lb(self, lb_id, action):
@@ -260,6 +380,11 @@ class Loadbalancer:
         cmd = ("/usr/sbin/service haproxy-{lb_id} {action}".format(
             lb_id=lb_id, action=action))
 
+        config_md5 = None
+        if action in [consts.AMP_ACTION_START, consts.AMP_ACTION_RELOAD]:
+            config_md5 = self._get_config_md5(lb_id)
+        util.set_running_config_md5(lb_id, None)
+
         try:
             subprocess.check_output(cmd.split(), stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError as e:
@@ -272,6 +397,8 @@ class Loadbalancer:
                     'message': f"Error {action}ing haproxy",
                     'details': e.output}, status=500)
 
+        util.set_running_config_md5(lb_id, config_md5)
+
         # If we are not in active/standby we need to send an IP
         # advertisement (GARP or NA). Keepalived handles this for
         # active/standby load balancers.
@@ -407,11 +534,55 @@ class Loadbalancer:
             while b:
                 crt_file.write(b)
                 b = stream.read(BUFFER)
+        # HAProxy has to be reloaded to load the new certificate
+        util.set_running_config_md5(lb_id, None)
 
         resp = webob.Response(json={'message': 'OK'})
         resp.headers['ETag'] = stream.get_md5()
         return resp
 
+    def _write_certificate(self, lb_id, filename, pem):
+        # create directory if not already there
+        if not os.path.exists(self._cert_dir(lb_id)):
+            os.makedirs(self._cert_dir(lb_id))
+
+        file = self._cert_file_path(lb_id, filename)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        # mode 00600
+        mode = stat.S_IRUSR | stat.S_IWUSR
+        with os.fdopen(os.open(file, flags, mode), 'wb') as crt_file:
+            crt_file.write(pem)
+        # HAProxy has to be reloaded to load the new certificate
+        util.set_running_config_md5(lb_id, None)
+
+    def _restore_certificates(self, lb_id, certificates, running_md5):
+        """Restore the certificates of a rejected bundle
+
+        :param lb_id: The id of the loadbalancer
+        :param certificates: The previous contents of the certificates keyed
+                             by file name, None for the new certificates.
+        :param running_md5: The previous MD5 of the running configuration
+        """
+        for filename, pem in certificates.items():
+            if pem is None:
+                os.remove(self._cert_file_path(lb_id, filename))
+            else:
+                self._write_certificate(lb_id, filename, pem)
+        util.set_running_config_md5(lb_id, running_md5)
+
+    def _read_certificate(self, lb_id, filename):
+        try:
+            with open(self._cert_file_path(lb_id, filename), 'rb') as crt_file:
+                return crt_file.read()
+        except OSError:
+            return None
+
+    def _get_certificate_md5(self, lb_id, filename):
+        pem = self._read_certificate(lb_id, filename)
+        if pem is None:
+            return None
+        return md5(pem, usedforsecurity=False).hexdigest()  # nosec
+
     def get_certificate_md5(self, lb_id, filename):
         self._check_ssl_filename_format(filename)
 
@@ -435,6 +606,7 @@ class Loadbalancer:
         self._check_ssl_filename_format(filename)
         if os.path.exists(self._cert_file_path(lb_id, filename)):
             os.remove(self._cert_file_path(lb_id, filename))
+            util.set_running_config_md5(lb_id, None)
         return webob.Response(json={'message': 'OK'})
 
     def _get_listeners_on_lb(self, lb_id):
@@ -473,6 +645,66 @@ class Loadbalancer:
     def _cert_file_path(self, lb_id, filename):
         return os.path.join(self._cert_dir(lb_id), filename)
 
+    @staticmethod
+    def _read_config(stream):
+        blocks = []
+        b = stream.read(CONFIG_BUFFER)
+        while b:
+            blocks.append(b)
+            b = stream.read(CONFIG_BUFFER)
+
+        # Since haproxy user_group is now auto-detected by the amphora agent,
+        # remove it from haproxy configuration in case it was provided
+        # by an older Octavia controller. This is needed in order to prevent
+        # a duplicate entry for 'group' in haproxy configuration, which will
+        # result an error when haproxy starts.
+        config = GROUP_PATTERN.sub("", b''.join(blocks).decode('utf8'))
+
+        # Handle any haproxy version compatibility issues
+        return haproxy_compatibility.process_cfg_for_version_compat(config)
+
+    @staticmethod
+    def _write_new_config(lb_id, config):
+        name = os.path.join(util.haproxy_dir(lb_id), 'haproxy.cfg.new')
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        # mode 00600
+        mode = stat.S_IRUSR | stat.S_IWUSR
+        with os.fdopen(os.open(name, flags, mode), 'w') as file:
+            file.write(config)
+        return name
+
+    @staticmethod
+    def _md5(config):
+        return md5(octavia_utils.b(config),
+                   usedforsecurity=False).hexdigest()  # nosec
+
+    def _get_config_md5(self, lb_id):
+        try:
+            with open(util.config_path(lb_id), encoding='utf-8') as file:
+                return self._md5(file.read())
+        except OSError:
+            return None
+
+    def _get_running_config(self, lb_id):
+        """Get the configuration loaded by the running HAProxy.
+
+        :param lb_id: The id of the load balancer
+        :returns: The configuration, or None if HAProxy is not running or
+                  its configuration file was updated since it was loaded.
+        """
+        running_md5 = util.get_running_config_md5(lb_id)
+        if (running_md5 is None or
+                self._check_haproxy_status(lb_id) != consts.ACTIVE):
+            return None
+        try:
+            with open(util.config_path(lb_id), encoding='utf-8') as file:
+                config = file.read()
+        except OSError:
+            return None
+        if self._md5(config) != running_md5:
+            return None
+        return config
+
     def _check_haproxy_status(self, lb_id):
         if os.path.exists(util.pid_path(lb_id)):
             if os.path.exists(
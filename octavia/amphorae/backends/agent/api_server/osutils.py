@@ -12,6 +12,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
 import subprocess
 
 import distro
@@ -31,6 +32,10 @@ LOG = logging.getLogger(__name__)
 
 class BaseOS:
 
+    # The files that are updated when packages are installed, upgraded or
+    # removed
+    PACKAGE_DATABASE_PATHS = ()
+
     def __init__(self, os_name):
         self.os_name = os_name
         self.package_name_map = {}
@@ -52,6 +57,21 @@ class BaseOS:
     def _map_package_name(self, package_name):
         return self.package_name_map.get(package_name, package_name)
 
+    def get_package_database_stamp(self):
+        """Get a stamp of the package database.
+
+        :returns: A value that changes when packages are installed, upgraded
+                  or removed, or None if the package database is not found.
+        """
+        stamp = []
+        for path in self.PACKAGE_DATABASE_PATHS:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp.append((path, st.st_ino, st.st_size, st.st_mtime_ns))
+        return tuple(stamp) or None
+
     def write_interface_file(self, interface, ip_address, prefixlen):
         interface = interface_file.InterfaceFile(
             name=interface,
@@ -103,6 +123,8 @@ class BaseOS:
 
 class Ubuntu(BaseOS):
 
+    PACKAGE_DATABASE_PATHS = ('/var/lib/dpkg/status',)
+
     @classmethod
     def is_os_name(cls, os_name):
         return os_name in ['ubuntu', 'debian']
@@ -114,6 +136,11 @@ class Ubuntu(BaseOS):
 
 class RH(BaseOS):
 
+    PACKAGE_DATABASE_PATHS = ('/var/lib/rpm',
+                              '/var/lib/rpm/rpmdb.sqlite',
+                              '/var/lib/rpm/rpmdb.sqlite-wal',
+                              '/var/lib/rpm/Packages')
+
     @classmethod
     def is_os_name(cls, os_name):
         return os_name in ['fedora', 'rhel', 'rocky']
@@ -12,8 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import gzip
 import os
 import stat
+import threading
+import zlib
 
 import flask
 from jsonschema import validate
@@ -24,6 +27,7 @@ from werkzeug import exceptions
 
 from octavia.amphorae.backends.agent import api_server
 from octavia.amphorae.backends.agent.api_server import amphora_info
+from octavia.amphorae.backends.agent.api_server import bundle_schema
 from octavia.amphorae.backends.agent.api_server import certificate_update
 from octavia.amphorae.backends.agent.api_server import keepalived
 from octavia.amphorae.backends.agent.api_server import keepalivedlvs
@@ -39,6 +43,7 @@ from octavia.common import constants as consts
 BUFFER = 1024
 CONF = cfg.CONF
 PATH_PREFIX = '/' + api_server.VERSION
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
 LOG = logging.getLogger(__name__)
 
 
@@ -55,6 +60,34 @@ def register_app_error_handler(app):
         app.register_error_handler(code, make_json_error)
 
 
+class GzipInput:
+    """A gzip encoded request body, decoded while it is read."""
+
+    def __init__(self, stream):
+        self._file = gzip.GzipFile(fileobj=stream, mode='rb')
+
+    def read(self, size=-1):
+        try:
+            return self._file.read(size)
+        except (EOFError, OSError, zlib.error) as e:
+            raise exceptions.BadRequest(
+                description='Invalid gzip content') from e
+
+
+def decode_content_encoding(wsgi_app):
+    """Decode the gzip encoded request bodies of a WSGI application."""
+    def app(environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            environ['wsgi.input'] = GzipInput(environ['wsgi.input'])
+            # The length of the decoded body is unknown, it is read until
+            # the end of the encoded body.
+            environ.pop('CONTENT_LENGTH', None)
+            environ['wsgi.input_terminated'] = True
+            del environ['HTTP_CONTENT_ENCODING']
+        return wsgi_app(environ, start_response)
+    return app
+
+
 class Server:
     def __init__(self):
         self.app = flask.Flask(__name__)
@@ -66,6 +99,13 @@ class Server:
         self._amphora_info = amphora_info.AmphoraInfo(self._osutils)
 
         register_app_error_handler(self.app)
+        self.app.wsgi_app = decode_content_encoding(self.app.wsgi_app)
+
+        # The requests that update the amphora are serialized, the
+        # read-only requests are handled concurrently by the other threads.
+        self._update_lock = threading.Lock()
+        self.app.before_request(self._acquire_update_lock)
+        self.app.teardown_request(self._release_update_lock)
 
         self._plug.plug_lo()
 
@@ -75,6 +115,15 @@ class Server:
                               '/loadbalancer/<amphora_id>/<lb_id>/haproxy',
                               view_func=self.upload_haproxy_config,
                               methods=['PUT'])
+        self.app.add_url_rule(rule=PATH_PREFIX +
+                              '/loadbalancer/<amphora_id>/<lb_id>/bundle',
+                              view_func=self.upload_bundle,
+                              methods=['PUT'])
+        self.app.add_url_rule(rule=PATH_PREFIX +
+                              '/loadbalancer/<amphora_id>/<lb_id>/haproxy'
+                              '/members',
+                              view_func=self.update_haproxy_members,
+                              methods=['PUT'])
         # TODO(gthiemonge) rename 'udp_listener' endpoint to 'lvs_listener'
         # when api_version is bumped
         self.app.add_url_rule(rule=PATH_PREFIX +
@@ -144,9 +193,33 @@ class Server:
                               view_func=self.set_interface_rules,
                               methods=['PUT'])
 
+    def _acquire_update_lock(self):
+        if flask.request.method not in READ_ONLY_METHODS:
+            self._update_lock.acquire()
+            flask.g.update_lock = True
+
+    def _release_update_lock(self, exc):
+        if flask.g.pop('update_lock', False):
+            # The update may have plugged an interface or changed the
+            # listeners of the amphora
+            self._amphora_info.invalidate()
+            self._update_lock.release()
+
     def upload_haproxy_config(self, amphora_id, lb_id):
         return self._loadbalancer.upload_haproxy_config(amphora_id, lb_id)
 
+    def upload_bundle(self, amphora_id, lb_id):
+        try:
+            bundle = flask.request.get_json()
+            validate(bundle, bundle_schema.SUPPORTED_BUNDLE_SCHEMA)
+        except Exception as e:
+            raise exceptions.BadRequest(
+                description='Invalid bundle information') from e
+        return self._loadbalancer.upload_bundle(amphora_id, lb_id, bundle)
+
+    def update_haproxy_members(self, amphora_id, lb_id):
+        return self._loadbalancer.update_haproxy_members(amphora_id, lb_id)
+
     def upload_lvs_listener_config(self, amphora_id, listener_id):
         return self._lvs_listener.upload_lvs_listener_config(listener_id)
 
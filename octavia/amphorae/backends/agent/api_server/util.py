@@ -134,6 +134,50 @@ def haproxy_sock_path(lb_id):
     return os.path.join(CONF.haproxy_amphora.base_path, lb_id + '.sock')
 
 
+def haproxy_admin_sock_path(lb_id):
+    return os.path.join(CONF.haproxy_amphora.base_path,
+                        lb_id + '-admin.sock')
+
+
+def running_config_md5_path(lb_id):
+    return os.path.join(haproxy_dir(lb_id), 'haproxy.cfg.running')
+
+
+def get_running_config_md5(lb_id):
+    """Get the MD5 of the configuration loaded by the HAProxy processes.
+
+    :param lb_id: The id of the load balancer
+    :returns: The MD5 of the configuration, or None if it is unknown.
+    """
+    try:
+        with open(running_config_md5_path(lb_id), encoding='utf-8') as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def set_running_config_md5(lb_id, md5sum):
+    """Record the MD5 of the configuration loaded by the HAProxy processes.
+
+    :param lb_id: The id of the load balancer
+    :param md5sum: The MD5 of the configuration, None if it is unknown.
+    """
+    path = running_config_md5_path(lb_id)
+    try:
+        if md5sum is None:
+            os.remove(path)
+            return
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        # mode 00600
+        mode = stat.S_IRUSR | stat.S_IWUSR
+        with os.fdopen(os.open(path, flags, mode), 'w') as file:
+            file.write(md5sum)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        LOG.warning("Unable to update %s: %s", path, e)
+
+
 def haproxy_check_script_path():
     return os.path.join(keepalived_check_scripts_dir(),
                         'haproxy_check_script.sh')
@@ -47,48 +47,117 @@ MSG_VER = 3
 DELTA_METRICS = ('bin', 'bout', 'ereq', 'stot')
 
 # Filesystem persistent counters for statistics deltas
+# The counters file is an append-only journal, each line is a JSON object
+# holding the latest absolute values of the listeners that changed since the
+# previous line. It is compacted into a single snapshot line every
+# COUNTERS_COMPACT_RECORDS records.
 COUNTERS = None
 COUNTERS_FILE = None
+COUNTERS_FILE_NAME = "stats_counters.json"
+COUNTERS_COMPACT_RECORDS = 100
+# Listeners whose counters changed since the last persist_counters()
+COUNTERS_CHANGED = set()
+COUNTERS_RECORDS = 0
+
+
+def _get_counters_file_path():
+    return os.path.join(CONF.haproxy_amphora.base_path, COUNTERS_FILE_NAME)
 
 
 def get_counters_file():
     global COUNTERS_FILE
     if COUNTERS_FILE is None:
-        stats_file_path = os.path.join(
-            CONF.haproxy_amphora.base_path, "stats_counters.json")
-        # Open for read+write and create if necessary
-        flags = os.O_RDWR | os.O_CREAT
+        stats_file_path = _get_counters_file_path()
+        # Open for read+append and create if necessary
+        flags = os.O_RDWR | os.O_CREAT | os.O_APPEND
         # mode 00644
         mode = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP
         try:
             COUNTERS_FILE = os.fdopen(
-                os.open(stats_file_path, flags, mode), 'r+')
+                os.open(stats_file_path, flags, mode), 'a+')
         except OSError:
             LOG.info("Failed to open `%s`, ignoring...", stats_file_path)
-    COUNTERS_FILE.seek(0)
     return COUNTERS_FILE
 
 
 def get_counters():
-    global COUNTERS
+    global COUNTERS, COUNTERS_RECORDS
     if COUNTERS is None:
+        COUNTERS = {}
+        COUNTERS_RECORDS = 0
+        COUNTERS_CHANGED.clear()
         try:
-            COUNTERS = simplejson.load(get_counters_file()) or {}
-        except (simplejson.JSONDecodeError, AttributeError):
-            COUNTERS = {}
+            counters_file = get_counters_file()
+            counters_file.seek(0)
+            content = counters_file.read()
+        except (OSError, AttributeError):
+            content = ''
+        # A record without its line ending was partially written, the next
+        # appended record would be concatenated to it.
+        invalid = bool(content) and not content.endswith('\n')
+        for record in content.splitlines():
+            try:
+                COUNTERS.update(simplejson.loads(record) or {})
+            except simplejson.JSONDecodeError:
+                # A partially written record, the values it holds were
+                # not persisted, skip it.
+                LOG.debug("Ignoring invalid statistics counter record.")
+                invalid = True
+                continue
+            COUNTERS_RECORDS += 1
+        if invalid:
+            # Replace the journal with the valid records
+            try:
+                _compact_counters()
+            except OSError:
+                LOG.warning("Couldn't compact statistics counter file!")
     return COUNTERS
 
 
+def _compact_counters():
+    """Replace the counters journal with a snapshot of the counters
+
+    The snapshot is written to a temporary file which is atomically renamed
+    over the journal, so a crash leaves either the old journal or the new
+    snapshot.
+    """
+    global COUNTERS_FILE, COUNTERS_RECORDS
+    stats_file_path = _get_counters_file_path()
+    tmp_file_path = stats_file_path + '.tmp'
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    # mode 00644
+    mode = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP
+    with os.fdopen(os.open(tmp_file_path, flags, mode), 'w') as tmp_file:
+        tmp_file.write(simplejson.dumps(COUNTERS) + '\n')
+    os.replace(tmp_file_path, stats_file_path)
+    # The journal file was replaced, re-open it on next access
+    if COUNTERS_FILE is not None:
+        COUNTERS_FILE.close()
+        COUNTERS_FILE = None
+    COUNTERS_RECORDS = 1
+
+
 def persist_counters():
-    """Attempt to persist the latest statistics values"""
-    if COUNTERS is None:
+    """Attempt to persist the latest statistics values
+
+    Only the counters that changed since the previous call are appended to
+    the counters file, nothing is written when no counter changed.
+    """
+    global COUNTERS_RECORDS
+    if COUNTERS is None or not COUNTERS_CHANGED:
         return
     try:
-        stats = simplejson.dumps(COUNTERS)
-        counters_file = get_counters_file()
-        counters_file.truncate(0)
-        counters_file.write(stats)
-        counters_file.flush()
+        if COUNTERS_RECORDS >= COUNTERS_COMPACT_RECORDS:
+            _compact_counters()
+        else:
+            record = {listener_id: counters
+                      for listener_id, counters in COUNTERS.items()
+                      if listener_id in COUNTERS_CHANGED}
+            counters_file = get_counters_file()
+            counters_file.write(simplejson.dumps(record) + '\n')
+            counters_file.flush()
+            COUNTERS_RECORDS += 1
+        COUNTERS_CHANGED.clear()
     except (OSError, AttributeError):
         LOG.warning("Couldn't persist statistics counter file!")
 
@@ -104,6 +173,21 @@ def list_sock_stat_files(hadir=None):
     return stat_sock_files
 
 
+def get_status_snapshot():
+    """Get the operating status of the HAProxy listeners, pools and members
+
+    :returns: {<lb_id>: ({<listener_id>: <status>}, <pool status>)}
+    """
+    snapshot = {}
+    for lb_id, stat_sock_file in list_sock_stat_files().items():
+        if util.is_lb_running(lb_id):
+            (stats, pool_status) = get_stats(stat_sock_file)
+            listener_status = {row.pxname: row.status for row in stats
+                               if row.svname == 'FRONTEND'}
+            snapshot[lb_id] = (listener_status, pool_status)
+    return snapshot
+
+
 def run_sender(cmd_queue):
     LOG.info('Health Manager Sender starting.')
     sender = health_sender.UDPStatusSender()
@@ -111,36 +195,60 @@ def run_sender(cmd_queue):
     keepalived_cfg_path = util.keepalived_cfg_path()
     keepalived_pid_path = util.keepalived_pid_path()
 
+    next_heartbeat = 0
+    status_snapshot = None
+
     while True:
-        try:
-            # If the keepalived config file is present check
-            # that it is running, otherwise don't send the health
-            # heartbeat
-            if os.path.isfile(keepalived_cfg_path):
-                # Is there a pid file for keepalived?
-                with open(keepalived_pid_path, encoding='utf-8') as pid_file:
-                    pid = int(pid_file.readline())
-                os.kill(pid, 0)
-
-            message = build_stats_message()
-            sender.dosend(message)
-        except OSError as e:
-            if e.errno == errno.ENOENT:
-                # Missing PID file, skip health heartbeat.
-                LOG.error('Missing keepalived PID file %s, skipping health '
-                          'heartbeat.', keepalived_pid_path)
-            elif e.errno == errno.ESRCH:
-                # Keepalived is not running, skip health heartbeat.
-                LOG.error('Keepalived is configured but not running, '
-                          'skipping health heartbeat.')
+        send_heartbeat = time.monotonic() >= next_heartbeat
+        if CONF.health_manager.status_poll_interval:
+            # Send an out of band heartbeat if an operating status changed
+            # since the previous poll.
+            try:
+                new_snapshot = get_status_snapshot()
+            except Exception as e:
+                LOG.warning('Failed to poll the HAProxy operating status due '
+                            'to exception %s.', str(e))
             else:
+                if (status_snapshot is not None and
+                        new_snapshot != status_snapshot):
+                    LOG.debug('Operating status changed, sending a health '
+                              'heartbeat.')
+                    send_heartbeat = True
+                status_snapshot = new_snapshot
+
+        if send_heartbeat:
+            next_heartbeat = (time.monotonic() +
+                              CONF.health_manager.heartbeat_interval)
+            try:
+                # If the keepalived config file is present check
+                # that it is running, otherwise don't send the health
+                # heartbeat
+                if os.path.isfile(keepalived_cfg_path):
+                    # Is there a pid file for keepalived?
+                    with open(keepalived_pid_path,
+                              encoding='utf-8') as pid_file:
+                        pid = int(pid_file.readline())
+                    os.kill(pid, 0)
+
+                message = build_stats_message()
+                sender.dosend(message)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    # Missing PID file, skip health heartbeat.
+                    LOG.error('Missing keepalived PID file %s, skipping '
+                              'health heartbeat.', keepalived_pid_path)
+                elif e.errno == errno.ESRCH:
+                    # Keepalived is not running, skip health heartbeat.
+                    LOG.error('Keepalived is configured but not running, '
+                              'skipping health heartbeat.')
+                else:
+                    LOG.exception('Failed to check keepalived and haproxy '
+                                  'status due to exception %s, skipping '
+                                  'health heartbeat.', str(e))
+            except Exception as e:
                 LOG.exception('Failed to check keepalived and haproxy status '
                               'due to exception %s, skipping health '
                               'heartbeat.', str(e))
-        except Exception as e:
-            LOG.exception('Failed to check keepalived and haproxy status due '
-                          'to exception %s, skipping health heartbeat.',
-                          str(e))
 
         try:
             cmd = cmd_queue.get_nowait()
@@ -152,14 +260,19 @@ def run_sender(cmd_queue):
                 break
         except queue.Empty:
             pass
-        time.sleep(CONF.health_manager.heartbeat_interval)
+
+        sleep_time = max(next_heartbeat - time.monotonic(), 0)
+        if CONF.health_manager.status_poll_interval:
+            sleep_time = min(sleep_time,
+                             CONF.health_manager.status_poll_interval)
+        time.sleep(sleep_time)
 
 
 def get_stats(stat_sock_file):
     try:
         stats_query = haproxy_query.HAProxyQuery(stat_sock_file)
         stats = stats_query.show_stat()
-        pool_status = stats_query.get_pool_status()
+        pool_status = stats_query.get_pool_status(stats)
     except Exception as e:
         LOG.warning('Unable to query the HAProxy stats (%s) due to: %s',
                     stat_sock_file, str(e))
@@ -177,7 +290,11 @@ def calculate_stats_deltas(listener_id, row):
     for metric_key in DELTA_METRICS:
         current_value = int(row[metric_key])
         # Get existing counter for our metrics
-        last_value = listener_counters.get(metric_key, 0)
+        last_value = listener_counters.get(metric_key)
+        if last_value != current_value:
+            COUNTERS_CHANGED.add(listener_id)
+        if last_value is None:
+            last_value = 0
         # Store the new absolute value
         listener_counters[metric_key] = current_value
         # Calculate a delta for each metric
@@ -232,14 +349,15 @@ def build_stats_message():
         if util.is_lb_running(lb_id):
             (stats, pool_status) = get_stats(stat_sock_file)
             for row in stats:
-                if row['svname'] == 'FRONTEND':
-                    listener_id = row['pxname']
-                    delta_values = calculate_stats_deltas(listener_id, row)
+                if row.svname == 'FRONTEND':
+                    listener_id = row.pxname
+                    delta_values = calculate_stats_deltas(listener_id,
+                                                          row._asdict())
                     msg['listeners'][listener_id] = {
-                        'status': row['status'],
+                        'status': row.status,
                         'stats': {'tx': delta_values['bout'],
                                   'rx': delta_values['bin'],
-                                  'conns': int(row['scur']),
+                                  'conns': int(row.scur),
                                   'totconns': delta_values['stot'],
                                   'ereq': delta_values['ereq']}}
             for pool_id, pool in pool_status.items():
@@ -12,16 +12,27 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import socket
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
 
 from octavia.amphorae.backends.health_daemon import status_message
+from octavia.common import constants
+from octavia.common import utils
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# Time, in seconds, a controller is skipped after an error was reported
+# while sending it a heartbeat.
+DEST_FAILURE_BACKOFF = 60
+
+# Statistics reported as deltas in version 3+ heartbeat messages
+DELTA_STATS = ('tx', 'rx', 'totconns', 'ereq')
+
 
 def round_robin_addr(addrinfo_list):
     if not addrinfo_list:
@@ -31,11 +42,42 @@ def round_robin_addr(addrinfo_list):
     return addrinfo
 
 
+def amphora_id_order(addrinfo_list, amphora_id):
+    """Order the controller addresses by rendezvous hashing of an amphora ID
+
+    Each amphora gets a stable order of the controllers, the first one is
+    the controller that absorbs its heartbeats, the next ones are used
+    when it is not available. Adding or removing a controller only moves
+    the amphorae of that controller.
+    """
+    dests = {f'{addrinfo[4][0]}-{addrinfo[4][1]}': addrinfo
+             for addrinfo in addrinfo_list}
+    return [dests[node]
+            for node in utils.rendezvous_hash_order(amphora_id, dests)]
+
+
+def without_stats_deltas(msg):
+    """Get a copy of a heartbeat message with zeroed statistics deltas
+
+    Used for the extra copies of a heartbeat so that the statistics deltas
+    are only accounted once by the controllers.
+    """
+    if msg.get('ver', 0) < 3:
+        return msg
+    msg = copy.deepcopy(msg)
+    for listener in msg.get('listeners', {}).values():
+        for key in DELTA_STATS:
+            if key in listener.get('stats', {}):
+                listener['stats'][key] = 0
+    return msg
+
+
 class UDPStatusSender:
     def __init__(self):
+        self.dests = []
+        self.sockets = {}
+        self.failed_dests = {}
         self._update_dests()
-        self.v4sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.v6sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
 
     def update(self, dest, port):
         addrlist = socket.getaddrinfo(dest, port, 0, socket.SOCK_DGRAM)
@@ -45,28 +87,57 @@ class UDPStatusSender:
             self.dests.append(addr)  # Just grab the first match
             break
 
+    def _get_socket(self, dest):
+        # dest = (family, socktype, proto, canonname, sockaddr)
+        # e.g. 0 = sock family, 4 = sockaddr - what we actually need
+        # The socket is connected so that the ICMP errors received for the
+        # previous heartbeats are reported by send().
+        sock = self.sockets.get(dest[4])
+        if sock is None:
+            sock = socket.socket(dest[0], socket.SOCK_DGRAM)
+            try:
+                sock.connect(dest[4])
+            except OSError:
+                sock.close()
+                raise
+            self.sockets[dest[4]] = sock
+        return sock
+
     def _send_msg(self, dest, msg):
+        """Send a heartbeat message to a controller
+
+        :returns: True if the message was sent, False if an error occurred.
+        """
         # Note: heartbeat_key is mutable and must be looked up for each call
         envelope_str = status_message.wrap_envelope(
             msg, str(CONF.health_manager.heartbeat_key))
-        # dest = (family, socktype, proto, canonname, sockaddr)
-        # e.g. 0 = sock family, 4 = sockaddr - what we actually need
         try:
-            if dest[0] == socket.AF_INET:
-                self.v4sock.sendto(envelope_str, dest[4])
-            elif dest[0] == socket.AF_INET6:
-                self.v6sock.sendto(envelope_str, dest[4])
-        except OSError:
-            # Pass here as on amp boot it will get one or more
+            self._get_socket(dest).send(envelope_str)
+        except OSError as e:
+            # On amp boot it will get one or more
             # error: [Errno 101] Network is unreachable
-            # while the networks are coming up
+            # while the networks are coming up.
+            # A controller that is down is reported by a
+            # [Errno 111] Connection refused, skip it for a while.
             # No harm in trying to send as it will still failover
             # if the message isn't received
-            pass
+            LOG.debug('Failed to send a heartbeat to %s: %s', dest[4], e)
+            self.failed_dests[dest[4]] = (time.monotonic() +
+                                          DEST_FAILURE_BACKOFF)
+            return False
+        self.failed_dests.pop(dest[4], None)
+        return True
+
+    def _close_sockets(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
 
     # The controller_ip_port_list configuration has mutated, reload it.
     def _update_dests(self):
         self.dests = []
+        self.failed_dests = {}
+        self._close_sockets()
         for ipport in CONF.health_manager.controller_ip_port_list:
             try:
                 ip, port = ipport.rsplit(':', 1)
@@ -80,13 +151,37 @@ class UDPStatusSender:
         self.current_controller_ip_port_list = (
             CONF.health_manager.controller_ip_port_list)
 
+    def _get_ordered_dests(self):
+        if (CONF.health_manager.heartbeat_destination_selection ==
+                constants.HEARTBEAT_DEST_AMPHORA_ID):
+            return amphora_id_order(self.dests,
+                                    CONF.amphora_agent.amphora_id)
+        ordered_dests = list(self.dests)
+        round_robin_addr(self.dests)
+        return ordered_dests
+
     def dosend(self, obj):
         # Check for controller_ip_port_list mutation
         if not (self.current_controller_ip_port_list ==
                 CONF.health_manager.controller_ip_port_list):
             self._update_dests()
-        dest = round_robin_addr(self.dests)
-        if dest is None:
+        if not self.dests:
             LOG.error('No controller address found. Unable to send heartbeat.')
             return
-        self._send_msg(dest, obj)
+
+        # Controllers that reported an error are tried last
+        now = time.monotonic()
+        ordered_dests = self._get_ordered_dests()
+        dests = ([dest for dest in ordered_dests
+                  if self.failed_dests.get(dest[4], 0) <= now] +
+                 [dest for dest in ordered_dests
+                  if self.failed_dests.get(dest[4], 0) > now])
+
+        sent = 0
+        for dest in dests:
+            if sent >= CONF.health_manager.heartbeat_destinations:
+                break
+            # Only the first copy of the heartbeat carries the statistics
+            if self._send_msg(dest, obj if sent == 0 else
+                              without_stats_deltas(obj)):
+                sent += 1
@@ -12,7 +12,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import csv
+import collections
 import socket
 
 from oslo_log import log as logging
@@ -23,6 +23,47 @@ from octavia.i18n import _
 
 LOG = logging.getLogger(__name__)
 
+# The 'show stat' columns used by the health daemon. HAProxy reports about
+# 90 columns per row, only these are extracted by parse_stat_csv().
+STAT_FIELDS = ('pxname', 'svname', 'status', 'scur', 'bin', 'bout', 'stot',
+               'ereq', 'weight')
+
+HAProxyStat = collections.namedtuple('HAProxyStat', STAT_FIELDS)
+
+
+def parse_stat_csv(data):
+    """Parse the CSV output of the 'show stat' command.
+
+    The indexes of the STAT_FIELDS columns are resolved once from the
+    header line, then only those columns are extracted from each row.
+    Rows of the internal prometheus proxies are skipped.
+
+    :param data: The 'show stat' output, including the '# ' header line.
+    :returns: A list of HAProxyStat tuples.
+    """
+    if not data:
+        return []
+    lines = data.split('\n')
+    header = lines[0].lstrip('# ').split(',')
+    indexes = [header.index(field) for field in STAT_FIELDS]
+    pxname_index = indexes[0]
+    # Free-text columns (check descriptions, etc.) may contain quoted
+    # commas, they are all located after the columns we need, so don't
+    # split them.
+    max_split = max(indexes) + 1
+
+    stats = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        columns = line.split(',', max_split)
+        # We don't want to report the internal prometheus proxy stats
+        # up to the control plane as it shouldn't be billed traffic
+        if 'prometheus' in columns[pxname_index]:
+            continue
+        stats.append(HAProxyStat._make(columns[i] for i in indexes))
+    return stats
+
 
 class HAProxyQuery:
     """Class used for querying the HAProxy statistics socket.
@@ -68,6 +109,18 @@ class HAProxyQuery:
         finally:
             sock.close()
 
+    def run_command(self, command):
+        """Run a runtime API command.
+
+        The socket must be configured with the 'admin' level for the
+        commands that change the state of HAProxy.
+
+        :param command: The runtime API command, i.e. 'set server ...'
+        :returns: The output of the command, empty for most of the
+                  successful commands.
+        """
+        return self._query(command)
+
     def show_info(self):
         """Get and parse output from 'show info' command."""
         results = self._query('show info')
@@ -90,7 +143,7 @@ class HAProxyQuery:
                             4 - servers
         :param server_id: Server ID (column 28 in CSV output?), or -1
                           for everything.
-        :returns: stats (split into an array by newline)
+        :returns: a list of HAProxyStat tuples
 
         """
 
@@ -99,17 +152,13 @@ class HAProxyQuery:
                 proxy_iid=proxy_iid,
                 object_type=object_type,
                 server_id=server_id))
-        list_results = results[2:].split('\n')
-        csv_reader = csv.DictReader(list_results)
-        stats_list = list(csv_reader)
-        # We don't want to report the internal prometheus proxy stats
-        # up to the control plane as it shouldn't be billed traffic
-        return [stat for stat in stats_list
-                if "prometheus" not in stat['pxname']]
+        return parse_stat_csv(results)
 
-    def get_pool_status(self):
+    def get_pool_status(self, stats=None):
         """Get status for each server and the pool as a whole.
 
+        :param stats: Optional list of HAProxyStat tuples previously returned
+                      by show_stat(), avoids querying HAProxy a second time.
         :returns: pool data structure
                   {<pool-name>: {
                   'uuid': <uuid>,
@@ -117,35 +166,33 @@ class HAProxyQuery:
                   'members': [<name>: 'UP'|'DOWN'|'DRAIN'|'no check'] }}
         """
 
-        results = self.show_stat(object_type=6)  # servers + pool
+        if stats is None:
+            stats = self.show_stat(object_type=6)  # servers + pool
 
         final_results = {}
-        for line in results:
+        for line in stats:
             # pxname: pool, svname: server_name, status: status
-
-            # We don't want to report the internal prometheus proxy stats
-            # up to health manager as it shouldn't be billed traffic
-            if 'prometheus' in line['pxname']:
+            if line.svname == 'FRONTEND':
                 continue
 
-            if line['pxname'] not in final_results:
-                final_results[line['pxname']] = {'members': {}}
+            if line.pxname not in final_results:
+                final_results[line.pxname] = {'members': {}}
 
-            if line['svname'] == 'BACKEND':
+            if line.svname == 'BACKEND':
                 # BACKEND describes a pool of servers in HAProxy
-                pool_id, listener_id = line['pxname'].split(':')
-                final_results[line['pxname']]['pool_uuid'] = pool_id
-                final_results[line['pxname']]['listener_uuid'] = listener_id
-                final_results[line['pxname']]['status'] = line['status']
+                pool_id, listener_id = line.pxname.split(':')
+                final_results[line.pxname]['pool_uuid'] = pool_id
+                final_results[line.pxname]['listener_uuid'] = listener_id
+                final_results[line.pxname]['status'] = line.status
             else:
                 # Due to a bug in some versions of HAProxy, DRAIN mode isn't
                 # calculated correctly, but we can spoof the correct
                 # value here.
-                if line['status'] == consts.UP and line['weight'] == '0':
-                    line['status'] = consts.DRAIN
+                status = line.status
+                if status == consts.UP and line.weight == '0':
+                    status = consts.DRAIN
 
-                final_results[line['pxname']]['members'][line['svname']] = (
-                    line['status'])
+                final_results[line.pxname]['members'][line.svname] = status
         return final_results
 
     def save_state(self, state_file_path):
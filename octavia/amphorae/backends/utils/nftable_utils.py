@@ -11,6 +11,7 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import ipaddress
 import os
 import stat
 import subprocess
@@ -26,68 +27,130 @@ from octavia.common import utils
 LOG = logging.getLogger(__name__)
 
 
+# The L4 protocols of the rules matched with the sets, the key of the set
+# elements is "[source address .] protocol . destination port".
+SET_PROTOCOLS = {
+    lib_consts.PROTOCOL_SCTP: 'sctp',
+    lib_consts.PROTOCOL_TCP: 'tcp',
+    lib_consts.PROTOCOL_UDP: 'udp',
+}
+
+
 def write_nftable_vip_rules_file(interface_name, rules):
+    """Write the nftables batch of the VIP chain.
+
+    The batch creates the table, the chain and the sets if they don't exist,
+    then replaces the content of the chain and of the sets. It is applied
+    atomically by "nft -f", the amphora is not exposed during the update and
+    the other chains of the amphora are not modified.
+
+    The listener rules are matched with lookups in the sets, whatever the
+    number of allowed CIDRs.
+    """
     flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
     # mode 00600
     mode = stat.S_IRUSR | stat.S_IWUSR
 
-    # Create some strings shared on both code paths
-    table_string = f'table {consts.NFT_FAMILY} {consts.NFT_VIP_TABLE} {{\n'
-    chain_string = f'  chain {consts.NFT_VIP_CHAIN} {{\n'
-    hook_string = (f'    type filter hook ingress device {interface_name} '
-                   f'priority {consts.NFT_SRIOV_PRIORITY}; policy drop;\n')
-
-    # Allow ICMP destination unreachable for PMTUD
-    icmp_string = '      icmp type destination-unreachable accept\n'
-    # Allow the required neighbor solicitation/discovery PMTUD ICMPV6
-    icmpv6_string = ('      icmpv6 type { nd-neighbor-solicit, '
-                     'nd-router-advert, nd-neighbor-advert, packet-too-big, '
-                     'destination-unreachable } accept\n')
-    # Allow DHCP responses
-    dhcp_string = '      udp sport 67 udp dport 68 accept\n'
-    dhcpv6_string = '      udp sport 547 udp dport 546 accept\n'
-
     # Check if an existing rules file exists or we be need to create an
     # "drop all" file with no rules except for VRRP. If it exists, we should
     # not overwrite it here as it could be a reboot unless we were passed new
     # rules.
-    if os.path.isfile(consts.NFT_VIP_RULES_FILE):
-        if not rules:
-            return
-        with os.fdopen(
-                os.open(consts.NFT_VIP_RULES_FILE, flags, mode), 'w') as file:
-            # Clear the existing rules in the kernel
-            # Note: The "nft -f" method is atomic, so clearing the rules will
-            #       not leave the amphora exposed.
-            # Create and delete the table to not get errors if the table does
-            # not exist yet.
-            file.write(f'table {consts.NFT_FAMILY} {consts.NFT_VIP_TABLE} '
-                       '{}\n')
-            file.write(f'delete table {consts.NFT_FAMILY} '
-                       f'{consts.NFT_VIP_TABLE}\n')
-            file.write(table_string)
-            file.write(chain_string)
-            file.write(hook_string)
-            file.write(icmp_string)
-            file.write(icmpv6_string)
-            file.write(dhcp_string)
-            file.write(dhcpv6_string)
-            for rule in rules:
-                file.write(f'      {_build_rule_cmd(rule)}\n')
-            file.write('  }\n')  # close the chain
-            file.write('}\n')  # close the table
-    else:  # No existing rules, create the "drop all" base rules
-        with os.fdopen(
-                os.open(consts.NFT_VIP_RULES_FILE, flags, mode), 'w') as file:
-            file.write(table_string)
-            file.write(chain_string)
-            file.write(hook_string)
-            file.write(icmp_string)
-            file.write(icmpv6_string)
-            file.write(dhcp_string)
-            file.write(dhcpv6_string)
-            file.write('  }\n')  # close the chain
-            file.write('}\n')  # close the table
+    if os.path.isfile(consts.NFT_VIP_RULES_FILE) and not rules:
+        return
+
+    ports, ipv4_elements, ipv6_elements, rule_cmds = _build_set_elements(
+        rules)
+    table = f'{consts.NFT_FAMILY} {consts.NFT_VIP_TABLE}'
+    lines = [
+        # Declare the table, the chain and the sets, they are created if
+        # they don't exist yet.
+        f'table {table} {{\n',
+        f'  chain {consts.NFT_VIP_CHAIN} {{\n',
+        f'    type filter hook ingress device {interface_name} '
+        f'priority {consts.NFT_SRIOV_PRIORITY}; policy drop;\n',
+        '  }\n',
+        f'  set {consts.NFT_VIP_PORTS_SET} {{\n',
+        '    type inet_proto . inet_service;\n',
+        '  }\n',
+        f'  set {consts.NFT_VIP_IPV4_SET} {{\n',
+        '    type ipv4_addr . inet_proto . inet_service; flags interval;\n',
+        '  }\n',
+        f'  set {consts.NFT_VIP_IPV6_SET} {{\n',
+        '    type ipv6_addr . inet_proto . inet_service; flags interval;\n',
+        '  }\n',
+        '}\n',
+        f'flush chain {table} {consts.NFT_VIP_CHAIN}\n',
+        f'flush set {table} {consts.NFT_VIP_PORTS_SET}\n',
+        f'flush set {table} {consts.NFT_VIP_IPV4_SET}\n',
+        f'flush set {table} {consts.NFT_VIP_IPV6_SET}\n',
+        f'table {table} {{\n',
+        f'  chain {consts.NFT_VIP_CHAIN} {{\n',
+        # Allow ICMP destination unreachable for PMTUD
+        '    icmp type destination-unreachable accept\n',
+        # Allow the required neighbor solicitation/discovery PMTUD ICMPV6
+        '    icmpv6 type { nd-neighbor-solicit, nd-router-advert, '
+        'nd-neighbor-advert, packet-too-big, destination-unreachable } '
+        'accept\n',
+        # Allow DHCP responses
+        '    udp sport 67 udp dport 68 accept\n',
+        '    udp sport 547 udp dport 546 accept\n',
+        '    meta l4proto . th dport '
+        f'@{consts.NFT_VIP_PORTS_SET} accept\n',
+        '    ip saddr . meta l4proto . th dport '
+        f'@{consts.NFT_VIP_IPV4_SET} accept\n',
+        '    ip6 saddr . meta l4proto . th dport '
+        f'@{consts.NFT_VIP_IPV6_SET} accept\n']
+    lines.extend(f'    {rule_cmd}\n' for rule_cmd in rule_cmds)
+    lines.append('  }\n')  # close the chain
+    lines.append('}\n')  # close the table
+    for set_name, elements in ((consts.NFT_VIP_PORTS_SET, ports),
+                               (consts.NFT_VIP_IPV4_SET, ipv4_elements),
+                               (consts.NFT_VIP_IPV6_SET, ipv6_elements)):
+        if elements:
+            lines.append(f'add element {table} {set_name} {{\n')
+            lines.append(',\n'.join(f'  {element}' for element in elements))
+            lines.append('\n}\n')
+
+    with os.fdopen(
+            os.open(consts.NFT_VIP_RULES_FILE, flags, mode), 'w') as file:
+        for line in lines:
+            file.write(line)
+
+
+def _build_set_elements(rules):
+    """Get the set elements of the rules.
+
+    :returns: A tuple of the elements of the port, IPv4 and IPv6 sets, and
+              of the rules that are not matched with the sets.
+    """
+    ports = set()
+    networks = {4: {}, 6: {}}
+    rule_cmds = []
+    for rule in rules:
+        protocol = SET_PROTOCOLS.get(rule[consts.PROTOCOL])
+        if protocol is None:
+            # VRRP rules and invalid protocols
+            rule_cmds.append(_build_rule_cmd(rule))
+            continue
+        key = f'{protocol} . {rule[consts.PORT]}'
+        if not rule[consts.CIDR] or rule[consts.CIDR] == '0.0.0.0/0':
+            ports.add(key)
+            continue
+        try:
+            network = ipaddress.ip_network(rule[consts.CIDR], strict=False)
+        except ValueError as e:
+            raise exc.HTTPBadRequest(explanation='Unknown ip version') from e
+        networks[network.version].setdefault(key, []).append(network)
+
+    # The CIDRs of a port are collapsed, the elements of the interval sets
+    # must not overlap.
+    ip_elements = {
+        version: sorted(
+            f'{network} . {key}'
+            for key, key_networks in version_networks.items()
+            for network in ipaddress.collapse_addresses(key_networks))
+        for version, version_networks in networks.items()}
+    return sorted(ports), ip_elements[4], ip_elements[6], rule_cmds
 
 
 def _build_rule_cmd(rule):
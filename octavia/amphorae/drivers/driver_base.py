@@ -53,6 +53,19 @@ class AmphoraLoadBalancerDriver(metaclass=abc.ABCMeta):
         add more function along with the development.
         """
 
+    def update_members(self, loadbalancer):
+        """Update the amphora with a new configuration of the members.
+
+        :param loadbalancer: loadbalancer object
+        :type loadbalancer: octavia.db.models.LoadBalancer
+        :returns: None
+
+        This method is optional to implement. Only the members of the load
+        balancer were updated, a driver may apply them without reloading the
+        listeners. It defaults to a full update.
+        """
+        self.update(loadbalancer)
+
     @abc.abstractmethod
     def start(self, loadbalancer, amphora, timeout_dict=None):
         """Start the listeners on the amphora.
@@ -138,6 +151,17 @@ class AmphoraLoadBalancerDriver(metaclass=abc.ABCMeta):
         than the health gathering.
         """
 
+    def close_connections(self, amphora_id):
+        """Close the connections to a deleted amphora.
+
+        :param amphora_id: The id of the amphora.
+        :type amphora_id: str
+        :returns: None
+
+        This method is optional to implement, it releases the resources
+        kept by the driver for the amphora.
+        """
+
     @abc.abstractmethod
     def finalize_amphora(self, amphora):
         """Finalize the amphora before any listeners are configured.
@@ -12,16 +12,24 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import base64
+import collections
+from concurrent import futures
 import functools
+import gzip
 import hashlib
+import math
 import os
+import random
 import ssl
+import threading
 import time
 from typing import Optional
 import warnings
 
 from oslo_context import context as oslo_context
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils.secretutils import md5
 import requests
 import simplejson
@@ -31,6 +39,7 @@ from octavia.amphorae.driver_exceptions import exceptions as driver_except
 from octavia.amphorae.drivers import driver_base
 from octavia.amphorae.drivers.haproxy import exceptions as exc
 from octavia.amphorae.drivers.keepalived import vrrp_rest_driver
+from octavia.certificates.manager import cert_mgr
 from octavia.common.config import cfg
 from octavia.common import constants as consts
 import octavia.common.jinja.haproxy.combined_listeners.jinja_cfg as jinja_combo
@@ -45,6 +54,25 @@ from octavia.db import repositories as repo
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+# The interval of the checks of the first heartbeat of a booting amphora
+# while waiting to retry a connection, in seconds.
+READY_CHECK_INTERVAL = 1
+
+# The request bodies are compressed from this size, in bytes
+COMPRESS_MIN_SIZE = 65536
+COMPRESS_LEVEL = 6
+
+
+# The compressed request bodies keyed by the digest of their content, the
+# same configuration is uploaded to each amphora of a load balancer
+GZIP_CACHE = jinja_combo.RenderCache(size=8)
+
+
+def _gzip(body):
+    return GZIP_CACHE.get(
+        hashlib.sha256(body).digest(),
+        functools.partial(gzip.compress, body, compresslevel=COMPRESS_LEVEL))
+
 
 class HaproxyAmphoraLoadBalancerDriver(
     driver_base.AmphoraLoadBalancerDriver,
@@ -56,11 +84,12 @@ class HaproxyAmphoraLoadBalancerDriver(
             'base': AmphoraAPIClientBase(),
             '1.0': AmphoraAPIClient1_0(),
         }
-        self.cert_manager = stevedore_driver.DriverManager(
-            namespace='octavia.cert_manager',
-            name=CONF.certificates.cert_manager,
-            invoke_on_load=True,
-        ).driver
+        self.cert_manager = cert_mgr.CachedCertManager(
+            stevedore_driver.DriverManager(
+                namespace='octavia.cert_manager',
+                name=CONF.certificates.cert_manager,
+                invoke_on_load=True,
+            ).driver)
 
         self.jinja_combo = jinja_combo.JinjaTemplater(
             base_amp_path=CONF.haproxy_amphora.base_path,
@@ -68,6 +97,21 @@ class HaproxyAmphoraLoadBalancerDriver(
             haproxy_template=CONF.haproxy_amphora.haproxy_template,
             connection_logging=CONF.haproxy_amphora.connection_logging)
         self.lvs_jinja = jinja_udp_cfg.LvsJinjaTemplater()
+        self.amphora_repo = repo.AmphoraRepository()
+
+    def _save_amphora_versions(self, amphora, **versions):
+        """Store the versions discovered on an amphora in the database.
+
+        The versions are also set on the amphora object. The next updates of
+        the amphora reuse them instead of querying the amphora again.
+        """
+        versions = {name: version for name, version in versions.items()
+                    if version and getattr(amphora, name, None) != version}
+        if versions:
+            with db_api.session().begin() as session:
+                self.amphora_repo.update(session, amphora.id, **versions)
+            for name, version in versions.items():
+                setattr(amphora, name, version)
 
     def _get_haproxy_versions(self, amphora, timeout_dict=None):
         """Get major and minor version number from haproxy
@@ -76,11 +120,15 @@ class HaproxyAmphoraLoadBalancerDriver(
 
         :returns version_list: A list with the major and minor numbers
         """
-        self._populate_amphora_api_version(
-            amphora, timeout_dict=timeout_dict)
-        amp_info = self.clients[amphora.api_version].get_info(
-            amphora, timeout_dict=timeout_dict)
-        haproxy_version_string = amp_info['haproxy_version']
+        haproxy_version_string = getattr(amphora, 'haproxy_version', None)
+        if not haproxy_version_string:
+            self._populate_amphora_api_version(
+                amphora, timeout_dict=timeout_dict)
+            amp_info = self.clients[amphora.api_version].get_info(
+                amphora, timeout_dict=timeout_dict)
+            haproxy_version_string = amp_info['haproxy_version']
+            self._save_amphora_versions(
+                amphora, haproxy_version=haproxy_version_string)
 
         return haproxy_version_string.split('.')[:2]
 
@@ -95,12 +143,13 @@ class HaproxyAmphoraLoadBalancerDriver(
         """
         if not getattr(amphora, 'api_version', None):
             try:
-                amphora.api_version = self.clients['base'].get_api_version(
+                api_version = self.clients['base'].get_api_version(
                     amphora, timeout_dict=timeout_dict,
                     raise_retry_exception=raise_retry_exception)['api_version']
             except exc.NotFound:
                 # Amphora is too old for version discovery, default to 0.5
-                amphora.api_version = '0.5'
+                api_version = '0.5'
+            self._save_amphora_versions(amphora, api_version=api_version)
         LOG.debug('Amphora %s has API version %s',
                   amphora.id, amphora.api_version)
         api_version = list(map(int, amphora.api_version.split('.')))
@@ -117,7 +166,7 @@ class HaproxyAmphoraLoadBalancerDriver(
         self._populate_amphora_api_version(amphora, timeout_dict)
 
     def update_amphora_listeners(self, loadbalancer, amphora,
-                                 timeout_dict=None):
+                                 timeout_dict=None, members_only=False):
         """Update the amphora with a new configuration.
 
         :param loadbalancer: The load balancer to update
@@ -128,6 +177,9 @@ class HaproxyAmphoraLoadBalancerDriver(
                              amphora. May contain: req_conn_timeout,
                              req_read_timeout, conn_max_retries,
                              conn_retry_interval
+        :param members_only: Only the members of the load balancer were
+                             updated, the amphora tries to apply them
+                             without reloading HAProxy.
         :returns: None
 
         Updates the configuration of the listeners on a single amphora.
@@ -147,50 +199,48 @@ class HaproxyAmphoraLoadBalancerDriver(
 
         has_tcp = False
         certs = {}
+        bundle = {}
         listeners_to_update = []
-        for listener in loadbalancer.listeners:
-            LOG.debug("%s updating listener %s on amphora %s",
-                      self.__class__.__name__, listener.id, amphora.id)
-            if listener.protocol in consts.LVS_PROTOCOLS:
-                # Generate Keepalived LVS configuration from listener object
-                config = self.lvs_jinja.build_config(listener=listener)
-                self.clients[amphora.api_version].upload_udp_config(
-                    amphora, listener.id, config, timeout_dict=timeout_dict)
-                self.clients[amphora.api_version].reload_listener(
-                    amphora, listener.id, timeout_dict=timeout_dict)
-            else:
-                has_tcp = True
-                obj_id = loadbalancer.id
-
-                try:
-                    certs.update({
-                        listener.tls_certificate_id:
-                        self._process_tls_certificates(
-                            listener, amphora, obj_id)['tls_cert']})
-                    certs.update({listener.client_ca_tls_certificate_id:
-                                  self._process_secret(
-                                      listener,
-                                      listener.client_ca_tls_certificate_id,
-                                      amphora, obj_id)})
-                    certs.update({listener.client_crl_container_id:
-                                  self._process_secret(
-                                      listener,
-                                      listener.client_crl_container_id,
-                                      amphora, obj_id)})
-
-                    certs.update(self._process_listener_pool_certs(
-                        listener, amphora, obj_id))
-
-                    listeners_to_update.append(listener)
-                except Exception as e:
-                    LOG.exception('Unable to update listener %s due to '
-                                  '"%s". Skipping this listener.',
-                                  listener.id, str(e))
-                    listener_repo = repo.ListenerRepository()
-                    with db_api.session().begin() as session:
-                        listener_repo.update(session, listener.id,
-                                             provisioning_status=consts.ERROR,
-                                             operating_status=consts.ERROR)
+        tcp_listeners = [listener for listener in loadbalancer.listeners
+                         if listener.protocol not in consts.LVS_PROTOCOLS]
+        max_workers = max(1, min(len(tcp_listeners),
+                                 CONF.haproxy_amphora.certificate_threads))
+        # The certificates of the listeners are processed concurrently, the
+        # cert manager cache loads each reference once. The executor waits
+        # for its tasks, they don't update the bundle after this block.
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            listener_certs = {
+                listener.id: executor.submit(
+                    self._process_listener_certs, listener, amphora,
+                    loadbalancer.id, bundle=bundle)
+                for listener in tcp_listeners}
+            for listener in loadbalancer.listeners:
+                LOG.debug("%s updating listener %s on amphora %s",
+                          self.__class__.__name__, listener.id, amphora.id)
+                if listener.protocol in consts.LVS_PROTOCOLS:
+                    # Generate Keepalived LVS configuration from listener
+                    # object
+                    config = self.lvs_jinja.build_config(listener=listener)
+                    self.clients[amphora.api_version].upload_udp_config(
+                        amphora, listener.id, config,
+                        timeout_dict=timeout_dict)
+                    self.clients[amphora.api_version].reload_listener(
+                        amphora, listener.id, timeout_dict=timeout_dict)
+                else:
+                    has_tcp = True
+                    try:
+                        certs.update(listener_certs[listener.id].result())
+                        listeners_to_update.append(listener)
+                    except Exception as e:
+                        LOG.exception('Unable to update listener %s due to '
+                                      '"%s". Skipping this listener.',
+                                      listener.id, str(e))
+                        listener_repo = repo.ListenerRepository()
+                        with db_api.session().begin() as session:
+                            listener_repo.update(
+                                session, listener.id,
+                                provisioning_status=consts.ERROR,
+                                operating_status=consts.ERROR)
 
         if has_tcp:
             if listeners_to_update:
@@ -202,11 +252,16 @@ class HaproxyAmphoraLoadBalancerDriver(
                     tls_certs=certs,
                     haproxy_versions=haproxy_versions,
                     amp_details=amp_details)
-                self.clients[amphora.api_version].upload_config(
-                    amphora, loadbalancer.id, config,
-                    timeout_dict=timeout_dict)
-                self.clients[amphora.api_version].reload_listener(
-                    amphora, loadbalancer.id, timeout_dict=timeout_dict)
+                if members_only:
+                    self._upload_bundle(amphora, loadbalancer.id, bundle,
+                                        timeout_dict=timeout_dict)
+                    if self._update_members(amphora, loadbalancer.id, config,
+                                            timeout_dict=timeout_dict):
+                        return
+                    bundle = {}
+                self._upload_bundle(amphora, loadbalancer.id, bundle,
+                                    config=config, reload=True,
+                                    timeout_dict=timeout_dict)
             else:
                 # If we aren't updating any listeners, make sure there are
                 # no listeners hanging around. For example if this update
@@ -214,6 +269,79 @@ class HaproxyAmphoraLoadBalancerDriver(
                 self.clients[amphora.api_version].delete_listener(
                     amphora, loadbalancer.id)
 
+    def _upload_bundle(self, amphora, loadbalancer_id, certificates,
+                       config=None, reload=False, timeout_dict=None):
+        """Upload certificates and a configuration in a single request.
+
+        The content of a certificate is only sent if it is not in the
+        certificate manifest of the amphora, or if the amphora reports it as
+        missing. The per file APIs are used with the amphora agents that do
+        not support the bundles.
+
+        :param certificates: The certificate contents keyed by file name.
+        :param config: The haproxy configuration, if any.
+        :param reload: Reload the load balancer after the upload.
+        """
+        if not (certificates or config is not None or reload):
+            return
+        client = self.clients[amphora.api_version]
+        md5sums = {
+            name: md5(pem, usedforsecurity=False).hexdigest()  # nosec
+            for name, pem in certificates.items()}
+        deployed = client.get_cert_manifest(amphora, loadbalancer_id)
+        try:
+            missing = client.upload_bundle(
+                amphora, loadbalancer_id, md5sums,
+                contents={md5sums[name]: pem
+                          for name, pem in certificates.items()
+                          if deployed.get(name) != md5sums[name]},
+                config=config, reload=reload, timeout_dict=timeout_dict)
+            if missing:
+                contents = {md5sums[name]: pem
+                            for name, pem in certificates.items()
+                            if md5sums[name] in missing}
+                if client.upload_bundle(
+                        amphora, loadbalancer_id, md5sums, contents=contents,
+                        config=config, reload=reload,
+                        timeout_dict=timeout_dict):
+                    raise exc.Conflict()
+            return
+        except exc.NotFound:
+            LOG.debug('Amphora %s does not support the upload_bundle API.',
+                      amphora.id)
+
+        for name, pem in certificates.items():
+            self._upload_cert(amphora, loadbalancer_id, pem,
+                              md5sums[name], name)
+        if config is not None:
+            client.upload_config(amphora, loadbalancer_id, config,
+                                 timeout_dict=timeout_dict)
+        if reload:
+            client.reload_listener(amphora, loadbalancer_id,
+                                   timeout_dict=timeout_dict)
+
+    def _update_members(self, amphora, loadbalancer_id, config,
+                        timeout_dict=None):
+        """Apply the member changes of a configuration without a reload.
+
+        :returns: True if the amphora applied the changes with the HAProxy
+                  runtime API, False if the configuration must be uploaded
+                  and reloaded.
+        """
+        try:
+            if self.clients[amphora.api_version].update_members(
+                    amphora, loadbalancer_id, config,
+                    timeout_dict=timeout_dict):
+                return True
+        except exc.NotFound:
+            LOG.debug('Amphora %s does not support the update_members API.',
+                      amphora.id)
+            return False
+        LOG.debug('Amphora %s cannot apply the member changes of load '
+                  'balancer %s at runtime, reloading it.', amphora.id,
+                  loadbalancer_id)
+        return False
+
     def _udp_update(self, listener, vip):
         LOG.debug("Amphora %s keepalivedlvs, updating "
                   "listener %s, vip %s",
@@ -230,10 +358,46 @@ class HaproxyAmphoraLoadBalancerDriver(
                 self.clients[amp.api_version].reload_listener(
                     amp, listener.id)
 
+    def _run_on_amphorae(self, amphorae, func, *args, **kwargs):
+        """Call a function for each amphora concurrently.
+
+        The calls of all the amphorae complete before returning, the
+        failures are logged with their amphora and the first one is raised.
+
+        :param amphorae: The amphorae, the DELETED ones are skipped.
+        :param func: The function, called with an amphora, args and kwargs.
+        """
+        amphorae = [amp for amp in amphorae if amp.status != consts.DELETED]
+        if len(amphorae) <= 1:
+            for amp in amphorae:
+                func(amp, *args, **kwargs)
+            return
+
+        max_workers = min(len(amphorae),
+                          CONF.haproxy_amphora.amphora_update_threads)
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futs = [executor.submit(func, amp, *args, **kwargs)
+                    for amp in amphorae]
+        errors = []
+        for amp, fut in zip(amphorae, futs):
+            try:
+                fut.result()
+            except Exception as e:
+                LOG.error('Failed to update amphora %s: %s', amp.id, e)
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
     def update(self, loadbalancer):
-        for amphora in loadbalancer.amphorae:
-            if amphora.status != consts.DELETED:
-                self.update_amphora_listeners(loadbalancer, amphora)
+        self._run_on_amphorae(
+            loadbalancer.amphorae,
+            functools.partial(self.update_amphora_listeners, loadbalancer))
+
+    def update_members(self, loadbalancer):
+        self._run_on_amphorae(
+            loadbalancer.amphorae,
+            functools.partial(self.update_amphora_listeners, loadbalancer),
+            members_only=True)
 
     def upload_cert_amp(self, amp, pem):
         LOG.debug("Amphora %s updating cert in REST driver "
@@ -248,20 +412,20 @@ class HaproxyAmphoraLoadBalancerDriver(
         else:
             amphorae = [amphora]
 
-        for amp in amphorae:
-            if amp.status != consts.DELETED:
-                self._populate_amphora_api_version(
-                    amp, timeout_dict=args[0])
-                has_tcp = False
-                for listener in loadbalancer.listeners:
-                    if listener.protocol in consts.LVS_PROTOCOLS:
-                        getattr(self.clients[amp.api_version], func_name)(
-                            amp, listener.id, *args)
-                    else:
-                        has_tcp = True
-                if has_tcp:
+        def apply(amp):
+            self._populate_amphora_api_version(amp, timeout_dict=args[0])
+            has_tcp = False
+            for listener in loadbalancer.listeners:
+                if listener.protocol in consts.LVS_PROTOCOLS:
                     getattr(self.clients[amp.api_version], func_name)(
-                        amp, loadbalancer.id, *args)
+                        amp, listener.id, *args)
+                else:
+                    has_tcp = True
+            if has_tcp:
+                getattr(self.clients[amp.api_version], func_name)(
+                    amp, loadbalancer.id, *args)
+
+        self._run_on_amphorae(amphorae, apply)
 
     def reload(self, loadbalancer, amphora=None, timeout_dict=None):
         self._apply('reload_listener', loadbalancer, amphora, timeout_dict)
@@ -330,13 +494,22 @@ class HaproxyAmphoraLoadBalancerDriver(
         self._populate_amphora_api_version(
             amphora, raise_retry_exception=raise_retry_exception,
             timeout_dict=timeout_dict)
-        return self.clients[amphora.api_version].get_info(
+        amp_info = self.clients[amphora.api_version].get_info(
             amphora, raise_retry_exception=raise_retry_exception,
             timeout_dict=timeout_dict)
+        if amp_info:
+            # Refresh the versions stored for the amphora
+            self._save_amphora_versions(
+                amphora, api_version=amp_info.get('api_version'),
+                haproxy_version=amp_info.get('haproxy_version'))
+        return amp_info
 
     def get_diagnostics(self, amphora):
         pass
 
+    def close_connections(self, amphora_id):
+        SESSION_POOL.close(amphora_id)
+
     def finalize_amphora(self, amphora):
         pass
 
@@ -425,10 +598,36 @@ class HaproxyAmphoraLoadBalancerDriver(
                         'skipping post_network_plug',
                         {'mac': port.mac_address})
 
-    def _process_tls_certificates(self, listener, amphora=None, obj_id=None):
+    def _process_listener_certs(self, listener, amphora, obj_id,
+                                bundle=None):
+        """Process the certificates and secrets of a listener and its pools.
+
+        :returns: The certificates of the listener keyed by reference, and
+                  the certificates of its pools keyed by pool id.
+        """
+        certs = {}
+        certs.update({
+            listener.tls_certificate_id:
+            self._process_tls_certificates(
+                listener, amphora, obj_id, bundle=bundle)['tls_cert']})
+        certs.update({listener.client_ca_tls_certificate_id:
+                      self._process_secret(
+                          listener, listener.client_ca_tls_certificate_id,
+                          amphora, obj_id, bundle=bundle)})
+        certs.update({listener.client_crl_container_id:
+                      self._process_secret(
+                          listener, listener.client_crl_container_id,
+                          amphora, obj_id, bundle=bundle)})
+        certs.update(self._process_listener_pool_certs(
+            listener, amphora, obj_id, bundle=bundle))
+        return certs
+
+    def _process_tls_certificates(self, listener, amphora=None, obj_id=None,
+                                  bundle=None):
         """Processes TLS data from the listener.
 
-        Converts and uploads PEM data to the Amphora API
+        Converts and uploads PEM data to the Amphora API, or adds it to the
+        bundle if one is given.
 
         return TLS_CERT and SNI_CERTS
         """
@@ -455,7 +654,8 @@ class HaproxyAmphoraLoadBalancerDriver(
                 cert_filename_list.append(
                     os.path.join(
                         CONF.haproxy_amphora.base_cert_dir, obj_id, name))
-                self._upload_cert(amphora, obj_id, pem, md5sum, name)
+                self._upload_cert(amphora, obj_id, pem, md5sum, name,
+                                  bundle=bundle)
 
             if certs:
                 # Build and upload the crt-list file for haproxy
@@ -464,10 +664,12 @@ class HaproxyAmphoraLoadBalancerDriver(
                 md5sum = md5(crt_list,
                              usedforsecurity=False).hexdigest()  # nosec
                 name = f'{listener.id}.pem'
-                self._upload_cert(amphora, obj_id, crt_list, md5sum, name)
+                self._upload_cert(amphora, obj_id, crt_list, md5sum, name,
+                                  bundle=bundle)
         return {'tls_cert': tls_cert, 'sni_certs': sni_certs}
 
-    def _process_secret(self, listener, secret_ref, amphora=None, obj_id=None):
+    def _process_secret(self, listener, secret_ref, amphora=None, obj_id=None,
+                        bundle=None):
         """Get the secret from the cert manager and upload it to the amp.
 
         :returns: The filename of the secret in the amp.
@@ -486,10 +688,12 @@ class HaproxyAmphoraLoadBalancerDriver(
 
         if amphora and obj_id:
             self._upload_cert(
-                amphora, obj_id, pem=secret, md5sum=md5sum, name=name)
+                amphora, obj_id, pem=secret, md5sum=md5sum, name=name,
+                bundle=bundle)
         return name
 
-    def _process_listener_pool_certs(self, listener, amphora, obj_id):
+    def _process_listener_pool_certs(self, listener, amphora, obj_id,
+                                     bundle=None):
         #     {'POOL-ID': {
         #         'client_cert': client_full_filename,
         #         'ca_cert': ca_cert_full_filename,
@@ -498,16 +702,17 @@ class HaproxyAmphoraLoadBalancerDriver(
         for pool in listener.pools:
             if pool.id not in pool_certs_dict:
                 pool_certs_dict[pool.id] = self._process_pool_certs(
-                    listener, pool, amphora, obj_id)
+                    listener, pool, amphora, obj_id, bundle=bundle)
         for l7policy in listener.l7policies:
             if (l7policy.redirect_pool and
                     l7policy.redirect_pool.id not in pool_certs_dict):
                 pool_certs_dict[l7policy.redirect_pool.id] = (
                     self._process_pool_certs(listener, l7policy.redirect_pool,
-                                             amphora, obj_id))
+                                             amphora, obj_id, bundle=bundle))
         return pool_certs_dict
 
-    def _process_pool_certs(self, listener, pool, amphora, obj_id):
+    def _process_pool_certs(self, listener, pool, amphora, obj_id,
+                            bundle=None):
         pool_cert_dict = {}
 
         # Handle the client cert(s) and key
@@ -523,32 +728,41 @@ class HaproxyAmphoraLoadBalancerDriver(
             name = f'{tls_cert.id}.pem'
             if amphora and obj_id:
                 self._upload_cert(amphora, obj_id, pem=pem,
-                                  md5sum=md5sum, name=name)
+                                  md5sum=md5sum, name=name, bundle=bundle)
             pool_cert_dict['client_cert'] = os.path.join(
                 CONF.haproxy_amphora.base_cert_dir, obj_id, name)
         if pool.ca_tls_certificate_id:
             name = self._process_secret(listener, pool.ca_tls_certificate_id,
-                                        amphora, obj_id)
+                                        amphora, obj_id, bundle=bundle)
             pool_cert_dict['ca_cert'] = os.path.join(
                 CONF.haproxy_amphora.base_cert_dir, obj_id, name)
         if pool.crl_container_id:
             name = self._process_secret(listener, pool.crl_container_id,
-                                        amphora, obj_id)
+                                        amphora, obj_id, bundle=bundle)
             pool_cert_dict['crl'] = os.path.join(
                 CONF.haproxy_amphora.base_cert_dir, obj_id, name)
 
         return pool_cert_dict
 
-    def _upload_cert(self, amp, listener_id, pem, md5sum, name):
+    def _upload_cert(self, amp, listener_id, pem, md5sum, name,
+                     bundle=None):
+        if bundle is not None:
+            # The certificate is uploaded with the configuration
+            bundle[name] = pem
+            return
+        client = self.clients[amp.api_version]
+        # The certificate manifest is not trusted here, the certificate could
+        # have been deleted by another controller process, and the amphora
+        # would not report it as missing before the configuration is loaded.
         try:
-            if self.clients[amp.api_version].get_cert_md5sum(
+            if client.get_cert_md5sum(
                     amp, listener_id, name, ignore=(404,)) == md5sum:
                 return
         except exc.NotFound:
             pass
 
-        self.clients[amp.api_version].upload_cert_pem(
-            amp, listener_id, name, pem)
+        client.upload_cert_pem(amp, listener_id, name, pem)
+        client.get_cert_manifest(amp, listener_id)[name] = md5sum
 
     def update_amphora_agent_config(self, amphora, agent_config,
                                     timeout_dict=None):
@@ -575,6 +789,7 @@ class HaproxyAmphoraLoadBalancerDriver(
             LOG.debug('Amphora %s does not support the update_agent_config '
                       'API.', amphora.id)
             raise driver_except.AmpDriverNotImplementedError() from e
+        self.get_info(amphora, timeout_dict=timeout_dict)
 
     def get_interface_from_ip(self, amphora, ip_address, timeout_dict=None):
         """Get the interface name for an IP address.
@@ -629,9 +844,73 @@ class CustomHostNameCheckingAdapter(requests.adapters.HTTPAdapter):
         return super().init_poolmanager(*pool_args, **pool_kwargs)
 
 
+class AmphoraSession(requests.Session):
+    """A session to an amphora, its connections are kept alive."""
+
+    def __init__(self, amphora_id):
+        super().__init__()
+        self.cert = CONF.haproxy_amphora.client_cert
+        # The adapter is dedicated to the amphora, the hostname of its
+        # certificate is checked for each new connection.
+        adapter = CustomHostNameCheckingAdapter(
+            pool_connections=1,
+            pool_maxsize=CONF.haproxy_amphora.connection_pool_maxsize)
+        adapter.uuid = amphora_id
+        self.mount('https://', adapter)
+        # The last info of the amphora and its ETag
+        self.info = None
+        # The md5sums of the certificates known to be on the amphora, keyed
+        # by load balancer and file name.
+        self.certificates = collections.defaultdict(dict)
+        # The consecutive connection failures, for the retry backoff
+        self.connection_failures = 0
+        # The content encodings of the request bodies supported by the agent
+        self.content_encodings = []
+        # False if the agent does not support the bundle uploads
+        self.bundles = True
+
+
+class AmphoraSessionPool:
+    """The sessions to the amphorae, shared by the clients of a process.
+
+    The sessions of the least recently used amphorae are closed when there
+    are more than connection_pool_size sessions.
+    """
+
+    def __init__(self):
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, amphora_id):
+        evicted = None
+        with self._lock:
+            session = self._sessions.get(amphora_id)
+            if session is None:
+                session = AmphoraSession(amphora_id)
+                self._sessions[amphora_id] = session
+            else:
+                self._sessions.move_to_end(amphora_id)
+            if (len(self._sessions) >
+                    CONF.haproxy_amphora.connection_pool_size):
+                evicted = self._sessions.popitem(last=False)[1]
+        if evicted is not None:
+            evicted.close()
+        return session
+
+    def close(self, amphora_id):
+        with self._lock:
+            session = self._sessions.pop(amphora_id, None)
+        if session is not None:
+            session.close()
+
+
+SESSION_POOL = AmphoraSessionPool()
+
+
 class AmphoraAPIClientBase:
     def __init__(self):
         super().__init__()
+        self.amphora_health_repo = repo.AmphoraHealthRepository()
 
         self.get = functools.partial(self.request, 'get')
         self.post = functools.partial(self.request, 'post')
@@ -639,11 +918,6 @@ class AmphoraAPIClientBase:
         self.delete = functools.partial(self.request, 'delete')
         self.head = functools.partial(self.request, 'head')
 
-        self.session = requests.Session()
-        self.session.cert = CONF.haproxy_amphora.client_cert
-        self.ssl_adapter = CustomHostNameCheckingAdapter()
-        self.session.mount('https://', self.ssl_adapter)
-
     def _base_url(self, ip, api_version=None):
         if utils.is_ipv6_lla(ip):
             ip = '[{ip}%{interface}]'.format(
@@ -677,7 +951,8 @@ class AmphoraAPIClientBase:
             consts.CONN_RETRY_INTERVAL, cfg_ha_amp.connection_retry_interval)
 
         LOG.debug("request url %s", path)
-        _request = getattr(self.session, method.lower())
+        session = SESSION_POOL.get(amp.id)
+        _request = getattr(session, method.lower())
         _url = self._base_url(amp.lb_network_ip, amp.api_version) + path
         LOG.debug("request url %s", _url)
         reqargs = {
@@ -690,10 +965,13 @@ class AmphoraAPIClientBase:
         headers['User-Agent'] = (
             f"Octavia HaProxy Rest Client/{amp.api_version} "
             f"(https://wiki.openstack.org/wiki/Octavia)")
-        self.ssl_adapter.uuid = amp.id
         exception = None
-        # Keep retrying
-        for dummy in range(conn_max_retries):
+        attempts = 0
+        waited = 0
+        # Keep retrying until the retries and their total wait are exhausted
+        while (attempts < conn_max_retries or
+               waited < conn_max_retries * conn_retry_interval):
+            attempts += 1
             try:
                 with warnings.catch_warnings():
                     warnings.filterwarnings(
@@ -725,11 +1003,13 @@ class AmphoraAPIClientBase:
                             raise requests.ConnectionError
                     except simplejson.JSONDecodeError:  # if r.json() fails
                         pass  # TODO(rm_work) Should we do something?
+                session.connection_failures = 0
                 return r
             except (requests.ConnectionError, requests.Timeout) as e:
                 exception = e
                 LOG.warning("Could not connect to instance. Retrying.")
-                time.sleep(conn_retry_interval)
+                waited += self._wait_before_retry(amp, session,
+                                                  conn_retry_interval)
                 if raise_retry_exception:
                     # For taskflow persistence cause attribute should
                     # be serializable to JSON. Pass None, as cause exception
@@ -743,6 +1023,37 @@ class AmphoraAPIClientBase:
                    'exception': exception})
         raise driver_except.TimeOutException()
 
+    def _wait_before_retry(self, amp, session, retry_interval):
+        """Wait before retrying to connect to an amphora.
+
+        The waits grow exponentially from connection_retry_initial_interval
+        up to the retry interval, with a random jitter. The wait of a booting
+        amphora ends early when the health manager has received a heartbeat
+        of its agent.
+
+        :returns: The planned wait in seconds.
+        """
+        delay = min(retry_interval,
+                    CONF.haproxy_amphora.connection_retry_initial_interval *
+                    2 ** session.connection_failures)
+        if delay < retry_interval:
+            delay = random.uniform(delay / 2, delay)  # nosec
+        session.connection_failures += 1
+        if amp.status != consts.AMPHORA_BOOTING:
+            time.sleep(delay)
+            return delay
+
+        steps = max(1, math.ceil(delay / READY_CHECK_INTERVAL))
+        for dummy in range(steps):
+            time.sleep(delay / steps)
+            with db_api.session().begin() as db_session:
+                if self.amphora_health_repo.get(db_session,
+                                                amphora_id=amp.id):
+                    LOG.debug('The agent of amphora %s sent a heartbeat, '
+                              'retrying now.', amp.id)
+                    break
+        return delay
+
     def get_api_version(self, amp, timeout_dict=None,
                         raise_retry_exception=False):
         amp.api_version = None
@@ -771,14 +1082,85 @@ class AmphoraAPIClient1_0(AmphoraAPIClientBase):
         self.reload_vrrp = functools.partial(self._vrrp_action,
                                              consts.AMP_ACTION_RELOAD)
 
+    @staticmethod
+    def _compress(amp, **kwargs):
+        """Compress the body of a request if the amphora agent supports it.
+
+        :returns: The keyword arguments of the request.
+        """
+        if (not CONF.haproxy_amphora.compress_uploads or
+                'gzip' not in SESSION_POOL.get(amp.id).content_encodings):
+            return kwargs
+        headers = {'Content-Encoding': 'gzip'}
+        if 'json' in kwargs:
+            body = jsonutils.dump_as_bytes(kwargs['json'])
+            headers['Content-Type'] = 'application/json'
+        else:
+            body = utils.b(kwargs['data'])
+        if len(body) < COMPRESS_MIN_SIZE:
+            return kwargs
+        return {'data': _gzip(body), 'headers': headers}
+
     def upload_config(self, amp, loadbalancer_id, config, timeout_dict=None):
         r = self.put(
             amp,
             'loadbalancer/{amphora_id}/{loadbalancer_id}/haproxy'.format(
                 amphora_id=amp.id, loadbalancer_id=loadbalancer_id),
-            timeout_dict, data=config)
+            timeout_dict, **self._compress(amp, data=config))
         return exc.check_exception(r)
 
+    def upload_bundle(self, amp, loadbalancer_id, certificates,
+                      contents=None, config=None, reload=False,
+                      timeout_dict=None):
+        """Upload certificates and a configuration in a single request.
+
+        :param certificates: The md5sums of the certificates, keyed by file
+                             name.
+        :param contents: The content of the certificates, keyed by md5sum.
+        :returns: The md5sums of the certificates that are missing on the
+                  amphora, nothing was updated if it is not empty.
+        :raises octavia.amphorae.drivers.haproxy.exceptions.NotFound: The
+                amphora agent does not support the bundle uploads.
+        """
+        session = SESSION_POOL.get(amp.id)
+        if not session.bundles:
+            raise exc.NotFound()
+        bundle = {
+            'certificates': certificates,
+            'contents': {
+                md5sum: base64.b64encode(pem).decode('utf-8')
+                for md5sum, pem in (contents or {}).items()},
+            'reload': reload}
+        if config is not None:
+            bundle['config'] = config
+        try:
+            r = self.put(
+                amp, f'loadbalancer/{amp.id}/{loadbalancer_id}/bundle',
+                timeout_dict, retry_404=False,
+                **self._compress(amp, json=bundle))
+        except exc.NotFound:
+            # The agent is not asked again for the bundles of the amphora
+            session.bundles = False
+            raise
+        deployed = self.get_cert_manifest(amp, loadbalancer_id)
+        if exc.check_exception(r, (409,)).status_code == 409:
+            missing = r.json().get('missing', [])
+            for name, md5sum in certificates.items():
+                if md5sum in missing:
+                    deployed.pop(name, None)
+            return missing
+        deployed.update(certificates)
+        return []
+
+    def update_members(self, amp, loadbalancer_id, config,
+                       timeout_dict=None):
+        r = self.put(
+            amp,
+            f'loadbalancer/{amp.id}/{loadbalancer_id}/haproxy/members',
+            timeout_dict, retry_404=False, **self._compress(amp, data=config))
+        # The amphora returns a 409 if the changes require a reload
+        return exc.check_exception(r, (409,)).status_code != 409
+
     def get_listener_status(self, amp, listener_id):
         r = self.get(
             amp,
@@ -808,38 +1190,72 @@ class AmphoraAPIClient1_0(AmphoraAPIClientBase):
             amp,
             'loadbalancer/{loadbalancer_id}/certificates/{filename}'.format(
                 loadbalancer_id=loadbalancer_id, filename=pem_filename))
+        deployed = self.get_cert_manifest(amp, loadbalancer_id)
         if exc.check_exception(r, ignore):
-            return r.json().get("md5sum")
+            md5sum = r.json().get("md5sum")
+            if md5sum:
+                deployed[pem_filename] = md5sum
+            return md5sum
+        deployed.pop(pem_filename, None)
         return None
 
     def delete_cert_pem(self, amp, loadbalancer_id, pem_filename):
+        self.get_cert_manifest(amp, loadbalancer_id).pop(pem_filename, None)
         r = self.delete(
             amp,
             'loadbalancer/{loadbalancer_id}/certificates/{filename}'.format(
                 loadbalancer_id=loadbalancer_id, filename=pem_filename))
         return exc.check_exception(r, (404,))
 
+    def get_cert_manifest(self, amp, loadbalancer_id):
+        """Get the certificates known to be on an amphora.
+
+        The manifest is kept up to date by the certificate requests of the
+        clients of the process, it is lost when the amphora is deleted. It
+        is only trusted by the bundle uploads, the amphora reports the
+        certificates of the manifest that are missing.
+
+        :returns: A dict of the md5sums of the certificates of the load
+                  balancer, keyed by file name.
+        """
+        return SESSION_POOL.get(amp.id).certificates[loadbalancer_id]
+
     def update_cert_for_rotation(self, amp, pem_file):
         r = self.put(amp, 'certificate', data=pem_file)
         return exc.check_exception(r)
 
     def delete_listener(self, amp, object_id):
+        # The certificates of a load balancer are deleted with it
+        SESSION_POOL.get(amp.id).certificates.pop(object_id, None)
         r = self.delete(
             amp, f'listeners/{object_id}')
         return exc.check_exception(r, (404,))
 
     def get_info(self, amp, raise_retry_exception=False,
                  timeout_dict=None):
+        # The info is only sent again by the amphora when it changes
+        session = SESSION_POOL.get(amp.id)
+        cached = session.info
+        headers = {'If-None-Match': cached[0]} if cached else {}
         r = self.get(amp, "info", raise_retry_exception=raise_retry_exception,
-                     timeout_dict=timeout_dict)
+                     timeout_dict=timeout_dict, headers=headers)
+        if cached and r.status_code == 304:
+            return dict(cached[1])
         if exc.check_exception(r):
-            return r.json()
+            info = r.json()
+            etag = r.headers.get('ETag')
+            if etag:
+                session.info = (etag, info)
+            return dict(info)
         return None
 
     def get_details(self, amp):
         r = self.get(amp, "details")
         if exc.check_exception(r):
-            return r.json()
+            details = r.json()
+            SESSION_POOL.get(amp.id).content_encodings = details.get(
+                'content_encodings', [])
+            return details
         return None
 
     def get_all_listeners(self, amp):
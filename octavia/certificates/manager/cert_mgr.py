@@ -17,6 +17,19 @@
 Certificate manager API
 """
 import abc
+import collections
+from concurrent import futures
+import functools
+import threading
+import time
+
+from cryptography import fernet
+from oslo_config import cfg
+from oslo_utils import encodeutils
+
+from octavia.certificates.common import local
+
+CONF = cfg.CONF
 
 
 class CertManager(metaclass=abc.ABCMeta):
@@ -77,3 +90,159 @@ class CertManager(metaclass=abc.ABCMeta):
         If the specified secret does not exist, a CertificateStorageException
         should be raised.
         """
+
+
+class CertCache:
+    """A cache of the certificates and secrets of the cert managers.
+
+    The entries are keyed by project and reference, they expire after
+    [certificates] cache_ttl seconds and the least recently used entries are
+    dropped when there are more than [certificates] cache_size entries. The
+    cached data is encrypted with a key of the process if
+    [certificates] cache_encryption is enabled. The concurrent gets of a
+    missing entry wait for a single load of its reference, also when the
+    cache is disabled.
+    """
+
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+        # The futures of the entries being loaded
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._fernet = fernet.Fernet(fernet.Fernet.generate_key())
+
+    def _seal(self, value):
+        if value is None or not CONF.certificates.cache_encryption:
+            return value
+        if isinstance(value, list):
+            return [self._seal(item) for item in value]
+        return (isinstance(value, str),
+                self._fernet.encrypt(encodeutils.safe_encode(value)))
+
+    def _unseal(self, value):
+        if value is None or not isinstance(value, (list, tuple)):
+            return value
+        if isinstance(value, list):
+            return [self._unseal(item) for item in value]
+        is_str, token = value
+        value = self._fernet.decrypt(token)
+        return encodeutils.safe_decode(value) if is_str else value
+
+    def get(self, key, load, to_fields=None, from_fields=None):
+        """Get an entry of the cache, loading it if it is missing.
+
+        :param key: The key of the entry, its second item is the reference.
+        :param load: Loads the value of a missing entry.
+        :param to_fields: Converts a loaded value to the list of the fields
+                          that are cached, the value is cached as-is if None.
+        :param from_fields: Converts the cached fields to a value.
+        :returns: The value.
+        """
+        ttl = CONF.certificates.cache_ttl
+        now = time.monotonic()
+        with self._lock:
+            # The concurrent loads are coalesced even if the cache is
+            # disabled
+            entry = self._entries.get(key) if ttl else None
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                fields = entry[1]
+            else:
+                fields = None
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = futures.Future()
+                    loader = True
+                else:
+                    loader = False
+        if fields is not None:
+            fields = [self._unseal(field) for field in fields]
+            return from_fields(*fields) if from_fields else fields[0]
+        if not loader:
+            return loading.result()
+
+        try:
+            value = load()
+            fields = to_fields(value) if to_fields else [value]
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[key]
+            if ttl:
+                self._entries[key] = (
+                    now + ttl, [self._seal(field) for field in fields])
+                self._entries.move_to_end(key)
+                while len(self._entries) > CONF.certificates.cache_size:
+                    self._entries.popitem(last=False)
+        loading.set_result(value)
+        return value
+
+    def invalidate(self, ref=None):
+        """Drop the entries of a reference, or all the entries.
+
+        :param ref: The reference of a certificate or secret.
+        """
+        with self._lock:
+            if ref is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[1] == ref]:
+                del self._entries[key]
+
+
+CACHE = CertCache()
+
+
+def _cert_fields(cert):
+    return [cert.get_certificate(), cert.get_private_key(),
+            cert.get_intermediates(), cert.get_private_key_passphrase()]
+
+
+class CachedCertManager:
+    """A cert manager that caches the certificates and secrets it retrieves.
+
+    It wraps the cert manager of the amphora drivers. The API validates the
+    references with the cert manager itself, a certificate or secret that
+    was deleted or whose ACLs were removed is rejected immediately, while
+    the drivers can use it until its entry expires. The certificates are
+    returned as LocalCert objects.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def _load_cert(self, context, cert_ref, **kwargs):
+        cert = self.manager.get_cert(context, cert_ref, **kwargs)
+        return local.LocalCert(*_cert_fields(cert))
+
+    def get_cert(self, context, cert_ref, resource_ref=None, check_only=False,
+                 service_name=None):
+        key = ('cert', cert_ref, getattr(context, 'project_id', None),
+               check_only)
+        return CACHE.get(
+            key, functools.partial(self._load_cert, context, cert_ref,
+                                   resource_ref=resource_ref,
+                                   check_only=check_only,
+                                   service_name=service_name),
+            to_fields=_cert_fields, from_fields=local.LocalCert)
+
+    def get_secret(self, context, secret_ref):
+        key = ('secret', secret_ref, getattr(context, 'project_id', None))
+        return CACHE.get(
+            key, functools.partial(self.manager.get_secret, context,
+                                   secret_ref))
+
+    def delete_cert(self, context, cert_ref, resource_ref, service_name=None):
+        CACHE.invalidate(cert_ref)
+        return self.manager.delete_cert(context, cert_ref, resource_ref,
+                                        service_name=service_name)
+
+    def unset_acls(self, context, cert_ref):
+        CACHE.invalidate(cert_ref)
+        return self.manager.unset_acls(context, cert_ref)
@@ -71,6 +71,9 @@ def main():
     options = {
         'bind': bind_ip_port,
         'workers': 1,
+        # The read-only requests are not blocked by the long operations
+        'worker_class': 'gthread',
+        'threads': CONF.amphora_agent.agent_server_threads,
         'timeout': CONF.amphora_agent.agent_request_read_timeout,
         'certfile': CONF.amphora_agent.agent_server_cert,
         'ca_certs': CONF.amphora_agent.agent_server_ca,
@@ -18,23 +18,40 @@
 # of metrics. It also aligns the terms to be consistent with Octavia
 # terminology.
 
+import argparse
+import collections
+import functools
+import gzip
+import http.client
 from http.server import SimpleHTTPRequestHandler
 from http.server import ThreadingHTTPServer
 import os
+import re
 import signal
 import sys
 import threading
 import time
 import traceback
-import urllib.request
+import urllib.parse
+import zlib
 
 import psutil
 
 from octavia.amphorae.backends.utils import network_namespace
 from octavia.common import constants as consts
+from octavia.i18n import _
 
 METRICS_URL = "http://127.0.0.1:9101/metrics"
+# Socket timeout, in seconds, of the connections to the HAProxy exporter
+UPSTREAM_TIMEOUT = 30
+# Maximum number of idle keep-alive connections to the HAProxy exporter
+UPSTREAM_MAX_IDLE = 4
+# Number of seconds an idle keep-alive connection of a scraper is kept open
+KEEPALIVE_TIMEOUT = 60
 PRINT_REJECTED = False
+# Number of seconds the rewritten metrics are served to the scrapers before
+# querying HAProxy again, 0 disables the cache.
+CACHE_TTL = 1.0
 EXIT_EVENT = threading.Event()
 
 # A dictionary of prometheus metrics mappings.
@@ -693,12 +710,211 @@ METRIC_MAP = {
         ("octavia_member_idle_connections_limit{", None,
          {"proxy=": "pool=", "server=": "member="}),
 }
-METRIC_KEYS = METRIC_MAP.keys()
+
+# Size, in bytes, of the chunks streamed to the scraper
+CHUNK_SIZE = 65536
+# zlib window bits producing a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# The metric scopes that can be selected with the "scope" query parameter,
+# Key: The octavia metric scope
+# Value: The matching HAProxy exporter scope
+METRIC_SCOPES = {
+    "loadbalancer": "global",
+    "listener": "frontend",
+    "pool": "backend",
+    "member": "server",
+}
+# The octavia metric scope of the HAProxy metrics, by metric name prefix
+HAPROXY_PREFIX_SCOPES = {
+    "haproxy_process_": "loadbalancer",
+    "haproxy_frontend_": "listener",
+    "haproxy_backend_": "pool",
+    "haproxy_server_": "member",
+}
+
+
+def _build_label_rename(substitutions):
+    if not substitutions:
+        return None
+    pattern = re.compile("|".join(re.escape(key) for key in substitutions))
+    return functools.partial(pattern.sub,
+                             lambda match: substitutions[match.group(0)])
+
+
+# METRIC_MAP, indexed by the exact metric name and label presence
+# (the name followed by a space or "{").
+# Value: A tuple of the precomputed replacement data.
+#    tuple[0]: The octavia metric name.
+#    tuple[1]: If not None, the replacement HELP line for the metric.
+#    tuple[2]: If not None, a function that renames the labels of a sample.
+#    tuple[3]: The octavia scope of the metric.
+METRIC_TABLE = {
+    key: (value[0][:-1], value[1], _build_label_rename(value[2]),
+          next(scope for prefix, scope in HAPROXY_PREFIX_SCOPES.items()
+               if key.startswith(prefix)))
+    for key, value in METRIC_MAP.items()}
+
+
+def parse_scopes(query):
+    """Parse the metric scopes requested in a query string.
+
+    The scopes can be passed as several "scope" parameters or as a comma
+    separated list, "?scope=listener,pool" or "?scope=listener&scope=pool".
+
+    :param query: The query string of the request.
+    :returns: A frozenset of octavia scopes, or None for all the metrics.
+    :raises ValueError: An unknown scope was requested.
+    """
+    values = urllib.parse.parse_qs(query).get("scope")
+    if not values:
+        return None
+    scopes = frozenset(scope.strip() for value in values
+                       for scope in value.split(",") if scope.strip())
+    unknown = scopes.difference(METRIC_SCOPES)
+    if unknown:
+        raise ValueError(
+            _("Unknown metric scope(s): %(unknown)s. Valid scopes are: "
+              "%(valid)s.") % {"unknown": ", ".join(sorted(unknown)),
+                               "valid": ", ".join(METRIC_SCOPES)})
+    return scopes or None
+
+
+def rewrite_metric_line(line, scopes=None):
+    """Rewrite a line of the HAProxy exporter output to octavia metrics.
+
+    :param line: A line (including the trailing newline) of the HAProxy
+                 prometheus exporter output.
+    :param scopes: The octavia scopes of the reported metrics, None for all
+                   the metrics.
+    :returns: The rewritten line, or None if the line is not reported.
+    """
+    if line.startswith("#"):
+        # "# HELP <name> <text>" or "# TYPE <name> <type>"
+        fields = line.split(" ", 3)
+        if len(fields) < 3:
+            return None
+        name = fields[2].rstrip("\n")
+        map_tuple = METRIC_TABLE.get(name + " ")
+        if map_tuple is None or (scopes and map_tuple[3] not in scopes):
+            return None
+        if map_tuple[1] and fields[1] == "HELP":
+            return map_tuple[1]
+        fields[2] = fields[2].replace(name, map_tuple[0], 1)
+        return " ".join(fields)
+
+    # "<name>{<labels>} <value>" or "<name> <value>"
+    name_end = len(line)
+    for separator in ("{", " "):
+        index = line.find(separator, 0, name_end)
+        if index != -1:
+            name_end = index
+    map_tuple = METRIC_TABLE.get(line[:name_end + 1])
+    if map_tuple is None or (scopes and map_tuple[3] not in scopes):
+        return None
+    sample = line[name_end:]
+    if map_tuple[2]:
+        sample = map_tuple[2](sample)
+    return map_tuple[0] + sample
+
+
+class UpstreamResponse:
+    """A response of the HAProxy exporter.
+
+    The connection is returned to its pool when the response was entirely
+    read, otherwise it is closed.
+    """
+
+    def __init__(self, pool, connection, response):
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+        self.exhausted = False
+
+    def __iter__(self):
+        yield from self.response
+        self.exhausted = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.response.close()
+        self.pool.release(self.connection,
+                          self.exhausted and not self.response.will_close)
+
+
+class UpstreamConnectionPool:
+    """Keep-alive HTTP connections to the HAProxy exporter."""
+
+    def __init__(self, url, max_idle=UPSTREAM_MAX_IDLE):
+        url = urllib.parse.urlsplit(url)
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _get_connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return http.client.HTTPConnection(self.host, self.port,
+                                          timeout=UPSTREAM_TIMEOUT), False
+
+    def release(self, connection, reuse=True):
+        if reuse:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(connection)
+                    return
+        connection.close()
+
+    def open(self, scopes=None):
+        """Request the metrics from the HAProxy exporter.
+
+        :param scopes: The octavia scopes of the requested metrics, None for
+                       all the metrics.
+        :returns: An UpstreamResponse, to be closed by the caller.
+        :raises Exception: The exporter is not reachable or returned an
+                           error.
+        """
+        path = self.path
+        if scopes:
+            path += "?" + urllib.parse.urlencode(
+                [("scope", METRIC_SCOPES[scope]) for scope in
+                 sorted(scopes)])
+        connection, reused = self._get_connection()
+        while True:
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                break
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if not reused:
+                    raise
+                # The exporter may have closed the idle connection, retry
+                # once on a new connection.
+                reused = False
+
+        if response.status != 200:
+            response.read()
+            self.release(connection, not response.will_close)
+            raise Exception(_("The HAProxy exporter returned HTTP %s.") %
+                            response.status)
+        return UpstreamResponse(self, connection, response)
 
 
 class PrometheusProxy(SimpleHTTPRequestHandler):
 
     protocol_version = 'HTTP/1.1'
+    # Release the thread of an idle keep-alive connection
+    timeout = KEEPALIVE_TIMEOUT
 
     # No need to log every request through the proxy
     def log_request(self, *args, **kwargs):
@@ -722,50 +938,243 @@ class PrometheusProxy(SimpleHTTPRequestHandler):
         metrics_buffer += mem_metric_string
         return metrics_buffer
 
-    def do_GET(self):
+    def _iter_metrics(self, source, scopes=None):
+        """Rewrite the HAProxy exporter metrics.
+
+        :param source: The HAProxy exporter response.
+        :param scopes: The octavia scopes of the reported metrics, None for
+                       all the metrics.
+        :returns: A generator of encoded chunks of about CHUNK_SIZE bytes.
+        """
         metrics_buffer = ""
 
-        metrics_buffer = self._add_cpu_utilization(metrics_buffer)
-        metrics_buffer = self._add_memory_utilization(metrics_buffer)
+        if not scopes or "loadbalancer" in scopes:
+            metrics_buffer = self._add_cpu_utilization(metrics_buffer)
+            metrics_buffer = self._add_memory_utilization(metrics_buffer)
 
-        try:
-            with urllib.request.urlopen(METRICS_URL) as source:  # nosec
-                lines = source.readlines()
-                for line in lines:
-                    line = line.decode("utf-8")
-                    # Don't report metrics for the internal prometheus
-                    # proxy loop. The user facing listener will still be
-                    # reported.
-                    if "prometheus-exporter" in line:
-                        continue
-                    match = next((x for x in METRIC_KEYS if x in line), False)
-                    if match:
-                        map_tuple = METRIC_MAP[match]
-                        if map_tuple[1] and "HELP" in line:
-                            metrics_buffer += map_tuple[1]
-                        else:
-                            if map_tuple[2] and not line.startswith("#"):
-                                for key in map_tuple[2].keys():
-                                    line = line.replace(key,
-                                                        map_tuple[2][key])
-                            metrics_buffer += line.replace(match,
-                                                           map_tuple[0])
-                    elif PRINT_REJECTED:
-                        print("REJECTED: %s" % line)
-        except Exception as e:
-            print(str(e), flush=True)
-            traceback.print_tb(e.__traceback__)
-            self.send_response(502)
-            self.send_header("connection", "close")
-            self.end_headers()
-            return
+        chunk = [metrics_buffer]
+        chunk_size = len(metrics_buffer)
+        for line in source:
+            line = line.decode("utf-8")
+            # Don't report metrics for the internal prometheus
+            # proxy loop. The user facing listener will still be
+            # reported.
+            if "prometheus-exporter" in line:
+                continue
+            new_line = rewrite_metric_line(line, scopes)
+            if new_line is None:
+                if PRINT_REJECTED:
+                    print("REJECTED: %s" % line)
+                continue
+            chunk.append(new_line)
+            chunk_size += len(new_line)
+            if chunk_size >= CHUNK_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk = []
+                chunk_size = 0
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+
+    def _fetch_metrics(self, scopes=None):
+        with UPSTREAM_POOL.open(scopes) as source:
+            return b"".join(self._iter_metrics(source, scopes))
+
+    def _accepts_gzip(self):
+        for coding in self.headers.get("accept-encoding", "").split(","):
+            name, _, params = coding.partition(";")
+            if name.strip().lower() != "gzip":
+                continue
+            params = params.replace(" ", "")
+            return params not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+        return False
 
+    def _send_metrics_headers(self, gzip_encoding, content_length=None):
         self.send_response(200)
         self.send_header("cache-control", "no-cache")
         self.send_header("content-type", "text/plain; version=0.0.4")
+        if gzip_encoding:
+            self.send_header("content-encoding", "gzip")
+        self.send_header("vary", "accept-encoding")
+        if content_length is None:
+            self.send_header("transfer-encoding", "chunked")
+        else:
+            self.send_header("content-length", str(content_length))
+        self.end_headers()
+
+    def _send_error(self, e):
+        print(str(e), flush=True)
+        traceback.print_tb(e.__traceback__)
+        self.send_response(502)
         self.send_header("connection", "close")
         self.end_headers()
-        self.wfile.write(metrics_buffer.encode("utf-8"))
+
+    def _write_chunk(self, data):
+        # An empty chunk would terminate the payload
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def do_GET(self):
+        try:
+            scopes = parse_scopes(urllib.parse.urlsplit(self.path).query)
+        except ValueError as e:
+            message = str(e).encode("utf-8")
+            self.send_response(400)
+            self.send_header("content-type", "text/plain")
+            self.send_header("content-length", str(len(message)))
+            self.end_headers()
+            self.wfile.write(message)
+            return
+
+        gzip_encoding = self._accepts_gzip()
+
+        if METRICS_CACHE.ttl > 0:
+            try:
+                metrics = METRICS_CACHE.get(
+                    scopes, functools.partial(self._fetch_metrics, scopes))
+            except Exception as e:
+                self._send_error(e)
+                return
+            payload = (metrics.gzip_payload if gzip_encoding
+                       else metrics.payload)
+            self._send_metrics_headers(gzip_encoding, len(payload))
+            self.wfile.write(payload)
+            return
+
+        try:
+            source = UPSTREAM_POOL.open(scopes)
+        except Exception as e:
+            self._send_error(e)
+            return
+
+        # HTTP/1.0 clients don't support the chunked transfer encoding, the
+        # whole payload is buffered to send its content-length.
+        chunked = self.request_version == "HTTP/1.1"
+        if chunked:
+            self._send_metrics_headers(gzip_encoding)
+
+        compressor = None
+        if gzip_encoding:
+            compressor = zlib.compressobj(wbits=GZIP_WBITS)
+        payload = []
+        try:
+            with source:
+                for data in self._iter_metrics(source, scopes):
+                    if compressor:
+                        data = compressor.compress(data)
+                    if chunked:
+                        self._write_chunk(data)
+                    else:
+                        payload.append(data)
+        except Exception as e:
+            if not chunked:
+                self._send_error(e)
+                return
+            print(str(e), flush=True)
+            traceback.print_tb(e.__traceback__)
+            # The response status was already sent, close the connection
+            # without the final chunk so the scraper discards the
+            # incomplete payload.
+            self.close_connection = True
+            return
+
+        if compressor:
+            data = compressor.flush()
+            if chunked:
+                self._write_chunk(data)
+            else:
+                payload.append(data)
+
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        payload = b"".join(payload)
+        self._send_metrics_headers(gzip_encoding, len(payload))
+        self.wfile.write(payload)
+
+
+class CachedMetrics:
+    """A rewritten metrics payload."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self._gzip_payload = None
+
+    @property
+    def gzip_payload(self):
+        # Compressed on the first request for it, concurrent requests may
+        # compress it twice but get the same result.
+        if self._gzip_payload is None:
+            self._gzip_payload = gzip.compress(self.payload)
+        return self._gzip_payload
+
+
+class MetricsCacheEntry:
+    """The state of the fetches of a set of metric scopes."""
+
+    def __init__(self):
+        self.fetching = False
+        self.generation = 0
+        self.metrics = None
+        self.error = None
+        self.expiration = 0
+
+
+class MetricsCache:
+    """Coalesce the scrapes onto a single upstream fetch.
+
+    The scrapes received while a fetch of the same metric scopes is in
+    progress wait for its result instead of querying HAProxy again, the
+    result is then served to the following scrapes for ttl seconds.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._condition = threading.Condition()
+        # There is at most one entry per combination of METRIC_SCOPES
+        self._entries = collections.defaultdict(MetricsCacheEntry)
+
+    def get(self, key, fetch):
+        """Get the cached metrics, or fetch them.
+
+        :param key: The metric scopes of the payload.
+        :param fetch: A callable returning the rewritten metrics payload.
+        :returns: A CachedMetrics object.
+        :raises Exception: The exception raised by the coalesced fetch.
+        """
+        with self._condition:
+            entry = self._entries[key]
+            if (entry.metrics is not None and
+                    time.monotonic() < entry.expiration):
+                return entry.metrics
+            if entry.fetching:
+                generation = entry.generation
+                while entry.generation == generation:
+                    self._condition.wait()
+                if entry.error is not None:
+                    raise entry.error
+                return entry.metrics
+            entry.fetching = True
+
+        metrics = error = None
+        try:
+            metrics = CachedMetrics(fetch())
+            return metrics
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._condition:
+                entry.fetching = False
+                entry.generation += 1
+                entry.metrics = metrics
+                entry.error = error
+                entry.expiration = time.monotonic() + self.ttl
+                self._condition.notify_all()
+
+
+METRICS_CACHE = MetricsCache(CACHE_TTL)
+UPSTREAM_POOL = UpstreamConnectionPool(METRICS_URL)
 
 
 class SignalHandler:
@@ -785,11 +1194,16 @@ def shutdown_thread(http):
 
 def main():
     global PRINT_REJECTED
-    try:
-        if sys.argv[1] == "--rejected":
-            PRINT_REJECTED = True
-    except Exception:
-        pass
+    parser = argparse.ArgumentParser(
+        description="Octavia amphora prometheus metrics proxy.")
+    parser.add_argument("--rejected", action="store_true",
+                        help="Print the HAProxy metrics not reported.")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL,
+                        help="Number of seconds the metrics are served "
+                             "from the cache, 0 disables the cache.")
+    args = parser.parse_args(sys.argv[1:])
+    PRINT_REJECTED = args.rejected
+    METRICS_CACHE.ttl = max(args.cache_ttl, 0)
 
     SignalHandler()
 
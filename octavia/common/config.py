@@ -159,6 +159,11 @@ amphora_agent_opts = [
     cfg.IntOpt('agent_request_read_timeout', default=180,
                help=_("The time in seconds to allow a request from the "
                       "controller to run before terminating the socket.")),
+    cfg.IntOpt('agent_server_threads', default=8, min=1,
+               help=_("The number of threads of the amphora agent that "
+                      "handle the requests. The requests that update the "
+                      "amphora are handled one at a time, the read-only "
+                      "requests are handled concurrently.")),
     cfg.StrOpt('agent_tls_protocol', default=lib_consts.TLS_VERSION_1_2,
                help=_("Minimum TLS protocol for communication with the "
                       "amphora agent."),
@@ -300,6 +305,15 @@ health_manager_opts = [
                help=_('Sleep time between health checks in seconds.')),
     cfg.IntOpt('sock_rlimit', default=0,
                help=_(' sets the value of the heartbeat recv buffer')),
+    cfg.BoolOpt('amphora_partitioning', default=False,
+                help=_('Partition the monitoring of the amphorae across the '
+                       'running health managers. Each health manager '
+                       'registers itself in the database and only fails '
+                       'over the stale amphorae it owns according to a '
+                       'consistent hash of the amphora ID. The amphorae of a '
+                       'health manager that stopped updating its '
+                       'registration for heartbeat_timeout seconds are '
+                       'reassigned to the remaining health managers.')),
     cfg.IntOpt('failover_threshold', default=None,
                help=_('Stop failovers if the count of simultaneously failed '
                       'amphora reaches this number. This may prevent large '
@@ -317,6 +331,33 @@ health_manager_opts = [
                default=10,
                mutable=True,
                help=_('Sleep time between sending heartbeats.')),
+    cfg.IntOpt('status_poll_interval',
+               default=0,
+               min=0,
+               mutable=True,
+               help=_('Interval, in seconds, between polls of the listener, '
+                      'pool and member operating statuses on the amphora. '
+                      'When a status changes, a heartbeat is sent '
+                      'immediately instead of waiting for the next '
+                      'heartbeat_interval. 0 disables status polling.')),
+    cfg.IntOpt('heartbeat_destinations',
+               default=1,
+               min=1,
+               mutable=True,
+               help=_('Number of controllers from the '
+                      'controller_ip_port_list each heartbeat is sent to. '
+                      'Controllers that reported an error are skipped. Only '
+                      'the first copy of a heartbeat carries the listener '
+                      'statistics.')),
+    cfg.StrOpt('heartbeat_destination_selection',
+               default=constants.HEARTBEAT_DEST_ROUND_ROBIN,
+               choices=constants.SUPPORTED_HEARTBEAT_DEST_SELECTIONS,
+               mutable=True,
+               help=_('How the controllers receiving the heartbeats are '
+                      'selected. round_robin rotates through the '
+                      'controller_ip_port_list, amphora_id always selects '
+                      'the same controllers for an amphora using consistent '
+                      'hashing of the amphora ID.')),
 
     # Used for updating health
     cfg.StrOpt('health_update_driver', default='health_db',
@@ -347,6 +388,14 @@ haproxy_amphora_opts = [
                default=5,
                help=_('Retry timeout between connection attempts in '
                       'seconds.')),
+    cfg.FloatOpt('connection_retry_initial_interval',
+                 default=1, min=0.1,
+                 help=_('The wait before the first retry of a connection to '
+                        'an amphora, in seconds. The waits double with a '
+                        'random jitter up to the retry interval, the total '
+                        'wait is still the retry threshold multiplied by the '
+                        'retry interval. Set it to the retry interval or '
+                        'more to retry at a fixed interval.')),
     cfg.IntOpt('active_connection_max_retries',
                default=15,
                help=_('Retry threshold for connecting to active amphorae.')),
@@ -405,6 +454,24 @@ haproxy_amphora_opts = [
     cfg.FloatOpt('rest_request_read_timeout', default=60,
                  help=_("The time in seconds to wait for a REST API "
                         "response.")),
+    cfg.IntOpt('connection_pool_size', default=1024, min=1,
+               help=_('The maximum number of amphorae with persistent '
+                      'connections kept by a controller process. The '
+                      'connections to the least recently used amphorae are '
+                      'closed.')),
+    cfg.IntOpt('connection_pool_maxsize', default=4, min=1,
+               help=_('The maximum number of idle connections kept to an '
+                      'amphora.')),
+    cfg.IntOpt('amphora_update_threads', default=8, min=1,
+               help=_('The maximum number of amphorae of a load balancer '
+                      'that are updated concurrently.')),
+    cfg.IntOpt('certificate_threads', default=8, min=1,
+               help=_('The maximum number of listeners of a load balancer '
+                      'whose certificates are processed concurrently.')),
+    cfg.BoolOpt('compress_uploads', default=True,
+                help=_('Compress the large configurations uploaded to the '
+                       'amphorae with gzip, when their amphora agent '
+                       'supports it.')),
     cfg.IntOpt('timeout_client_data',
                default=constants.DEFAULT_TIMEOUT_CLIENT_DATA,
                help=_('Frontend client inactivity timeout.')),
@@ -641,6 +708,20 @@ certificate_opts = [
     cfg.BoolOpt('insecure',
                 default=False,
                 help=_('Disable certificate validation on SSL connections ')),
+    cfg.IntOpt('cache_ttl', default=60, min=0,
+               help=_('The number of seconds the certificates and secrets '
+                      'retrieved from the key manager service by the amphora '
+                      'drivers are cached by a process. A certificate or '
+                      'secret deleted, or whose ACLs were removed, directly '
+                      'in the key manager service can still be deployed on '
+                      'the amphorae during this time. The API does not use '
+                      'the cache. 0 disables the cache.')),
+    cfg.IntOpt('cache_size', default=1024, min=1,
+               help=_('The maximum number of certificates and secrets '
+                      'cached by a process.')),
+    cfg.BoolOpt('cache_encryption', default=True,
+                help=_('Encrypt the cached certificates and secrets with a '
+                       'key of the process.')),
 ]
 
 house_keeping_opts = [
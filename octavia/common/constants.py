@@ -583,6 +583,7 @@ AMPHORAE_GET_CONNECTIVITY_STATUS = 'amphorae-get-connectivity-status'
 AMPHORAE_POST_NETWORK_PLUG = 'amphorae-post-network-plug'
 ATTACH_PORT = 'attach-port'
 CALCULATE_AMPHORA_DELTA = 'calculate-amphora-delta'
+CLOSE_AMPHORA_CONNECTIONS = 'close-amphora-connections'
 CREATE_VIP_BASE_PORT = 'create-vip-base-port'
 DELETE_AMPHORA = 'delete-amphora'
 DELETE_PORT = 'delete-port'
@@ -972,6 +973,12 @@ COMMAND = 'command'
 IFLA_ADDRESS = 'IFLA_ADDRESS'
 IFLA_IFNAME = 'IFLA_IFNAME'
 
+# Amphora health heartbeat destination selection
+HEARTBEAT_DEST_ROUND_ROBIN = 'round_robin'
+HEARTBEAT_DEST_AMPHORA_ID = 'amphora_id'
+SUPPORTED_HEARTBEAT_DEST_SELECTIONS = (HEARTBEAT_DEST_ROUND_ROBIN,
+                                       HEARTBEAT_DEST_AMPHORA_ID)
+
 # Amphora network directory
 AMP_NET_DIR_TEMPLATE = '/etc/octavia/interfaces/'
 
@@ -982,5 +989,8 @@ NFT_FAMILY = 'inet'
 NFT_VIP_RULES_FILE = '/var/lib/octavia/nftables-vip.rules'
 NFT_VIP_TABLE = 'amphora_vip'
 NFT_VIP_CHAIN = 'amphora_vip_chain'
+NFT_VIP_PORTS_SET = 'amphora_vip_ports'
+NFT_VIP_IPV4_SET = 'amphora_vip_ipv4'
+NFT_VIP_IPV6_SET = 'amphora_vip_ipv6'
 NFT_SRIOV_PRIORITY = '-310'
 PROTOCOL = 'protocol'
@@ -620,7 +620,8 @@ class Amphora(BaseDataModel):
                  load_balancer=None, role=None, cert_expiration=None,
                  cert_busy=False, vrrp_interface=None, vrrp_id=None,
                  vrrp_priority=None, cached_zone=None, created_at=None,
-                 updated_at=None, image_id=None, compute_flavor=None):
+                 updated_at=None, image_id=None, compute_flavor=None,
+                 api_version=None, haproxy_version=None):
         self.id = id
         self.load_balancer_id = load_balancer_id
         self.compute_id = compute_id
@@ -642,6 +643,8 @@ class Amphora(BaseDataModel):
         self.updated_at = updated_at
         self.image_id = image_id
         self.compute_flavor = compute_flavor
+        self.api_version = api_version
+        self.haproxy_version = haproxy_version
 
     def delete(self):
         for amphora in self.load_balancer.amphorae:
@@ -658,6 +661,13 @@ class AmphoraHealth(BaseDataModel):
         self.busy = busy
 
 
+class HealthManagerMember(BaseDataModel):
+
+    def __init__(self, id=None, last_update=None):
+        self.id = id
+        self.last_update = last_update
+
+
 class L7Rule(BaseDataModel):
 
     def __init__(self, id=None, l7policy_id=None, type=None, enabled=None,
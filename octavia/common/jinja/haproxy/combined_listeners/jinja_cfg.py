@@ -12,8 +12,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
+import hashlib
+import json
 import os
 import re
+import threading
 from typing import Optional
 
 import jinja2
@@ -55,9 +60,63 @@ HAPROXY_TEMPLATE = os.path.abspath(
     os.path.join(os.path.dirname(__file__),
                  'templates/haproxy.cfg.j2'))
 
+# The maximum number of rendered configurations cached by a process
+RENDER_CACHE_SIZE = 32
+# The maximum number of rendered member server lines cached by a process
+MEMBER_CACHE_SIZE = 100000
+
 CONF = cfg.CONF
 
-JINJA_ENV = None
+
+def _create_environment(searchpath):
+    env = jinja2.Environment(
+        autoescape=True,
+        loader=jinja2.FileSystemLoader(searchpath=searchpath),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        # The compiled templates are not checked for changes on each render
+        auto_reload=False)
+    env.filters['hash_amp_id'] = octavia_utils.base64_sha1_string
+    return env
+
+
+JINJA_ENV = _create_environment(os.path.dirname(HAPROXY_TEMPLATE))
+# The templates, by path. The default template is compiled at import.
+TEMPLATES = {
+    HAPROXY_TEMPLATE: JINJA_ENV.get_template(
+        os.path.basename(HAPROXY_TEMPLATE))
+}
+MACROS = JINJA_ENV.get_template('macros.j2').module
+
+
+class RenderCache:
+    """The configurations rendered by a process, keyed by their context."""
+
+    def __init__(self, size=RENDER_CACHE_SIZE):
+        self._size = size
+        self._configs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        with self._lock:
+            config = self._configs.get(key)
+            if config is not None:
+                self._configs.move_to_end(key)
+                return config
+        config = render()
+        with self._lock:
+            self._configs[key] = config
+            while len(self._configs) > self._size:
+                self._configs.popitem(last=False)
+        return config
+
+    def clear(self):
+        with self._lock:
+            self._configs.clear()
+
+
+RENDER_CACHE = RenderCache()
+MEMBER_CACHE = RenderCache(MEMBER_CACHE_SIZE)
 
 
 class JinjaTemplater:
@@ -123,17 +182,13 @@ class JinjaTemplater:
 
     def _get_template(self):
         """Returns the specified Jinja configuration template."""
-        global JINJA_ENV
-        if not JINJA_ENV:
-            template_loader = jinja2.FileSystemLoader(
-                searchpath=os.path.dirname(self.haproxy_template))
-            JINJA_ENV = jinja2.Environment(
-                autoescape=True,
-                loader=template_loader,
-                trim_blocks=True,
-                lstrip_blocks=True)
-        JINJA_ENV.filters['hash_amp_id'] = octavia_utils.base64_sha1_string
-        return JINJA_ENV.get_template(os.path.basename(self.haproxy_template))
+        template = TEMPLATES.get(self.haproxy_template)
+        if template is None:
+            env = _create_environment(os.path.dirname(self.haproxy_template))
+            template = TEMPLATES.setdefault(
+                self.haproxy_template,
+                env.get_template(os.path.basename(self.haproxy_template)))
+        return template
 
     def _format_log_string(self, load_balancer, protocol):
         log_format = CONF.haproxy_amphora.user_log_format.replace(
@@ -177,6 +232,10 @@ class JinjaTemplater:
         if not socket_path:
             socket_path = '{}/{}.sock'.format(self.base_amp_path,
                                               listeners[0].load_balancer.id)
+        # The runtime API socket used by the amphora agent to update the
+        # members without reloading HAProxy
+        admin_socket_path = '{}/{}-admin.sock'.format(
+            self.base_amp_path, listeners[0].load_balancer.id)
         state_file_path = '{}/{}/servers-state'.format(
             self.base_amp_path,
             listeners[0].load_balancer.id) if feature_compatibility.get(
@@ -195,6 +254,7 @@ class JinjaTemplater:
         jinja_dict = {
             'loadbalancer': loadbalancer,
             'stats_sock': socket_path,
+            'admin_stats_sock': admin_socket_path,
             'log_http': self.log_http,
             'log_server': self.log_server,
             'state_file': state_file_path,
@@ -232,8 +292,59 @@ class JinjaTemplater:
             except (KeyError, TypeError):
                 pass
 
-        return self._get_template().render(
-            jinja_dict, constants=constants, lib_consts=lib_consts)
+        return self._render(jinja_dict)
+
+    def _render(self, jinja_dict):
+        """Render the template, or reuse the result of the same context.
+
+        The amphorae of a load balancer and the retries of an update get the
+        same configuration, it is only rendered once.
+        """
+        def render():
+            if self.haproxy_template == HAPROXY_TEMPLATE:
+                self._render_members(jinja_dict['loadbalancer'])
+            return self._get_template().render(
+                jinja_dict, constants=constants, lib_consts=lib_consts)
+
+        loadbalancer = dict(jinja_dict['loadbalancer'])
+        if self.haproxy_template == HAPROXY_TEMPLATE:
+            # The default template does not use the host amphora
+            del loadbalancer['host_amphora']
+        try:
+            loadbalancer['amphorae'] = [
+                self._transform_amphora(amp, None)
+                for amp in loadbalancer['amphorae']]
+            context = json.dumps(
+                [self.haproxy_template,
+                 dict(jinja_dict, loadbalancer=loadbalancer)],
+                sort_keys=True)
+        except (AttributeError, TypeError):
+            # The context can't be compared, e.g. with mocked objects
+            return render()
+        key = hashlib.sha256(context.encode('utf-8')).hexdigest()
+        return RENDER_CACHE.get(key, render)
+
+    @staticmethod
+    def _render_members(loadbalancer):
+        """Render the server lines of the members of the default template.
+
+        The lines are keyed by the member and its pool, only the new and the
+        updated members of a large pool are rendered again.
+        """
+        for listener in loadbalancer['listeners']:
+            for pool in listener['pools']:
+                try:
+                    pool_key = json.dumps(dict(pool, members=None),
+                                          sort_keys=True)
+                    for member in pool['members']:
+                        key = (pool_key, tuple(sorted(member.items())))
+                        member['server_line'] = MEMBER_CACHE.get(
+                            key, functools.partial(
+                                MACROS.member_macro, constants, lib_consts,
+                                pool, member))
+                except TypeError:
+                    # The pool can't be compared, e.g. with mocked objects
+                    continue
 
     def _transform_loadbalancer(self, host_amphora, loadbalancer, listeners,
                                 tls_certs, feature_compatibility):
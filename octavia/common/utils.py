@@ -40,6 +40,21 @@ def get_hostname():
     return socket.gethostname()
 
 
+def rendezvous_hash_order(key, nodes):
+    """Order nodes by rendezvous (highest random weight) hashing of a key.
+
+    The first node is the owner of the key. Adding or removing a node only
+    changes the owner of the keys that are owned by that node.
+
+    :param key: The key to place, for instance an amphora ID.
+    :param nodes: An iterable of node names (strings).
+    :returns: The list of the nodes, ordered by decreasing weight.
+    """
+    def weight(node):
+        return hashlib.sha256(f'{key}-{node}'.encode('utf-8')).digest()
+    return sorted(nodes, key=weight, reverse=True)
+
+
 def base64_sha1_string(string_to_hash):
     """Get a b64-encoded sha1 hash of a string. Not intended to be secure!"""
     # TODO(rm_work): applying nosec here because this is not intended to be
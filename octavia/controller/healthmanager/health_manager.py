@@ -14,6 +14,7 @@
 #
 
 from concurrent import futures
+import datetime
 import functools
 import time
 
@@ -23,6 +24,7 @@ from oslo_log import log as logging
 from oslo_utils import excutils
 
 from octavia.common import constants
+from octavia.common import utils
 from octavia.controller.worker.v2 import controller_worker as cw2
 from octavia.db import api as db_api
 from octavia.db import repositories as repo
@@ -31,11 +33,13 @@ CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
 
-def wait_done_or_dead(futs, dead, check_timeout=1):
+def wait_done_or_dead(futs, dead, check_timeout=1, on_wait=None):
     while True:
         _done, not_done = futures.wait(futs, timeout=check_timeout)
         if not not_done:
             break
+        if on_wait is not None:
+            on_wait()
         if dead.is_set():
             for fut in not_done:
                 # This may not actually be able to cancel, but try to
@@ -63,8 +67,55 @@ class HealthManager:
         self.amp_repo = repo.AmphoraRepository()
         self.amp_health_repo = repo.AmphoraHealthRepository()
         self.lb_repo = repo.LoadBalancerRepository()
+        self.member_repo = repo.HealthManagerMemberRepository()
+        self.member_id = CONF.host
+        self.member_ids = [self.member_id]
+        self.member_last_update = None
         self.dead = exit_event
 
+    def update_membership(self):
+        """Register this health manager and get the live health managers
+
+        The registration is refreshed at most every health_check_interval
+        seconds.
+        """
+        if not CONF.health_manager.amphora_partitioning:
+            return
+        now = datetime.datetime.utcnow()
+        if (self.member_last_update is not None and
+                now - self.member_last_update < datetime.timedelta(
+                    seconds=CONF.health_manager.health_check_interval)):
+            return
+        expired_time = now - datetime.timedelta(
+            seconds=CONF.health_manager.heartbeat_timeout)
+        session = db_api.get_session()
+        with session.begin():
+            self.member_repo.replace(session, self.member_id,
+                                     last_update=now)
+            member_ids = self.member_repo.get_live_member_ids(
+                session, expired_time)
+        self.member_last_update = now
+        if self.member_id not in member_ids:
+            member_ids = sorted(member_ids + [self.member_id])
+        if member_ids != self.member_ids:
+            LOG.info("Health manager members changed to %s, amphorae are "
+                     "redistributed.", member_ids)
+            self.member_ids = member_ids
+
+    def is_amphora_owner(self, amphora_id):
+        """Check whether this health manager monitors an amphora."""
+        if not CONF.health_manager.amphora_partitioning:
+            return True
+        return utils.rendezvous_hash_order(
+            amphora_id, self.member_ids)[0] == self.member_id
+
+    def _update_membership_safe(self):
+        try:
+            self.update_membership()
+        except db_exc.DBError as e:
+            LOG.warning('Failed to update the health manager membership: '
+                        '%s', str(e))
+
     def _test_and_set_failover_prov_status(self, lock_session, lb_id):
         if self.lb_repo.set_status_for_failover(lock_session, lb_id,
                                                 constants.PENDING_UPDATE):
@@ -83,6 +134,10 @@ class HealthManager:
             'failover_cancelled': 0,
         }
         futs = []
+        self._update_membership_safe()
+        amphora_filter = None
+        if CONF.health_manager.amphora_partitioning:
+            amphora_filter = self.is_amphora_owner
         while not self.dead.is_set():
             amp_health = None
             lock_session = None
@@ -90,7 +145,7 @@ class HealthManager:
                 lock_session = db_api.get_session()
                 lock_session.begin()
                 amp_health = self.amp_health_repo.get_stale_amphora(
-                    lock_session)
+                    lock_session, amphora_filter=amphora_filter)
                 if amp_health:
                     amp = self.amp_repo.get(lock_session,
                                             id=amp_health.amphora_id)
@@ -142,7 +197,8 @@ class HealthManager:
         if futs:
             LOG.info("Waiting for %s failovers to finish",
                      len(futs))
-            wait_done_or_dead(futs, self.dead)
+            wait_done_or_dead(futs, self.dead,
+                              on_wait=self._update_membership_safe)
         if stats['failover_attempted'] > 0:
             LOG.info("Attempted %s failovers of amphora",
                      stats['failover_attempted'])
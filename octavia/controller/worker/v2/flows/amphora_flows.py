@@ -207,6 +207,9 @@ class AmphoraFlows:
             name=constants.DELETE_AMPHORA + '-' + amphora_id,
             inject={constants.AMPHORA: amphora,
                     constants.PASSIVE_FAILURE: True}))
+        delete_amphora_flow.add(amphora_driver_tasks.AmphoraCloseConnections(
+            name=constants.CLOSE_AMPHORA_CONNECTIONS + '-' + amphora_id,
+            inject={constants.AMPHORA: amphora}))
         delete_amphora_flow.add(database_tasks.DisableAmphoraHealthMonitoring(
             name=constants.DISABLE_AMP_HEALTH_MONITORING + '-' + amphora_id,
             inject={constants.AMPHORA: amphora}))
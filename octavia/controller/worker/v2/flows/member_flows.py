@@ -50,7 +50,7 @@ class MemberFlows:
         create_member_flow.add(amphora_driver_tasks.AmphoraePostNetworkPlug(
             requires=(constants.LOADBALANCER, constants.UPDATED_PORTS,
                       constants.AMPHORAE_NETWORK_CONFIG)))
-        create_member_flow.add(amphora_driver_tasks.ListenersUpdate(
+        create_member_flow.add(amphora_driver_tasks.MembersUpdate(
             requires=constants.LOADBALANCER_ID))
         create_member_flow.add(database_tasks.MarkMemberActiveInDB(
             requires=constants.MEMBER))
@@ -88,7 +88,7 @@ class MemberFlows:
         delete_member_flow.add(amphora_driver_tasks.AmphoraePostNetworkPlug(
             requires=(constants.LOADBALANCER, constants.UPDATED_PORTS,
                       constants.AMPHORAE_NETWORK_CONFIG)))
-        delete_member_flow.add(amphora_driver_tasks.ListenersUpdate(
+        delete_member_flow.add(amphora_driver_tasks.MembersUpdate(
             requires=constants.LOADBALANCER_ID))
         delete_member_flow.add(database_tasks.DeleteMemberInDB(
             requires=constants.MEMBER))
@@ -116,7 +116,7 @@ class MemberFlows:
                       constants.POOL_ID]))
         update_member_flow.add(database_tasks.MarkMemberPendingUpdateInDB(
             requires=constants.MEMBER))
-        update_member_flow.add(amphora_driver_tasks.ListenersUpdate(
+        update_member_flow.add(amphora_driver_tasks.MembersUpdate(
             requires=constants.LOADBALANCER_ID))
         update_member_flow.add(database_tasks.UpdateMemberInDB(
             requires=[constants.MEMBER, constants.UPDATE_DICT]))
@@ -210,7 +210,7 @@ class MemberFlows:
                           constants.AMPHORAE_NETWORK_CONFIG)))
 
         # Update the Listener (this makes the changes active on the Amp)
-        batch_update_members_flow.add(amphora_driver_tasks.ListenersUpdate(
+        batch_update_members_flow.add(amphora_driver_tasks.MembersUpdate(
             requires=constants.LOADBALANCER_ID))
 
         # Mark all the members ACTIVE here, then pool then LB/Listeners
@@ -172,6 +172,22 @@ class ListenersUpdate(BaseAmphoraTask):
                 listener.id)
 
 
+class MembersUpdate(ListenersUpdate):
+    """Task to update amphora with the changes of the members."""
+
+    def execute(self, loadbalancer_id):
+        """Execute the member updates of the amphorae."""
+        session = db_apis.get_session()
+        with session.begin():
+            loadbalancer = self.loadbalancer_repo.get(session,
+                                                      id=loadbalancer_id)
+        if loadbalancer:
+            self.amphora_driver.update_members(loadbalancer)
+        else:
+            LOG.error('Load balancer %s for members update not found. '
+                      'Skipping update.', loadbalancer_id)
+
+
 class ListenersStart(BaseAmphoraTask):
     """Task to start all listeners on the vip."""
 
@@ -276,6 +292,14 @@ class AmphoraGetInfo(BaseAmphoraTask):
         self.amphora_driver.get_info(db_amp)
 
 
+class AmphoraCloseConnections(BaseAmphoraTask):
+    """Task to close the connections to a deleted amphora."""
+
+    def execute(self, amphora):
+        """Execute close_connections routine for an amphora."""
+        self.amphora_driver.close_connections(amphora[constants.ID])
+
+
 class AmphoraGetDiagnostics(BaseAmphoraTask):
     """Task to get diagnostics on the amphora and the loadbalancers."""
 
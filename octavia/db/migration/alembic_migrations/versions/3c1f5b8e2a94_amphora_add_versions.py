@@ -0,0 +1,37 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""amphora add api_version and haproxy_version
+
+Revision ID: 3c1f5b8e2a94
+Revises: 995873883788
+Create Date: 2026-10-19 10:12:31.482913
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3c1f5b8e2a94'
+down_revision = '995873883788'
+
+
+def upgrade():
+    op.add_column(
+        'amphora',
+        sa.Column('api_version', sa.String(16), nullable=True)
+    )
+    op.add_column(
+        'amphora',
+        sa.Column('haproxy_version', sa.String(64), nullable=True)
+    )
@@ -0,0 +1,35 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Add health_manager_member table
+
+Revision ID: 995873883788
+Revises: db2a73e82626
+Create Date: 2024-06-12 10:21:43.108251
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '995873883788'
+down_revision = 'db2a73e82626'
+
+
+def upgrade():
+    op.create_table(
+        'health_manager_member',
+        sa.Column('id', sa.String(255), nullable=False),
+        sa.Column('last_update', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
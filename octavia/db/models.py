@@ -703,6 +703,8 @@ class Amphora(base_models.BASE, base_models.IdMixin, models.TimestampMixin):
     load_balancer = orm.relationship("LoadBalancer", uselist=False,
                                      back_populates='amphorae')
     compute_flavor = sa.Column(sa.String(255), nullable=True)
+    api_version = sa.Column(sa.String(16), nullable=True)
+    haproxy_version = sa.Column(sa.String(64), nullable=True)
 
     def __str__(self):
         return (f"Amphora(id={self.id!r}, load_balancer_id="
@@ -723,6 +725,15 @@ class AmphoraHealth(base_models.BASE):
     busy = sa.Column(sa.Boolean(), default=False, nullable=False)
 
 
+class HealthManagerMember(base_models.BASE):
+    __data_model__ = data_models.HealthManagerMember
+    __tablename__ = "health_manager_member"
+
+    id = sa.Column(sa.String(255), nullable=False, primary_key=True)
+    last_update = sa.Column(sa.DateTime, default=func.now(),
+                            nullable=False)
+
+
 class L7Rule(base_models.BASE, base_models.IdMixin, base_models.ProjectMixin,
              models.TimestampMixin, base_models.TagMixin):
 
@@ -19,6 +19,7 @@ reference
 """
 
 import datetime
+from typing import Callable
 from typing import Optional
 
 from oslo_config import cfg
@@ -1534,11 +1535,16 @@ class AmphoraHealthRepository(BaseRepository):
         # In this case, the amphora is expired.
         return amphora_model is None
 
-    def get_stale_amphora(self,
-                          lock_session: Session) -> Optional[models.Amphora]:
+    def get_stale_amphora(
+            self, lock_session: Session,
+            amphora_filter: Optional[Callable[[str], bool]] = None
+    ) -> Optional[models.Amphora]:
         """Retrieves a stale amphora from the health manager database.
 
         :param lock_session: A Sql Alchemy database autocommit session.
+        :param amphora_filter: An optional function called with the ID of
+                               each stale amphora, only the amphorae for
+                               which it returns True are retrieved.
         :returns: [octavia.common.data_model]
         """
         timeout = CONF.health_manager.heartbeat_timeout
@@ -1585,13 +1591,23 @@ class AmphoraHealthRepository(BaseRepository):
                     [consts.AMPHORA_ALLOCATED,
                      consts.AMPHORA_FAILOVER_STOPPED])))
 
+        if amphora_filter is not None:
+            expired_amp_ids = [
+                amp_id for amp_id in lock_session.scalars(
+                    select(expired_ids_query.c.amphora_id))
+                if amphora_filter(amp_id)]
+            if not expired_amp_ids:
+                return None
+        else:
+            expired_amp_ids = expired_ids_query
+
         # Pick one expired amphora for automatic failover
         amp_health = lock_session.query(
             self.model_class
         ).populate_existing(
         ).with_for_update(
         ).filter(
-            self.model_class.amphora_id.in_(expired_ids_query)
+            self.model_class.amphora_id.in_(expired_amp_ids)
         ).filter(
             self.model_class.amphora_id.in_(allocated_amp_ids_subquery)
         ).order_by(
@@ -1630,6 +1646,35 @@ class AmphoraHealthRepository(BaseRepository):
             ).execution_options(synchronize_session="fetch"))
 
 
+class HealthManagerMemberRepository(BaseRepository):
+    model_class = models.HealthManagerMember
+
+    def replace(self, session, member_id, **model_kwargs):
+        """Replace or insert a health manager member into the database."""
+        count = session.query(self.model_class).filter_by(
+            id=member_id).count()
+        if count:
+            session.query(self.model_class).filter_by(
+                id=member_id).update(model_kwargs,
+                                     synchronize_session=False)
+        else:
+            model_kwargs['id'] = member_id
+            self.create(session, **model_kwargs)
+
+    def get_live_member_ids(self, session, expired_time):
+        """Get the IDs of the health managers that are alive.
+
+        :param session: A Sql Alchemy database session.
+        :param expired_time: The health managers that did not update their
+                             record since this time are considered dead.
+        :returns: A sorted list of health manager IDs.
+        """
+        return list(session.scalars(
+            select(self.model_class.id).where(
+                self.model_class.last_update >= expired_time
+            ).order_by(self.model_class.id)))
+
+
 class VRRPGroupRepository(BaseRepository):
     model_class = models.VRRPGroup
 
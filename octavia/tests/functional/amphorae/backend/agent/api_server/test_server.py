@@ -12,6 +12,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import gzip
+import hashlib
 import os
 import random
 import socket
@@ -142,16 +145,15 @@ class TestServerTestCase(base.TestCase):
                 '/var/lib/octavia/123/haproxy.cfg.new',
                 '/var/lib/octavia/123/haproxy.cfg')
 
-        if init_system == consts.INIT_SYSTEMD:
-            mock_subprocess.assert_any_call(
-                "systemctl enable haproxy-123".split(),
-                stderr=subprocess.STDOUT)
-        elif init_system == consts.INIT_SYSVINIT:
-            mock_subprocess.assert_any_call(
-                "insserv /etc/init.d/haproxy-123".split(),
-                stderr=subprocess.STDOUT)
-        else:
-            self.assertIn(init_system, consts.VALID_INIT_SYSTEMS)
+        # The init file exists, the service was already enabled
+        self.assertNotIn(
+            mock.call("systemctl enable haproxy-123".split(),
+                      stderr=subprocess.STDOUT),
+            mock_subprocess.mock_calls)
+        self.assertNotIn(
+            mock.call("insserv /etc/init.d/haproxy-123".split(),
+                      stderr=subprocess.STDOUT),
+            mock_subprocess.mock_calls)
 
         # exception writing
         m = self.useFixture(test_utils.OpenFixture(file_name)).mock_open
@@ -211,6 +213,17 @@ class TestServerTestCase(base.TestCase):
             # skip the template stuff
             mock_makedirs.assert_called_with('/var/lib/octavia/123')
 
+        if init_system == consts.INIT_SYSTEMD:
+            mock_subprocess.assert_any_call(
+                "systemctl enable haproxy-123".split(),
+                stderr=subprocess.STDOUT)
+        elif init_system == consts.INIT_SYSVINIT:
+            mock_subprocess.assert_any_call(
+                "insserv /etc/init.d/haproxy-123".split(),
+                stderr=subprocess.STDOUT)
+        else:
+            self.assertIn(init_system, consts.VALID_INIT_SYSTEMS)
+
         # unhappy case haproxy check fails
         mock_exists.return_value = True
         mock_subprocess.side_effect = [subprocess.CalledProcessError(
@@ -265,6 +278,330 @@ class TestServerTestCase(base.TestCase):
                                          data='test')
             self.assertEqual(500, rv.status_code)
 
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'get_os_init_system', return_value=consts.INIT_SYSTEMD)
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_compatibility.get_haproxy_versions',
+                return_value=(2, 8))
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_runtime.apply_member_changes')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._get_running_config')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'set_running_config_md5')
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch('os.rename')
+    @mock.patch('subprocess.check_output')
+    def test_haproxy_member_changes(self, mock_subprocess, mock_rename,
+                                    mock_exists, mock_set_running_md5,
+                                    mock_get_running_config,
+                                    mock_apply_changes, mock_get_version,
+                                    mock_init_system):
+        file_name = '/var/lib/octavia/123/haproxy.cfg.new'
+        m = self.useFixture(test_utils.OpenFixture(file_name)).mock_open
+        new_md5 = hashlib.md5(b'new config').hexdigest()  # nosec
+
+        # The running configuration only differs by members
+        mock_get_running_config.return_value = 'running config'
+        mock_apply_changes.return_value = True
+        with mock.patch('os.open'), mock.patch.object(os, 'fdopen', m):
+            rv = self.ubuntu_app.put('/' + api_server.VERSION +
+                                     '/loadbalancer/amp_123/123/haproxy',
+                                     data='new config')
+        self.assertEqual(202, rv.status_code)
+        mock_apply_changes.assert_called_once_with(
+            '123', 'running config', 'new config')
+        mock_subprocess.assert_not_called()
+        mock_rename.assert_called_once_with(
+            file_name, '/var/lib/octavia/123/haproxy.cfg')
+        mock_set_running_md5.assert_has_calls([
+            mock.call('123', None), mock.call('123', new_md5)])
+
+        # The configuration is already running
+        mock_apply_changes.reset_mock()
+        mock_set_running_md5.reset_mock()
+        mock_get_running_config.return_value = 'new config'
+        with mock.patch('os.open'), mock.patch.object(os, 'fdopen', m):
+            rv = self.ubuntu_app.put('/' + api_server.VERSION +
+                                     '/loadbalancer/amp_123/123/haproxy',
+                                     data='new config')
+        self.assertEqual(202, rv.status_code)
+        mock_apply_changes.assert_not_called()
+        mock_subprocess.assert_not_called()
+        mock_set_running_md5.assert_called_once_with('123', new_md5)
+
+        # The changes can't be applied at runtime, the configuration is
+        # validated
+        mock_rename.reset_mock()
+        mock_set_running_md5.reset_mock()
+        mock_get_running_config.return_value = 'running config'
+        mock_apply_changes.return_value = False
+        with mock.patch('os.open'), mock.patch.object(os, 'fdopen', m):
+            rv = self.ubuntu_app.put('/' + api_server.VERSION +
+                                     '/loadbalancer/amp_123/123/haproxy',
+                                     data='new config')
+        self.assertEqual(202, rv.status_code)
+        mock_subprocess.assert_called_once_with(
+            "haproxy -c -L {peer} -f {config_file} -f {haproxy_ug}".format(
+                config_file=file_name,
+                haproxy_ug=consts.HAPROXY_USER_GROUP_CFG,
+                peer=(octavia_utils.
+                      base64_sha1_string('amp_123').rstrip('='))).split(),
+            stderr=-2)
+        mock_set_running_md5.assert_called_once_with('123', None)
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_compatibility.get_haproxy_versions',
+                return_value=(2, 8))
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_runtime.apply_member_changes')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._get_running_config')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'set_running_config_md5')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'get_loadbalancers', return_value=['123'])
+    @mock.patch('os.rename')
+    @mock.patch('subprocess.check_output')
+    def test_haproxy_update_members(self, mock_subprocess, mock_rename,
+                                    mock_get_lbs, mock_set_running_md5,
+                                    mock_get_running_config,
+                                    mock_apply_changes, mock_get_version):
+        file_name = '/var/lib/octavia/123/haproxy.cfg.new'
+        m = self.useFixture(test_utils.OpenFixture(file_name)).mock_open
+        new_md5 = hashlib.md5(b'new config').hexdigest()  # nosec
+        url = '/' + api_server.VERSION + '/loadbalancer/amp_123/123/haproxy'
+
+        mock_get_running_config.return_value = 'running config'
+        mock_apply_changes.return_value = True
+        with mock.patch('os.open'), mock.patch.object(os, 'fdopen', m):
+            rv = self.ubuntu_app.put(url + '/members', data='new config')
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual(new_md5, rv.headers['ETag'])
+        mock_apply_changes.assert_called_once_with(
+            '123', 'running config', 'new config')
+        mock_rename.assert_called_once_with(
+            file_name, '/var/lib/octavia/123/haproxy.cfg')
+        mock_set_running_md5.assert_has_calls([
+            mock.call('123', None), mock.call('123', new_md5)])
+        mock_subprocess.assert_not_called()
+
+        # The changes require a reload, the configuration is not saved
+        mock_rename.reset_mock()
+        mock_set_running_md5.reset_mock()
+        mock_apply_changes.return_value = False
+        with mock.patch('os.open'), mock.patch.object(os, 'fdopen', m):
+            rv = self.ubuntu_app.put(url + '/members', data='new config')
+        self.assertEqual(409, rv.status_code)
+        mock_rename.assert_not_called()
+        mock_set_running_md5.assert_called_once_with('123', None)
+
+        # HAProxy is not running the current configuration
+        mock_apply_changes.reset_mock()
+        mock_get_running_config.return_value = None
+        rv = self.ubuntu_app.put(url + '/members', data='new config')
+        self.assertEqual(409, rv.status_code)
+        mock_apply_changes.assert_not_called()
+        mock_rename.assert_not_called()
+
+        # Unknown load balancer
+        rv = self.ubuntu_app.put('/' + api_server.VERSION +
+                                 '/loadbalancer/amp_123/456/haproxy/members',
+                                 data='new config')
+        self.assertEqual(404, rv.status_code)
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer.start_stop_lb')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._upload_haproxy_config')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._write_certificate')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._get_certificate_md5')
+    def test_upload_bundle(self, mock_get_cert_md5, mock_write_cert,
+                           mock_upload_config, mock_start_stop):
+        url = '/' + api_server.VERSION + '/loadbalancer/amp_123/123/bundle'
+        cert_md5 = hashlib.md5(b'cert').hexdigest()  # nosec
+        crt_list_md5 = hashlib.md5(b'crt-list').hexdigest()  # nosec
+        bundle = {'certificates': {'cert.pem': cert_md5,
+                                   'listener.pem': crt_list_md5},
+                  'config': 'the config',
+                  'reload': True}
+        mock_get_cert_md5.side_effect = lambda lb_id, name: (
+            crt_list_md5 if name == 'listener.pem' else None)
+        mock_upload_config.return_value = webob.Response(status=202)
+        mock_start_stop.return_value = webob.Response(
+            json={'message': 'OK'}, status=202)
+
+        # A certificate is missing, nothing is updated
+        rv = self.ubuntu_app.put(url, json=bundle)
+        self.assertEqual(409, rv.status_code)
+        self.assertEqual(
+            {'message': 'Missing certificates', 'missing': [cert_md5]},
+            jsonutils.loads(rv.data.decode('utf-8')))
+        mock_write_cert.assert_not_called()
+        mock_upload_config.assert_not_called()
+        mock_start_stop.assert_not_called()
+
+        # The missing certificate is sent
+        bundle['contents'] = {
+            cert_md5: base64.b64encode(b'cert').decode('utf-8')}
+        rv = self.ubuntu_app.put(url, json=bundle)
+        self.assertEqual(202, rv.status_code)
+        mock_write_cert.assert_called_once_with('123', 'cert.pem', b'cert')
+        mock_upload_config.assert_called_once_with(
+            'amp_123', '123', mock.ANY)
+        self.assertEqual(b'the config',
+                         mock_upload_config.call_args[0][2].read(1024))
+        mock_start_stop.assert_called_once_with('123',
+                                                consts.AMP_ACTION_RELOAD)
+
+        # The content does not match its md5sum
+        mock_write_cert.reset_mock()
+        bundle['contents'] = {
+            cert_md5: base64.b64encode(b'other').decode('utf-8')}
+        rv = self.ubuntu_app.put(url, json=bundle)
+        self.assertEqual(400, rv.status_code)
+        mock_write_cert.assert_not_called()
+
+        # Invalid bundle
+        rv = self.ubuntu_app.put(url, json={'certificates': {'../x': 'y'}})
+        self.assertEqual(400, rv.status_code)
+
+        # A gzip encoded bundle
+        mock_upload_config.reset_mock()
+        bundle['contents'] = {
+            cert_md5: base64.b64encode(b'cert').decode('utf-8')}
+        headers = {'Content-Type': 'application/json',
+                   'Content-Encoding': 'gzip'}
+        rv = self.ubuntu_app.put(
+            url, data=gzip.compress(jsonutils.dump_as_bytes(bundle)),
+            headers=headers)
+        self.assertEqual(202, rv.status_code)
+        self.assertEqual(b'the config',
+                         mock_upload_config.call_args[0][2].read(1024))
+
+        # Invalid gzip content
+        rv = self.ubuntu_app.put(url, data=b'not gzip', headers=headers)
+        self.assertEqual(400, rv.status_code)
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_compatibility.get_haproxy_versions',
+                return_value=(2, 8))
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'get_os_init_system', return_value=consts.INIT_SYSTEMD)
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'init_path')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'send_vip_advertisements')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._check_haproxy_status',
+                return_value=consts.ACTIVE)
+    @mock.patch('subprocess.check_output')
+    @mock.patch('octavia.amphorae.backends.utils.haproxy_query.HAProxyQuery')
+    def test_upload_bundle_certificate_rotation(
+            self, mock_haproxy_query, mock_subprocess, mock_haproxy_status,
+            mock_vip_advertisements, mock_init_path, mock_init_system,
+            mock_get_version):
+        base_path = self.useFixture(fixtures.TempDir()).path
+        self.conf.config(group="haproxy_amphora", base_path=base_path,
+                         base_cert_dir=os.path.join(base_path, 'certs'))
+        mock_init_path.return_value = os.path.join(base_path, 'service')
+        for path, content in ((mock_init_path.return_value, 'service'),
+                              (util.config_path('123'), 'the config'),
+                              (os.path.join(base_path, 'certs', '123',
+                                            'listener.pem'), 'old cert')):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        util.set_running_config_md5(
+            '123', hashlib.md5(b'the config').hexdigest())  # nosec
+        url = '/' + api_server.VERSION + '/loadbalancer/amp_123/123/bundle'
+        bundle = {'certificates': {
+            'listener.pem': hashlib.md5(b'old cert').hexdigest()},  # nosec
+            'config': 'the config',
+            'reload': True}
+
+        # Nothing changed, HAProxy is not reloaded
+        rv = self.ubuntu_app.put(url, json=bundle)
+        self.assertEqual(202, rv.status_code)
+        mock_subprocess.assert_not_called()
+
+        # Only the certificate is rotated
+        new_md5 = hashlib.md5(b'new cert').hexdigest()  # nosec
+        bundle['certificates']['listener.pem'] = new_md5
+        bundle['contents'] = {
+            new_md5: base64.b64encode(b'new cert').decode('utf-8')}
+        rv = self.ubuntu_app.put(url, json=bundle)
+        self.assertEqual(202, rv.status_code)
+        mock_subprocess.assert_called_with(
+            ['/usr/sbin/service', 'haproxy-123', 'reload'], stderr=-2)
+        self.assertEqual(
+            new_md5,
+            self.ubuntu_test_server._loadbalancer._get_certificate_md5(
+                '123', 'listener.pem'))
+        running_md5 = util.get_running_config_md5('123')
+        self.assertIsNotNone(running_md5)
+
+        # The configuration is rejected, the certificates are restored
+        other_md5 = hashlib.md5(b'other cert').hexdigest()  # nosec
+        bundle['certificates'] = {'listener.pem': other_md5,
+                                  'new.pem': other_md5}
+        bundle['contents'] = {
+            other_md5: base64.b64encode(b'other cert').decode('utf-8')}
+        bundle['config'] = 'invalid config'
+        mock_subprocess.side_effect = subprocess.CalledProcessError(
+            1, 'haproxy', b'invalid')
+        rv = self.ubuntu_app.put(url, json=bundle)
+        self.assertEqual(400, rv.status_code)
+        self.assertEqual(
+            new_md5,
+            self.ubuntu_test_server._loadbalancer._get_certificate_md5(
+                '123', 'listener.pem'))
+        self.assertFalse(os.path.exists(
+            os.path.join(base_path, 'certs', '123', 'new.pem')))
+        self.assertEqual(running_md5, util.get_running_config_md5('123'))
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'amphora_info.AmphoraInfo.invalidate')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'amphora_info.AmphoraInfo.compile_amphora_info',
+                return_value=webob.Response(json={'api_version': '1.0'}))
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer.start_stop_lb',
+                return_value=webob.Response(json={'message': 'OK'},
+                                            status=202))
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'get_backend_for_lb_object',
+                return_value=consts.HAPROXY_BACKEND)
+    def test_update_lock(self, mock_get_backend, mock_start_stop, mock_info,
+                         mock_invalidate):
+        mock_lock = mock.MagicMock()
+        self.ubuntu_test_server._update_lock = mock_lock
+
+        # The read-only requests don't wait for the updates
+        rv = self.ubuntu_app.get('/' + api_server.VERSION + '/info')
+        self.assertEqual(200, rv.status_code)
+        mock_lock.acquire.assert_not_called()
+        mock_lock.release.assert_not_called()
+
+        rv = self.ubuntu_app.put('/' + api_server.VERSION +
+                                 '/loadbalancer/123/reload')
+        self.assertEqual(202, rv.status_code)
+        mock_lock.acquire.assert_called_once_with()
+        mock_lock.release.assert_called_once_with()
+        # The updates invalidate the cached amphora details
+        mock_invalidate.assert_called_once_with()
+
+        # The lock is released if the request fails
+        mock_lock.reset_mock()
+        mock_start_stop.side_effect = Exception('boom')
+        rv = self.ubuntu_app.put('/' + api_server.VERSION +
+                                 '/loadbalancer/123/reload')
+        self.assertEqual(500, rv.status_code)
+        mock_lock.acquire.assert_called_once_with()
+        mock_lock.release.assert_called_once_with()
+
     def test_ubuntu_start(self):
         self._test_start(consts.UBUNTU)
 
@@ -397,6 +734,48 @@ class TestServerTestCase(base.TestCase):
         mock_subprocess.assert_called_with(
             ['/usr/sbin/service', 'haproxy-123', 'start'], stderr=-2)
 
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_compatibility.get_haproxy_versions',
+                return_value=(2, 8))
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'send_vip_advertisements')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._check_haproxy_status',
+                return_value=consts.ACTIVE)
+    @mock.patch('subprocess.check_output')
+    @mock.patch('octavia.amphorae.backends.utils.haproxy_query.HAProxyQuery')
+    def test_reload_after_certificate_upload(self, mock_haproxy_query,
+                                             mock_subprocess,
+                                             mock_haproxy_status,
+                                             mock_vip_advertisements,
+                                             mock_get_version):
+        base_path = self.useFixture(fixtures.TempDir()).path
+        self.conf.config(group="haproxy_amphora", base_path=base_path,
+                         base_cert_dir=os.path.join(base_path, 'certs'))
+        os.makedirs(util.haproxy_dir('123'))
+        with open(util.config_path('123'), 'w', encoding='utf-8') as f:
+            f.write('the config')
+        util.set_running_config_md5(
+            '123', hashlib.md5(b'the config').hexdigest())  # nosec
+        url = '/' + api_server.VERSION + '/loadbalancer/'
+
+        # The configuration is already loaded by HAProxy
+        rv = self.ubuntu_app.put(url + 'amp_123/123/haproxy',
+                                 data='the config')
+        self.assertEqual(202, rv.status_code)
+        mock_subprocess.assert_not_called()
+
+        # The certificate is updated, the configuration is unchanged
+        rv = self.ubuntu_app.put(url + '123/certificates/test.pem',
+                                 data='new cert')
+        self.assertEqual(200, rv.status_code)
+        self.assertIsNone(util.get_running_config_md5('123'))
+
+        rv = self.ubuntu_app.put(url + '123/reload')
+        self.assertEqual(202, rv.status_code)
+        mock_subprocess.assert_called_once_with(
+            ['/usr/sbin/service', 'haproxy-123', 'reload'], stderr=-2)
+
     def test_ubuntu_info(self):
         self._test_info(consts.UBUNTU)
 
@@ -426,6 +805,34 @@ class TestServerTestCase(base.TestCase):
             hostname='test-host'),
             jsonutils.loads(rv.data.decode('utf-8')))
 
+    @mock.patch('octavia.amphorae.backends.agent.api_server.osutils.'
+                'BaseOS.get_package_database_stamp',
+                return_value=(('/var/lib/dpkg/status', 1, 2, 3),))
+    @mock.patch('socket.gethostname', return_value='test-host')
+    @mock.patch('subprocess.check_output', return_value='9.9.99-9')
+    def test_info_if_none_match(self, mock_subprocess, mock_hostname,
+                                mock_get_stamp):
+        rv = self.ubuntu_app.get('/' + api_server.VERSION + '/info')
+        self.assertEqual(200, rv.status_code)
+        etag = rv.headers['ETag']
+
+        rv = self.ubuntu_app.get('/' + api_server.VERSION + '/info',
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(304, rv.status_code)
+        self.assertEqual(b'', rv.data)
+        # The versions of the packages are cached
+        self.assertEqual(3, mock_subprocess.call_count)
+
+        # The package was upgraded
+        mock_get_stamp.return_value = (('/var/lib/dpkg/status', 1, 2, 4),)
+        mock_subprocess.return_value = '9.9.99-10'
+        rv = self.ubuntu_app.get('/' + api_server.VERSION + '/info',
+                                 headers={'If-None-Match': etag})
+        self.assertEqual(200, rv.status_code)
+        self.assertNotEqual(etag, rv.headers['ETag'])
+        self.assertEqual('9.9.99-10', jsonutils.loads(
+            rv.data.decode('utf-8'))['haproxy_version'])
+
     @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
                 'get_backend_for_lb_object', return_value='HAPROXY')
     @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
@@ -809,8 +1216,10 @@ class TestServerTestCase(base.TestCase):
                 '/loadbalancer/123/certificates/test.pem')
         self.assertEqual(200, rv.status_code)
         self.assertEqual(OK, jsonutils.loads(rv.data.decode('utf-8')))
-        mock_remove.assert_called_once_with(
-            '/var/lib/octavia/certs/123/test.pem')
+        # HAProxy has to be reloaded after the removal
+        mock_remove.assert_has_calls([
+            mock.call('/var/lib/octavia/certs/123/test.pem'),
+            mock.call('/var/lib/octavia/123/haproxy.cfg.running')])
 
     def test_ubuntu_get_certificate_md5(self):
         self._test_get_certificate_md5(consts.UBUNTU)
@@ -2969,6 +3378,7 @@ class TestServerTestCase(base.TestCase):
         expected_dict = {'active': True,
                          'active_tuned_profiles': tuned_profiles,
                          'api_version': '1.0',
+                         'content_encodings': ['gzip'],
                          'cpu': {'soft_irq': cpu_softirq, 'system': cpu_system,
                                  'total': cpu_total, 'user': cpu_user},
                          'cpu_count': os.cpu_count(),
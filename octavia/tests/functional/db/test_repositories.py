@@ -60,6 +60,8 @@ class BaseRepositoryTest(base.OctaviaDBTestBase):
         self.sni_repo = repo.SNIRepository()
         self.amphora_repo = repo.AmphoraRepository()
         self.amphora_health_repo = repo.AmphoraHealthRepository()
+        self.health_manager_member_repo = (
+            repo.HealthManagerMemberRepository())
         self.vrrp_group_repo = repo.VRRPGroupRepository()
         self.l7policy_repo = repo.L7PolicyRepository()
         self.l7rule_repo = repo.L7RuleRepository()
@@ -3957,6 +3959,29 @@ class AmphoraHealthRepositoryTest(BaseRepositoryTest):
             self.session)
         self.assertEqual(uuid, stale_amphora.amphora_id)
 
+    def test_get_stale_amphora_with_filter(self):
+        uuids = []
+        for _ in range(3):
+            uuid = uuidutils.generate_uuid()
+            uuids.append(uuid)
+            self.create_amphora(uuid)
+            self.amphora_repo.update(self.session, uuid,
+                                     status=constants.AMPHORA_ALLOCATED)
+            self.create_amphora_health(uuid)
+
+        stale_amphora = self.amphora_health_repo.get_stale_amphora(
+            self.session, amphora_filter=lambda amp_id: False)
+        self.assertIsNone(stale_amphora)
+
+        stale_amphora = self.amphora_health_repo.get_stale_amphora(
+            self.session, amphora_filter=lambda amp_id: amp_id == uuids[1])
+        self.assertEqual(uuids[1], stale_amphora.amphora_id)
+
+        # The amphora is now busy
+        stale_amphora = self.amphora_health_repo.get_stale_amphora(
+            self.session, amphora_filter=lambda amp_id: amp_id == uuids[1])
+        self.assertIsNone(stale_amphora)
+
     def test_get_stale_amphora_past_threshold(self):
         conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
         conf.config(group='health_manager', failover_threshold=3)
@@ -4064,6 +4089,34 @@ class AmphoraHealthRepositoryTest(BaseRepositoryTest):
             self.session, amphora_id=amphora_health.amphora_id))
 
 
+class HealthManagerMemberRepositoryTest(BaseRepositoryTest):
+
+    def test_replace(self):
+        now = datetime.datetime.utcnow()
+        self.health_manager_member_repo.replace(self.session, 'hm1',
+                                                last_update=now)
+        obj = self.health_manager_member_repo.get(self.session, id='hm1')
+        self.assertEqual(now, obj.last_update)
+
+        now += datetime.timedelta(seconds=10)
+        self.health_manager_member_repo.replace(self.session, 'hm1',
+                                                last_update=now)
+        obj = self.health_manager_member_repo.get(self.session, id='hm1')
+        self.assertEqual(now, obj.last_update)
+
+    def test_get_live_member_ids(self):
+        now = datetime.datetime.utcnow()
+        for member_id, age in (('hm3', 0), ('hm1', 10), ('hm2', 120)):
+            self.health_manager_member_repo.replace(
+                self.session, member_id,
+                last_update=now - datetime.timedelta(seconds=age))
+
+        self.assertEqual(
+            ['hm1', 'hm3'],
+            self.health_manager_member_repo.get_live_member_ids(
+                self.session, now - datetime.timedelta(seconds=60)))
+
+
 class VRRPGroupRepositoryTest(BaseRepositoryTest):
     def setUp(self):
         super().setUp()
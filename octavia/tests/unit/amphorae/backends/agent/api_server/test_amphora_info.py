@@ -73,28 +73,26 @@ class TestAmphoraInfo(base.TestCase):
         else:
             return self.HAPROXY_VERSION
 
-    @mock.patch.object(amphora_info, "webob")
     @mock.patch('octavia.amphorae.backends.agent.api_server.'
                 'amphora_info.AmphoraInfo._get_version_of_installed_package',
                 return_value=HAPROXY_VERSION)
     @mock.patch('socket.gethostname', return_value='FAKE_HOST')
-    def test_compile_amphora_info(self, mock_gethostname, mock_pkg_version,
-                                  mock_webob):
+    def test_compile_amphora_info(self, mock_gethostname, mock_pkg_version):
         original_version = api_server.VERSION
         api_server.VERSION = self.API_VERSION
         expected_dict = {'api_version': self.API_VERSION,
                          'hostname': 'FAKE_HOST',
                          'haproxy_version': self.HAPROXY_VERSION}
-        self.amp_info.compile_amphora_info()
-        mock_webob.Response.assert_called_once_with(json=expected_dict)
+        actual = self.amp_info.compile_amphora_info()
+        self.assertEqual(expected_dict, actual.json)
+        self.assertIsNotNone(actual.etag)
         api_server.VERSION = original_version
 
-    @mock.patch.object(amphora_info, "webob")
     @mock.patch('octavia.amphorae.backends.agent.api_server.'
                 'amphora_info.AmphoraInfo._get_version_of_installed_package')
     @mock.patch('socket.gethostname', return_value='FAKE_HOST')
     def test_compile_amphora_info_for_udp(self, mock_gethostname,
-                                          mock_pkg_version, mock_webob):
+                                          mock_pkg_version):
 
         mock_pkg_version.side_effect = self._return_version
         self.lvs_driver.get_subscribed_amp_compile_info.side_effect = [
@@ -107,8 +105,9 @@ class TestAmphoraInfo(base.TestCase):
                          'keepalived_version': self.KEEPALIVED_VERSION,
                          'ipvsadm_version': self.IPVSADM_VERSION
                          }
-        self.amp_info.compile_amphora_info(extend_lvs_driver=self.lvs_driver)
-        mock_webob.Response.assert_called_once_with(json=expected_dict)
+        actual = self.amp_info.compile_amphora_info(
+            extend_lvs_driver=self.lvs_driver)
+        self.assertEqual(expected_dict, actual.json)
         api_server.VERSION = original_version
 
     @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
@@ -158,6 +157,7 @@ class TestAmphoraInfo(base.TestCase):
         expected_dict = {'active': True,
                          'active_tuned_profiles': '',
                          'api_version': self.API_VERSION,
+                         'content_encodings': ['gzip'],
                          'cpu': {'soft_irq': '8336',
                                  'system': '52554',
                                  'total': 7503411,
@@ -246,6 +246,7 @@ class TestAmphoraInfo(base.TestCase):
         expected_dict = {'active': True,
                          'active_tuned_profiles': '',
                          'api_version': self.API_VERSION,
+                         'content_encodings': ['gzip'],
                          'cpu': {'soft_irq': '8336',
                                  'system': '52554',
                                  'total': 7503411,
@@ -321,6 +322,45 @@ class TestAmphoraInfo(base.TestCase):
             self.lvs_driver)
         self.assertEqual(expected, actual)
 
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'amphora_info.AmphoraInfo._get_version_of_installed_package')
+    def test__get_package_version(self, m_get_version):
+        m_get_version.side_effect = ['1.0', '1.1', '1.2', '1.3']
+        get_stamp = self.osutils_mock.get_package_database_stamp
+        get_stamp.return_value = ('/var/lib/dpkg/status', 1, 2, 3)
+
+        self.assertEqual('1.0', self.amp_info._get_package_version('haproxy'))
+        self.assertEqual('1.0', self.amp_info._get_package_version('haproxy'))
+        m_get_version.assert_called_once_with('haproxy')
+
+        # The package database changed
+        get_stamp.return_value = ('/var/lib/dpkg/status', 1, 2, 4)
+        self.assertEqual('1.1', self.amp_info._get_package_version('haproxy'))
+
+        # The package database is unknown
+        get_stamp.return_value = None
+        self.assertEqual('1.2', self.amp_info._get_package_version('haproxy'))
+        self.assertEqual('1.3', self.amp_info._get_package_version('haproxy'))
+
+    @mock.patch('time.monotonic')
+    def test__get_cached(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        compute = mock.Mock(side_effect=['a', 'b', 'c'])
+
+        self.assertEqual('a', self.amp_info._get_cached('name', compute))
+        self.assertEqual('a', self.amp_info._get_cached('name', compute))
+        compute.assert_called_once_with()
+
+        self.amp_info.invalidate()
+        self.assertEqual('b', self.amp_info._get_cached('name', compute))
+
+        mock_monotonic.return_value = 105
+        self.assertEqual('b', self.amp_info._get_cached('name', compute,
+                                                        max_age=10))
+        mock_monotonic.return_value = 110
+        self.assertEqual('c', self.amp_info._get_cached('name', compute,
+                                                        max_age=10))
+
     def test__get_meminfo(self):
         # Known data test
         meminfo = ('MemTotal:       21692784 kB\n'
@@ -0,0 +1,220 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from unittest import mock
+
+from octavia.amphorae.backends.agent.api_server import haproxy_runtime
+import octavia.tests.unit.base as base
+
+CONFIG = (
+    "global\n"
+    "    daemon\n"
+    "    stats socket /var/lib/octavia/lb1.sock mode 0666 level user\n\n"
+    "frontend listener1\n"
+    "    bind 10.0.0.2:80\n"
+    "    default_backend pool1:listener1\n\n"
+    "backend pool1:listener1\n"
+    "    mode http\n"
+    "    balance roundrobin\n"
+    "{servers}\n"
+    "backend prometheus-exporter-internal\n"
+    "    server prometheus-internal 127.0.0.1:9102\n")
+
+MEMBER1 = ("    server member1 192.0.2.10:80 weight {weight} check inter 30s "
+           "fall 3 rise 2{disabled}\n")
+MEMBER2 = ("    server member2 2001:db8::10:8080 weight 5 check inter 30s "
+           "fall 3 rise 2\n")
+
+
+def _config(*members, weight=1, disabled=''):
+    return CONFIG.format(servers=''.join(members).format(
+        weight=weight, disabled=disabled))
+
+
+class HAProxyRuntimeTestCase(base.TestCase):
+
+    def test_parse_servers(self):
+        base_config, backends = haproxy_runtime.parse_servers(
+            _config(MEMBER1, MEMBER2, disabled=' disabled'))
+
+        self.assertNotIn('server ', base_config)
+        self.assertIn('backend prometheus-exporter-internal', base_config)
+        self.assertEqual(['pool1:listener1', 'prometheus-exporter-internal'],
+                         list(backends))
+        member1 = backends['pool1:listener1']['member1']
+        self.assertEqual('192.0.2.10:80', member1.address)
+        self.assertEqual('1', member1.weight)
+        self.assertTrue(member1.disabled)
+        self.assertEqual(['check', 'inter', '30s', 'fall', '3', 'rise', '2'],
+                         member1.static_options)
+        self.assertFalse(backends['pool1:listener1']['member2'].disabled)
+
+    def test_get_member_commands(self):
+        running = _config(MEMBER1, MEMBER2)
+
+        self.assertEqual([], haproxy_runtime.get_member_commands(
+            running, running))
+
+        self.assertEqual(
+            ['set server pool1:listener1/member1 weight 7',
+             'set server pool1:listener1/member1 state maint'],
+            haproxy_runtime.get_member_commands(
+                running, _config(MEMBER1, MEMBER2, weight=7,
+                                 disabled=' disabled')))
+
+        self.assertEqual(
+            ['set server pool1:listener1/member2 addr 2001:db8::20 '
+             'port 8080'],
+            haproxy_runtime.get_member_commands(
+                running, _config(MEMBER1, MEMBER2.replace('::10', '::20'))))
+
+        # Drain
+        self.assertEqual(
+            ['set server pool1:listener1/member1 weight 0'],
+            haproxy_runtime.get_member_commands(
+                running, _config(MEMBER1, MEMBER2, weight=0)))
+
+        # A change of the other sections requires a reload
+        self.assertIsNone(haproxy_runtime.get_member_commands(
+            running, _config(MEMBER1, MEMBER2).replace('roundrobin',
+                                                       'leastconn')))
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_compatibility.get_haproxy_versions')
+    def test_get_member_commands_dynamic_servers(self, mock_get_versions):
+        mock_get_versions.return_value = (2, 8)
+
+        self.assertEqual(
+            ['add server pool1:listener1/member2 2001:db8::10:8080 weight 5 '
+             'check inter 30s fall 3 rise 2',
+             'enable health pool1:listener1/member2',
+             'set server pool1:listener1/member2 state ready'],
+            haproxy_runtime.get_member_commands(
+                _config(MEMBER1), _config(MEMBER1, MEMBER2)))
+
+        self.assertEqual(
+            ['set server pool1:listener1/member2 state maint',
+             'del server pool1:listener1/member2'],
+            haproxy_runtime.get_member_commands(
+                _config(MEMBER1, MEMBER2), _config(MEMBER1)))
+
+        # Disabled dynamic servers are kept in maintenance
+        self.assertEqual(
+            ['add server pool1:listener1/member1 192.0.2.10:80 weight 1 '
+             'check inter 30s fall 3 rise 2',
+             'enable health pool1:listener1/member1'],
+            haproxy_runtime.get_member_commands(
+                _config(), _config(MEMBER1, disabled=' disabled')))
+
+        # The servers are replaced when their other options change
+        self.assertEqual(
+            ['set server pool1:listener1/member2 state maint',
+             'del server pool1:listener1/member2',
+             'add server pool1:listener1/member2 2001:db8::10:8080 weight 5 '
+             'check inter 30s fall 3 rise 2 backup',
+             'enable health pool1:listener1/member2',
+             'set server pool1:listener1/member2 state ready'],
+            haproxy_runtime.get_member_commands(
+                _config(MEMBER1, MEMBER2),
+                _config(MEMBER1, MEMBER2.replace('2\n', '2 backup\n'))))
+
+        mock_get_versions.return_value = (2, 4)
+        self.assertIsNone(haproxy_runtime.get_member_commands(
+            _config(MEMBER1), _config(MEMBER1, MEMBER2)))
+        self.assertIsNone(haproxy_runtime.get_member_commands(
+            _config(MEMBER1, MEMBER2),
+            _config(MEMBER1, MEMBER2.replace('30s', '10s'))))
+
+    @mock.patch('octavia.amphorae.backends.utils.haproxy_query.HAProxyQuery')
+    def test_apply_member_changes(self, mock_haproxy_query):
+        mock_run_command = mock_haproxy_query.return_value.run_command
+        mock_run_command.return_value = ''
+        running = _config(MEMBER1)
+
+        self.assertTrue(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(MEMBER1, weight=3)))
+        mock_haproxy_query.assert_called_once_with(
+            '/var/lib/octavia/lb1-admin.sock')
+        mock_run_command.assert_called_once_with(
+            'set server pool1:listener1/member1 weight 3')
+
+        # Not a member change
+        mock_run_command.reset_mock()
+        self.assertFalse(haproxy_runtime.apply_member_changes(
+            'lb1', running, running.replace('roundrobin', 'leastconn')))
+        mock_run_command.assert_not_called()
+
+        # Command error
+        mock_run_command.return_value = 'No such server.'
+        self.assertFalse(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(MEMBER1, weight=3)))
+
+        # The admin socket is not configured
+        mock_run_command.side_effect = Exception('boom')
+        self.assertFalse(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(MEMBER1, weight=3)))
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'haproxy_compatibility.get_haproxy_versions',
+                return_value=(2, 8))
+    @mock.patch('socket.socket')
+    def test_apply_member_changes_replies(self, mock_socket,
+                                          mock_get_versions):
+        # The replies of HAProxy to the runtime API commands
+        server = 'pool1:listener1/member2'
+        replies = {
+            f'set server {server} addr 2001:db8::20 port 8081':
+                "IP changed from '2001:db8::10' to '2001:db8::20', port "
+                "changed from '8080' to '8081' by 'stats socket command'\n",
+            f'set server {server} addr 2001:db8::10 port 8081':
+                "no need to change the addr, port changed from '8080' to "
+                "'8081' by 'stats socket command'\n",
+            'set server pool1:listener1/member1 weight 3': '\n',
+            f'add server {server} 2001:db8::10:8080 weight 5 check inter '
+            '30s fall 3 rise 2': 'New server registered.\n',
+            f'enable health {server}': '\n',
+            f'set server {server} state ready': '\n',
+            f'set server {server} state maint': '\n',
+            f'del server {server}': 'Server deleted.\n',
+        }
+
+        def create_socket(*args):
+            sock = mock.MagicMock()
+
+            def send(data):
+                reply = replies[data.decode('ascii').rstrip('\n')]
+                sock.recv.side_effect = [reply.encode('ascii'), b'']
+            sock.send.side_effect = send
+            return sock
+        mock_socket.side_effect = create_socket
+        running = _config(MEMBER1, MEMBER2)
+
+        # Address and port changes
+        self.assertTrue(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(
+                MEMBER1, MEMBER2.replace('::10:8080', '::20:8081'),
+                weight=3)))
+        # Port change
+        self.assertTrue(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(
+                MEMBER1, MEMBER2.replace(':8080', ':8081'))))
+        # Added and deleted servers
+        self.assertTrue(haproxy_runtime.apply_member_changes(
+            'lb1', _config(MEMBER1), running))
+        self.assertTrue(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(MEMBER1)))
+
+        # The command fails
+        replies[f'del server {server}'] = (
+            'Server still has connections attached to it, cannot remove '
+            'it.\n')
+        self.assertFalse(haproxy_runtime.apply_member_changes(
+            'lb1', running, _config(MEMBER1)))
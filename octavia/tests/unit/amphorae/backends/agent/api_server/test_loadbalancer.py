@@ -208,6 +208,71 @@ class ListenerTestCase(base.TestCase):
         mock_vrrp_update.assert_not_called()
         mock_check_output.assert_not_called()
 
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'set_running_config_md5')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._get_config_md5', return_value='md5sum')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._get_running_config', return_value='config')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._check_haproxy_status',
+                return_value=consts.ACTIVE)
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._check_lb_exists')
+    @mock.patch('subprocess.check_output')
+    @mock.patch('octavia.amphorae.backends.utils.haproxy_query.HAProxyQuery')
+    def test_start_stop_lb_running_config(
+            self, mock_haproxy_query, mock_check_output, mock_lb_exists,
+            mock_check_status, mock_get_running_config, mock_get_config_md5,
+            mock_set_running_md5):
+        # An explicit reload is always done, even if the configuration file
+        # is already loaded by HAProxy, the loaded configuration is recorded
+        # after the reload
+        result = self.test_loadbalancer.start_stop_lb(
+            LB_ID1, consts.AMP_ACTION_RELOAD)
+
+        self.assertEqual(202, result.status_code)
+        mock_check_output.assert_called_once_with(
+            ['/usr/sbin/service', f'haproxy-{LB_ID1}', 'reload'],
+            stderr=subprocess.STDOUT)
+        mock_set_running_md5.assert_has_calls([
+            mock.call(LB_ID1, None), mock.call(LB_ID1, 'md5sum')])
+
+        # The configuration is unknown after a failure
+        mock_set_running_md5.reset_mock()
+        mock_check_output.side_effect = subprocess.CalledProcessError(
+            1, 'reload', b'error')
+
+        result = self.test_loadbalancer.start_stop_lb(
+            LB_ID1, consts.AMP_ACTION_RELOAD)
+
+        self.assertEqual(500, result.status_code)
+        mock_set_running_md5.assert_called_once_with(LB_ID1, None)
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
+                'get_running_config_md5')
+    @mock.patch('octavia.amphorae.backends.agent.api_server.loadbalancer.'
+                'Loadbalancer._check_haproxy_status')
+    def test_get_running_config(self, mock_check_status,
+                                mock_get_running_md5):
+        self.useFixture(test_utils.OpenFixture(
+            agent_util.config_path(LB_ID1), 'config'))
+        config_md5 = self.test_loadbalancer._md5('config')
+        mock_get_running_md5.return_value = config_md5
+        mock_check_status.return_value = consts.ACTIVE
+
+        self.assertEqual('config',
+                         self.test_loadbalancer._get_running_config(LB_ID1))
+
+        # The configuration file was updated
+        mock_get_running_md5.return_value = 'other'
+        self.assertIsNone(self.test_loadbalancer._get_running_config(LB_ID1))
+
+        # HAProxy is not running
+        mock_get_running_md5.return_value = config_md5
+        mock_check_status.return_value = consts.OFFLINE
+        self.assertIsNone(self.test_loadbalancer._get_running_config(LB_ID1))
+
     @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
                 'config_path')
     @mock.patch('octavia.amphorae.backends.agent.api_server.util.'
@@ -96,6 +96,19 @@ class TestOSUtils(base.TestCase):
                 package_name))
         self.assertEqual(centos_cmd, returned_centos_cmd)
 
+    @mock.patch('os.stat')
+    def test_get_package_database_stamp(self, mock_stat):
+        mock_stat.return_value = mock.Mock(st_ino=1, st_size=2,
+                                           st_mtime_ns=3)
+        self.assertEqual((('/var/lib/dpkg/status', 1, 2, 3),),
+                         self.ubuntu_os_util.get_package_database_stamp())
+        mock_stat.assert_called_once_with('/var/lib/dpkg/status')
+
+        mock_stat.side_effect = FileNotFoundError
+        self.assertIsNone(self.rh_os_util.get_package_database_stamp())
+        self.assertEqual(1 + len(osutils.RH.PACKAGE_DATABASE_PATHS),
+                         mock_stat.call_count)
+
     @mock.patch('octavia.amphorae.backends.utils.interface_file.'
                 'InterfaceFile')
     def test_write_interface_file(self, mock_interface_file):
@@ -15,6 +15,7 @@ import os
 import subprocess
 from unittest import mock
 
+import fixtures
 from oslo_config import cfg
 from oslo_config import fixture as oslo_fixture
 from oslo_utils import uuidutils
@@ -50,6 +51,26 @@ class TestUtil(base.TestCase):
         fake_path = fake_path + '/lvs'
         self.assertEqual(fake_path, result)
 
+    def test_running_config_md5(self):
+        base_path = self.useFixture(fixtures.TempDir()).path
+        self.CONF.config(group="haproxy_amphora", base_path=base_path)
+
+        self.assertEqual(os.path.join(base_path, LB_ID1 + '-admin.sock'),
+                         util.haproxy_admin_sock_path(LB_ID1))
+
+        # The haproxy directory doesn't exist yet
+        util.set_running_config_md5(LB_ID1, 'md5sum')
+        self.assertIsNone(util.get_running_config_md5(LB_ID1))
+
+        os.makedirs(util.haproxy_dir(LB_ID1))
+        util.set_running_config_md5(LB_ID1, 'md5sum')
+        self.assertEqual('md5sum', util.get_running_config_md5(LB_ID1))
+
+        util.set_running_config_md5(LB_ID1, None)
+        self.assertIsNone(util.get_running_config_md5(LB_ID1))
+        self.assertFalse(os.path.exists(util.running_config_md5_path(LB_ID1)))
+        util.set_running_config_md5(LB_ID1, None)
+
     def test_keepalived_lvs_init_path(self):
         # Test systemd
         ref_path = (consts.SYSTEMD_DIR + '/' +
@@ -76,7 +76,10 @@ class AgentJinjaTestCase(base.TestCase):
                            '[health_manager]\n'
                            'controller_ip_port_list = 192.0.2.10:5555\n'
                            'heartbeat_interval = 10\n'
-                           'heartbeat_key = TEST\n\n'
+                           'heartbeat_key = TEST\n'
+                           'status_poll_interval = 0\n'
+                           'heartbeat_destinations = 1\n'
+                           'heartbeat_destination_selection = round_robin\n\n'
                            '[amphora_agent]\n'
                            'agent_server_ca = '
                            '/etc/octavia/certs/client_ca.pem\n'
@@ -85,6 +88,7 @@ class AgentJinjaTestCase(base.TestCase):
                            'agent_server_network_dir = '
                            '/etc/network/interfaces.d/\n'
                            'agent_request_read_timeout = 180\n'
+                           'agent_server_threads = 8\n'
                            'amphora_id = ' + AMP_ID + '\n'
                            'amphora_udp_driver = keepalived_lvs\n'
                            'agent_tls_protocol = TLSv1.2\n\n'
@@ -118,7 +122,10 @@ class AgentJinjaTestCase(base.TestCase):
                            '[health_manager]\n'
                            'controller_ip_port_list = 192.0.2.10:5555\n'
                            'heartbeat_interval = 10\n'
-                           'heartbeat_key = TEST\n\n'
+                           'heartbeat_key = TEST\n'
+                           'status_poll_interval = 0\n'
+                           'heartbeat_destinations = 1\n'
+                           'heartbeat_destination_selection = round_robin\n\n'
                            '[amphora_agent]\n'
                            'agent_server_ca = '
                            '/etc/octavia/certs/client_ca.pem\n'
@@ -127,6 +134,7 @@ class AgentJinjaTestCase(base.TestCase):
                            'agent_server_network_dir = '
                            '/etc/network/interfaces.d/\n'
                            'agent_request_read_timeout = 180\n'
+                           'agent_server_threads = 8\n'
                            'amphora_id = ' + AMP_ID + '\n'
                            'amphora_udp_driver = keepalived_lvs\n'
                            'agent_tls_protocol = TLSv1.2\n\n'
@@ -162,7 +170,10 @@ class AgentJinjaTestCase(base.TestCase):
                            '[health_manager]\n'
                            'controller_ip_port_list = 192.0.2.10:5555\n'
                            'heartbeat_interval = 10\n'
-                           'heartbeat_key = TEST\n\n'
+                           'heartbeat_key = TEST\n'
+                           'status_poll_interval = 0\n'
+                           'heartbeat_destinations = 1\n'
+                           'heartbeat_destination_selection = round_robin\n\n'
                            '[amphora_agent]\n'
                            'agent_server_ca = '
                            '/etc/octavia/certs/client_ca.pem\n'
@@ -171,6 +182,7 @@ class AgentJinjaTestCase(base.TestCase):
                            'agent_server_network_dir = '
                            '/etc/network/interfaces.d/\n'
                            'agent_request_read_timeout = 180\n'
+                           'agent_server_threads = 8\n'
                            'amphora_id = ' + AMP_ID + '\n'
                            'amphora_udp_driver = new_udp_driver\n'
                            'agent_tls_protocol = TLSv1.2\n\n'
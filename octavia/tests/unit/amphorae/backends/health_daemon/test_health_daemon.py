@@ -16,12 +16,14 @@ import os
 import queue
 from unittest import mock
 
+import fixtures
 from oslo_config import cfg
 from oslo_config import fixture as oslo_fixture
 from oslo_utils import uuidutils
 import simplejson
 
 from octavia.amphorae.backends.health_daemon import health_daemon
+from octavia.amphorae.backends.utils import haproxy_query
 from octavia.common import constants
 from octavia.tests.common import utils as test_utils
 import octavia.tests.unit.base as base
@@ -50,63 +52,16 @@ SAMPLE_BOGUS_POOL_STATUS = {LISTENER_ID1: {
                                 '302e33d9-dee1-4de9-98d5-36329a06fb58':
                                 'DOWN'}}}
 
-FRONTEND_STATS = {'': '', 'status': 'OPEN', 'lastchg': '',
-                  'weight': '', 'slim': '2000', 'pid': '1', 'comp_byp': '0',
-                  'lastsess': '', 'rate_lim': '0', 'check_duration': '',
-                  'rate': '0', 'req_rate': '0', 'check_status': '',
-                  'econ': '', 'comp_out': '0', 'wredis': '', 'dresp': '0',
-                  'ereq': '5', 'tracked': '', 'comp_in': '0',
-                  'pxname': LISTENER_ID1,
-                  'dreq': '0', 'hrsp_5xx': '0', 'last_chk': '',
-                  'check_code': '', 'sid': '0', 'bout': '10', 'hrsp_1xx': '0',
-                  'qlimit': '', 'hrsp_other': '0', 'bin': '5', 'rtime': '',
-                  'smax': '0', 'req_tot': '0', 'lbtot': '', 'stot': '0',
-                  'wretr': '', 'req_rate_max': '0', 'ttime': '', 'iid': '2',
-                  'hrsp_4xx': '0', 'chkfail': '', 'hanafail': '',
-                  'downtime': '', 'qcur': '', 'eresp': '', 'comp_rsp': '0',
-                  'cli_abrt': '', 'ctime': '', 'qtime': '', 'srv_abrt': '',
-                  'throttle': '', 'last_agt': '', 'scur': '0', 'type': '0',
-                  'bck': '', 'qmax': '', 'rate_max': '0', 'hrsp_2xx': '0',
-                  'act': '', 'chkdown': '', 'svname': 'FRONTEND',
-                  'hrsp_3xx': '0'}
-MEMBER_STATS = {'': '', 'status': 'no check', 'lastchg': '', 'weight': '1',
-                'slim': '', 'pid': '1', 'comp_byp': '', 'lastsess': '-1',
-                'rate_lim': '', 'check_duration': '', 'rate': '0',
-                'req_rate': '', 'check_status': '', 'econ': '0',
-                'comp_out': '', 'wredis': '0', 'dresp': '0', 'ereq': '',
-                'tracked': '', 'comp_in': '',
-                'pxname': '432fc8b3-d446-48d4-bb64-13beb90e22bc',
-                'dreq': '', 'hrsp_5xx': '0', 'last_chk': '',
-                'check_code': '', 'sid': '1', 'bout': '0', 'hrsp_1xx': '0',
-                'qlimit': '', 'hrsp_other': '0', 'bin': '0', 'rtime': '0',
-                'smax': '0', 'req_tot': '', 'lbtot': '0', 'stot': '0',
-                'wretr': '0', 'req_rate_max': '', 'ttime': '0', 'iid': '3',
-                'hrsp_4xx': '0', 'chkfail': '', 'hanafail': '0',
-                'downtime': '', 'qcur': '0', 'eresp': '0', 'comp_rsp': '',
-                'cli_abrt': '0', 'ctime': '0', 'qtime': '0', 'srv_abrt': '0',
-                'throttle': '', 'last_agt': '', 'scur': '0', 'type': '2',
-                'bck': '0', 'qmax': '0', 'rate_max': '0', 'hrsp_2xx': '0',
-                'act': '1', 'chkdown': '',
-                'svname': '302e33d9-dee1-4de9-98d5-36329a06fb58',
-                'hrsp_3xx': '0'}
-BACKEND_STATS = {'': '', 'status': 'UP', 'lastchg': '122', 'weight': '1',
-                 'slim': '200', 'pid': '1', 'comp_byp': '0', 'lastsess': '-1',
-                 'rate_lim': '', 'check_duration': '', 'rate': '0',
-                 'req_rate': '', 'check_status': '', 'econ': '0',
-                 'comp_out': '0', 'wredis': '0', 'dresp': '0', 'ereq': '',
-                 'tracked': '', 'comp_in': '0',
-                 'pxname': '432fc8b3-d446-48d4-bb64-13beb90e22bc', 'dreq': '0',
-                 'hrsp_5xx': '0', 'last_chk': '', 'check_code': '', 'sid': '0',
-                 'bout': '0', 'hrsp_1xx': '0', 'qlimit': '', 'hrsp_other': '0',
-                 'bin': '0', 'rtime': '0', 'smax': '0', 'req_tot': '',
-                 'lbtot': '0', 'stot': '0', 'wretr': '0', 'req_rate_max': '',
-                 'ttime': '0', 'iid': '3', 'hrsp_4xx': '0', 'chkfail': '',
-                 'hanafail': '', 'downtime': '0', 'qcur': '0', 'eresp': '0',
-                 'comp_rsp': '0', 'cli_abrt': '0', 'ctime': '0', 'qtime': '0',
-                 'srv_abrt': '0', 'throttle': '', 'last_agt': '', 'scur': '0',
-                 'type': '1', 'bck': '0', 'qmax': '0', 'rate_max': '0',
-                 'hrsp_2xx': '0', 'act': '1', 'chkdown': '0',
-                 'svname': 'BACKEND', 'hrsp_3xx': '0'}
+FRONTEND_STATS = haproxy_query.HAProxyStat(
+    pxname=LISTENER_ID1, svname='FRONTEND', status='OPEN', scur='0',
+    bin='5', bout='10', stot='0', ereq='5', weight='')
+MEMBER_STATS = haproxy_query.HAProxyStat(
+    pxname='432fc8b3-d446-48d4-bb64-13beb90e22bc',
+    svname='302e33d9-dee1-4de9-98d5-36329a06fb58', status='no check',
+    scur='0', bin='0', bout='0', stot='0', ereq='', weight='1')
+BACKEND_STATS = haproxy_query.HAProxyStat(
+    pxname='432fc8b3-d446-48d4-bb64-13beb90e22bc', svname='BACKEND',
+    status='UP', scur='0', bin='0', bout='0', stot='0', ereq='', weight='1')
 SAMPLE_STATS = (FRONTEND_STATS, MEMBER_STATS, BACKEND_STATS)
 
 SAMPLE_STATS_MSG = {
@@ -309,6 +264,61 @@ class TestHealthDaemon(base.TestCase):
             health_daemon.run_sender(test_queue)
         sender_mock.dosend.assert_called_once_with('TEST')
 
+    @mock.patch('time.monotonic', return_value=0)
+    @mock.patch('time.sleep')
+    @mock.patch('os.path.isfile', return_value=False)
+    @mock.patch('octavia.amphorae.backends.health_daemon.'
+                'health_daemon.get_status_snapshot')
+    @mock.patch('octavia.amphorae.backends.health_daemon.'
+                'health_daemon.build_stats_message')
+    @mock.patch('octavia.amphorae.backends.health_daemon.'
+                'health_sender.UDPStatusSender')
+    def test_run_sender_status_change(self, mock_UDPStatusSender,
+                                      mock_build_msg, mock_get_snapshot,
+                                      mock_isfile, mock_sleep,
+                                      mock_monotonic):
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="health_manager", heartbeat_interval=10,
+                    status_poll_interval=1)
+        sender_mock = mock_UDPStatusSender.return_value
+        mock_build_msg.side_effect = ['TEST1', 'TEST2']
+        mock_get_snapshot.side_effect = [
+            {LB_ID1: ({LISTENER_ID1: 'OPEN'}, SAMPLE_POOL_STATUS)},
+            {LB_ID1: ({LISTENER_ID1: 'OPEN'}, SAMPLE_POOL_STATUS)},
+            {LB_ID1: ({LISTENER_ID1: 'OPEN'}, SAMPLE_BOGUS_POOL_STATUS)}]
+        cmd_queue = mock.MagicMock()
+        cmd_queue.get_nowait.side_effect = [queue.Empty, queue.Empty,
+                                            'shutdown']
+
+        health_daemon.run_sender(cmd_queue)
+
+        # The first heartbeat is sent on start, the second one on the
+        # operating status change, before the heartbeat_interval expired.
+        sender_mock.dosend.assert_has_calls([mock.call('TEST1'),
+                                             mock.call('TEST2')])
+        self.assertEqual(2, sender_mock.dosend.call_count)
+        mock_sleep.assert_has_calls([mock.call(1), mock.call(1)])
+
+    @mock.patch('octavia.amphorae.backends.agent.api_server.'
+                'util.is_lb_running')
+    @mock.patch('octavia.amphorae.backends.health_daemon.'
+                'health_daemon.get_stats')
+    @mock.patch('octavia.amphorae.backends.health_daemon.'
+                'health_daemon.list_sock_stat_files')
+    def test_get_status_snapshot(self, mock_list_files, mock_get_stats,
+                                 mock_is_running):
+        lb1_stats_socket = f'/var/lib/octavia/{LB_ID1}/haproxy.sock'
+        mock_list_files.return_value = {LB_ID1: lb1_stats_socket}
+        mock_is_running.return_value = True
+        mock_get_stats.return_value = SAMPLE_STATS, SAMPLE_POOL_STATUS
+
+        self.assertEqual(
+            {LB_ID1: ({LISTENER_ID1: 'OPEN'}, SAMPLE_POOL_STATUS)},
+            health_daemon.get_status_snapshot())
+
+        mock_is_running.return_value = False
+        self.assertEqual({}, health_daemon.get_status_snapshot())
+
     @mock.patch('octavia.amphorae.backends.utils.haproxy_query.HAProxyQuery')
     def test_get_stats(self, mock_query):
         stats_query_mock = mock.MagicMock()
@@ -317,7 +327,8 @@ class TestHealthDaemon(base.TestCase):
         health_daemon.get_stats('TEST')
 
         stats_query_mock.show_stat.assert_called_once_with()
-        stats_query_mock.get_pool_status.assert_called_once_with()
+        stats_query_mock.get_pool_status.assert_called_once_with(
+            stats_query_mock.show_stat.return_value)
 
     @mock.patch('octavia.amphorae.backends.utils.haproxy_query.HAProxyQuery')
     def test_get_stats_exception(self, mock_query):
@@ -347,7 +358,7 @@ class TestHealthDaemon(base.TestCase):
                 os, 'fdopen', self.mock_open) as mock_fdopen:
             mock_fdopen().read.return_value = simplejson.dumps({
                 LISTENER_ID1: {'bin': 1, 'bout': 2},
-            })
+            }) + '\n'
             msg = health_daemon.build_stats_message()
 
         self.assertEqual(SAMPLE_STATS_MSG, msg)
@@ -355,13 +366,13 @@ class TestHealthDaemon(base.TestCase):
         mock_get_stats.assert_any_call(lb1_stats_socket)
         mock_fdopen().write.assert_called_once_with(simplejson.dumps({
             LISTENER_ID1: {
-                'bin': int(FRONTEND_STATS['bin']),
-                'bout': int(FRONTEND_STATS['bout']),
-                'ereq': int(FRONTEND_STATS['ereq']),
-                'stot': int(FRONTEND_STATS['stot'])
+                'bin': int(FRONTEND_STATS.bin),
+                'bout': int(FRONTEND_STATS.bout),
+                'ereq': int(FRONTEND_STATS.ereq),
+                'stot': int(FRONTEND_STATS.stot)
 
             }
-        }))
+        }) + '\n')
 
     @mock.patch('octavia.amphorae.backends.agent.api_server.'
                 'util.is_lb_running')
@@ -453,14 +464,14 @@ class TestHealthDaemon(base.TestCase):
             mock_fdopen().read.return_value = simplejson.dumps({
                 udp_listener_id1: {
                     'bin': 1, 'bout': 2, "ereq": 0, "stot": 0}
-            })
+            }) + '\n'
             msg = health_daemon.build_stats_message()
 
         self.assertEqual(expected, msg)
         mock_fdopen().write.assert_called_once_with(simplejson.dumps({
             udp_listener_id1: {'bin': 5, 'bout': 10, 'ereq': 0, 'stot': 5},
             udp_listener_id3: {'bin': 0, 'bout': 0, 'ereq': 0, 'stot': 0},
-        }))
+        }) + '\n')
 
     @mock.patch('octavia.amphorae.backends.agent.api_server.'
                 'util.is_lb_running')
@@ -482,7 +493,7 @@ class TestHealthDaemon(base.TestCase):
                 os, 'fdopen', self.mock_open) as mock_fdopen:
             mock_fdopen().read.return_value = simplejson.dumps({
                 LISTENER_ID1: {'bin': 15, 'bout': 20},
-            })
+            }) + '\n'
             msg = health_daemon.build_stats_message()
 
         self.assertEqual(SAMPLE_MSG_HAPROXY_RESTART, msg)
@@ -490,13 +501,130 @@ class TestHealthDaemon(base.TestCase):
         mock_get_stats.assert_any_call(lb1_stats_socket)
         mock_fdopen().write.assert_called_once_with(simplejson.dumps({
             LISTENER_ID1: {
-                'bin': int(FRONTEND_STATS['bin']),
-                'bout': int(FRONTEND_STATS['bout']),
-                'ereq': int(FRONTEND_STATS['ereq']),
-                'stot': int(FRONTEND_STATS['stot'])
+                'bin': int(FRONTEND_STATS.bin),
+                'bout': int(FRONTEND_STATS.bout),
+                'ereq': int(FRONTEND_STATS.ereq),
+                'stot': int(FRONTEND_STATS.stot)
 
             }
-        }))
+        }) + '\n')
+
+    def test_get_counters_journal(self):
+        health_daemon.COUNTERS = None
+        health_daemon.COUNTERS_FILE = None
+        journal = (
+            simplejson.dumps({LISTENER_ID1: {'bin': 1, 'bout': 2},
+                              LISTENER_ID2: {'bin': 3, 'bout': 4}}) + '\n' +
+            simplejson.dumps({LISTENER_ID1: {'bin': 5, 'bout': 6}}) + '\n' +
+            # Partially written record
+            '{"' + LISTENER_ID2 + '": {"bin": 7')
+
+        with mock.patch('os.open'), mock.patch('os.replace'), (
+                mock.patch.object(os, 'fdopen', self.mock_open)) as (
+                mock_fdopen):
+            mock_fdopen().read.return_value = journal
+            counters = health_daemon.get_counters()
+
+        self.assertEqual({LISTENER_ID1: {'bin': 5, 'bout': 6},
+                          LISTENER_ID2: {'bin': 3, 'bout': 4}}, counters)
+        # The journal is compacted to drop the partially written record
+        mock_fdopen().write.assert_called_once_with(
+            simplejson.dumps(counters) + '\n')
+        self.assertEqual(1, health_daemon.COUNTERS_RECORDS)
+
+    def test_persist_counters_unchanged(self):
+        health_daemon.COUNTERS = None
+        health_daemon.COUNTERS_FILE = None
+        row = {'bin': 5, 'bout': 10, 'ereq': 0, 'stot': 5}
+
+        with mock.patch('os.open'), mock.patch.object(
+                os, 'fdopen', self.mock_open) as mock_fdopen:
+            mock_fdopen().read.return_value = simplejson.dumps(
+                {LISTENER_ID1: row}) + '\n'
+            delta_values = health_daemon.calculate_stats_deltas(
+                LISTENER_ID1, row)
+            health_daemon.persist_counters()
+
+        self.assertEqual({'bin': 0, 'bout': 0, 'ereq': 0, 'stot': 0},
+                         delta_values)
+        mock_fdopen().write.assert_not_called()
+
+    def test_persist_counters_compaction(self):
+        base_path = self.useFixture(fixtures.TempDir()).path
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="haproxy_amphora", base_path=base_path)
+        counters_file_path = os.path.join(base_path,
+                                          health_daemon.COUNTERS_FILE_NAME)
+        health_daemon.COUNTERS = None
+        health_daemon.COUNTERS_FILE = None
+        self.addCleanup(setattr, health_daemon, 'COUNTERS_FILE', None)
+        self.addCleanup(setattr, health_daemon, 'COUNTERS', None)
+
+        compact_records = health_daemon.COUNTERS_COMPACT_RECORDS
+        for i in range(compact_records + 1):
+            health_daemon.calculate_stats_deltas(
+                LISTENER_ID1, {'bin': i, 'bout': i, 'ereq': 0, 'stot': i})
+            health_daemon.calculate_stats_deltas(
+                LISTENER_ID2, {'bin': 1, 'bout': 1, 'ereq': 0, 'stot': 1})
+            health_daemon.persist_counters()
+
+            with open(counters_file_path, encoding='utf-8') as f:
+                records = f.read().splitlines()
+            if i < compact_records:
+                self.assertEqual(i + 1, len(records))
+                # Only the first record includes the unchanged listener
+                self.assertEqual(2 if i == 0 else 1,
+                                 len(simplejson.loads(records[-1])))
+
+        # The journal was replaced by a snapshot of all of the counters
+        self.assertEqual(1, len(records))
+        self.assertEqual(
+            {LISTENER_ID1: {'bin': compact_records, 'bout': compact_records,
+                            'ereq': 0, 'stot': compact_records},
+             LISTENER_ID2: {'bin': 1, 'bout': 1, 'ereq': 0, 'stot': 1}},
+            simplejson.loads(records[0]))
+        self.assertFalse(os.path.exists(counters_file_path + '.tmp'))
+
+        # Counters are recovered from the snapshot
+        self.assertIsNone(health_daemon.COUNTERS_FILE)
+        health_daemon.COUNTERS = None
+        self.assertEqual(simplejson.loads(records[0]),
+                         health_daemon.get_counters())
+        health_daemon.COUNTERS_FILE.close()
+
+    def test_persist_counters_partial_record(self):
+        base_path = self.useFixture(fixtures.TempDir()).path
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="haproxy_amphora", base_path=base_path)
+        counters_file_path = os.path.join(base_path,
+                                          health_daemon.COUNTERS_FILE_NAME)
+        health_daemon.COUNTERS = None
+        health_daemon.COUNTERS_FILE = None
+        self.addCleanup(setattr, health_daemon, 'COUNTERS_FILE', None)
+        self.addCleanup(setattr, health_daemon, 'COUNTERS', None)
+        row = {'bin': 1, 'bout': 1, 'ereq': 0, 'stot': 1}
+        # A crash in the middle of a write
+        with open(counters_file_path, 'w', encoding='utf-8') as f:
+            f.write(simplejson.dumps({LISTENER_ID1: row}) + '\n' +
+                    '{"' + LISTENER_ID2 + '": {"bin": 7')
+
+        health_daemon.calculate_stats_deltas(
+            LISTENER_ID2, {'bin': 2, 'bout': 2, 'ereq': 0, 'stot': 2})
+        health_daemon.persist_counters()
+        health_daemon.calculate_stats_deltas(
+            LISTENER_ID2, {'bin': 3, 'bout': 3, 'ereq': 0, 'stot': 3})
+        health_daemon.persist_counters()
+
+        # Both updates are recovered
+        health_daemon.COUNTERS_FILE.close()
+        health_daemon.COUNTERS_FILE = None
+        health_daemon.COUNTERS = None
+        self.assertEqual(
+            {LISTENER_ID1: row,
+             LISTENER_ID2: {'bin': 3, 'bout': 3, 'ereq': 0, 'stot': 3}},
+            health_daemon.get_counters())
+        self.assertEqual(3, health_daemon.COUNTERS_RECORDS)
+        health_daemon.COUNTERS_FILE.close()
 
 
 class FileNotFoundError(IOError):
@@ -49,15 +49,15 @@ class TestHealthSender(base.TestCase):
     def test_sender(self, mock_socket, mock_getaddrinfo):
         socket_mock = mock.MagicMock()
         mock_socket.return_value = socket_mock
-        sendto_mock = mock.MagicMock()
-        socket_mock.sendto = sendto_mock
+        send_mock = mock.MagicMock()
+        socket_mock.send = send_mock
 
         # Test when no addresses are returned
         self.conf.config(group="health_manager",
                          controller_ip_port_list='')
         sender = health_sender.UDPStatusSender()
         sender.dosend(SAMPLE_MSG)
-        sendto_mock.reset_mock()
+        send_mock.reset_mock()
 
         # Test IPv4 path
         self.conf.config(group="health_manager",
@@ -71,9 +71,9 @@ class TestHealthSender(base.TestCase):
         sender = health_sender.UDPStatusSender()
         sender.dosend(SAMPLE_MSG)
 
-        sendto_mock.assert_called_once_with(SAMPLE_MSG_BIN,
-                                            ('192.0.2.20', 80))
-        sendto_mock.reset_mock()
+        send_mock.assert_called_once_with(SAMPLE_MSG_BIN)
+        socket_mock.connect.assert_called_with(('192.0.2.20', 80))
+        send_mock.reset_mock()
 
         # Test IPv6 path
         self.conf.config(group="health_manager",
@@ -88,10 +88,10 @@ class TestHealthSender(base.TestCase):
 
         sender.dosend(SAMPLE_MSG)
 
-        sendto_mock.assert_called_once_with(SAMPLE_MSG_BIN,
-                                            ('2001:db8::f00d', 80, 0, 0))
+        send_mock.assert_called_once_with(SAMPLE_MSG_BIN)
+        socket_mock.connect.assert_called_with(('2001:db8::f00d', 80, 0, 0))
 
-        sendto_mock.reset_mock()
+        send_mock.reset_mock()
 
         # Test IPv6 path enclosed within square brackets ("[" and "]").
         self.conf.config(group="health_manager",
@@ -106,10 +106,10 @@ class TestHealthSender(base.TestCase):
 
         sender.dosend(SAMPLE_MSG)
 
-        sendto_mock.assert_called_once_with(SAMPLE_MSG_BIN,
-                                            ('2001:db8::f00d', 80, 0, 0))
+        send_mock.assert_called_once_with(SAMPLE_MSG_BIN)
+        socket_mock.connect.assert_called_with(('2001:db8::f00d', 80, 0, 0))
 
-        sendto_mock.reset_mock()
+        send_mock.reset_mock()
 
         # Test IPv6 link-local address path
         self.conf.config(
@@ -125,10 +125,11 @@ class TestHealthSender(base.TestCase):
 
         sender.dosend(SAMPLE_MSG)
 
-        sendto_mock.assert_called_once_with(SAMPLE_MSG_BIN,
-                                            ('fe80::ff:fe00:cafe', 80, 0, 2))
+        send_mock.assert_called_once_with(SAMPLE_MSG_BIN)
+        socket_mock.connect.assert_called_with(
+            ('fe80::ff:fe00:cafe', 80, 0, 2))
 
-        sendto_mock.reset_mock()
+        send_mock.reset_mock()
 
         # Test socket error
         self.conf.config(group="health_manager",
@@ -138,7 +139,7 @@ class TestHealthSender(base.TestCase):
                                           socket.IPPROTO_UDP,
                                           '',
                                           ('2001:db8::f00d', 80, 0, 0))]
-        socket_mock.sendto.side_effect = socket.error
+        socket_mock.send.side_effect = socket.error
 
         sender = health_sender.UDPStatusSender()
 
@@ -146,7 +147,7 @@ class TestHealthSender(base.TestCase):
         sender.dosend(SAMPLE_MSG)
 
         # Test an controller_ip_port_list update
-        sendto_mock.reset_mock()
+        send_mock.reset_mock()
         mock_getaddrinfo.reset_mock()
         self.conf.config(group="health_manager",
                          controller_ip_port_list=['192.0.2.20:80'])
@@ -157,11 +158,11 @@ class TestHealthSender(base.TestCase):
                                           ('192.0.2.20', 80))]
         sender = health_sender.UDPStatusSender()
         sender.dosend(SAMPLE_MSG)
-        sendto_mock.assert_called_once_with(SAMPLE_MSG_BIN,
-                                            ('192.0.2.20', 80))
+        send_mock.assert_called_once_with(SAMPLE_MSG_BIN)
+        socket_mock.connect.assert_called_with(('192.0.2.20', 80))
         mock_getaddrinfo.assert_called_once_with('192.0.2.20', '80',
                                                  0, socket.SOCK_DGRAM)
-        sendto_mock.reset_mock()
+        send_mock.reset_mock()
         mock_getaddrinfo.reset_mock()
 
         self.conf.config(group="health_manager",
@@ -174,7 +175,126 @@ class TestHealthSender(base.TestCase):
         sender.dosend(SAMPLE_MSG)
         mock_getaddrinfo.assert_called_once_with('192.0.2.21', '81',
                                                  0, socket.SOCK_DGRAM)
-        sendto_mock.assert_called_once_with(SAMPLE_MSG_BIN,
-                                            ('192.0.2.21', 81))
-        sendto_mock.reset_mock()
+        send_mock.assert_called_once_with(SAMPLE_MSG_BIN)
+        socket_mock.connect.assert_called_with(('192.0.2.21', 81))
+        send_mock.reset_mock()
         mock_getaddrinfo.reset_mock()
+
+    def _get_addrinfo(self, host, port, family, socktype):
+        return [(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP, '',
+                 (host, int(port)))]
+
+    @mock.patch('octavia.amphorae.backends.health_daemon.status_message.'
+                'wrap_envelope', side_effect=lambda msg, key: msg)
+    @mock.patch('socket.getaddrinfo')
+    @mock.patch('socket.socket')
+    def test_sender_multiple_destinations(self, mock_socket,
+                                          mock_getaddrinfo, mock_wrap):
+        mock_getaddrinfo.side_effect = self._get_addrinfo
+        sockets = {}
+
+        def _get_socket(family, socktype):
+            sock = mock.MagicMock()
+            sock.connect.side_effect = (
+                lambda addr: sockets.setdefault(addr, sock))
+            return sock
+        mock_socket.side_effect = _get_socket
+        self.conf.config(group="health_manager",
+                         controller_ip_port_list=['192.0.2.1:5555',
+                                                  '192.0.2.2:5555',
+                                                  '192.0.2.3:5555'],
+                         heartbeat_destinations=2)
+        msg = {'id': 'amp-id', 'ver': 3,
+               'listeners': {'listener-id': {
+                   'status': 'OPEN',
+                   'stats': {'tx': 1, 'rx': 2, 'conns': 3, 'totconns': 4,
+                             'ereq': 5}}}}
+        copy_msg = {'id': 'amp-id', 'ver': 3,
+                    'listeners': {'listener-id': {
+                        'status': 'OPEN',
+                        'stats': {'tx': 0, 'rx': 0, 'conns': 3,
+                                  'totconns': 0, 'ereq': 0}}}}
+
+        sender = health_sender.UDPStatusSender()
+        sender.dosend(msg)
+
+        sockets[('192.0.2.1', 5555)].send.assert_called_once_with(msg)
+        sockets[('192.0.2.2', 5555)].send.assert_called_once_with(copy_msg)
+        self.assertNotIn(('192.0.2.3', 5555), sockets)
+
+        # The controllers are rotated
+        sender.dosend(msg)
+
+        sockets[('192.0.2.2', 5555)].send.assert_called_with(msg)
+        sockets[('192.0.2.3', 5555)].send.assert_called_once_with(copy_msg)
+
+        # A controller that reported an error is skipped
+        sockets[('192.0.2.1', 5555)].send.side_effect = (
+            ConnectionRefusedError)
+        sockets[('192.0.2.1', 5555)].send.reset_mock()
+        sockets[('192.0.2.2', 5555)].send.reset_mock()
+        sockets[('192.0.2.3', 5555)].send.reset_mock()
+        sender.dosend(msg)
+
+        sockets[('192.0.2.3', 5555)].send.assert_called_once_with(msg)
+        sockets[('192.0.2.1', 5555)].send.assert_called_once_with(copy_msg)
+        sockets[('192.0.2.2', 5555)].send.assert_called_once_with(copy_msg)
+        self.assertIn(('192.0.2.1', 5555), sender.failed_dests)
+
+        sockets[('192.0.2.1', 5555)].send.reset_mock()
+        sender.dosend(msg)
+        sender.dosend(msg)
+        sender.dosend(msg)
+        sockets[('192.0.2.1', 5555)].send.assert_not_called()
+
+    @mock.patch('socket.getaddrinfo')
+    @mock.patch('socket.socket')
+    def test_sender_amphora_id_selection(self, mock_socket,
+                                         mock_getaddrinfo):
+        mock_getaddrinfo.side_effect = self._get_addrinfo
+        controllers = ['192.0.2.1:5555', '192.0.2.2:5555', '192.0.2.3:5555']
+        self.conf.config(group="health_manager",
+                         controller_ip_port_list=controllers,
+                         heartbeat_destination_selection='amphora_id')
+        self.conf.config(group="amphora_agent", amphora_id='amp-id')
+
+        sender = health_sender.UDPStatusSender()
+        expected_dest = health_sender.amphora_id_order(
+            sender.dests, 'amp-id')[0]
+        for _ in range(len(controllers)):
+            sender.dosend(SAMPLE_MSG)
+
+        connect_calls = mock_socket.return_value.connect.call_args_list
+        self.assertEqual([mock.call(expected_dest[4])], connect_calls)
+        self.assertEqual(len(controllers),
+                         mock_socket.return_value.send.call_count)
+
+    def test_amphora_id_order(self):
+        dests = [self._get_addrinfo(f'192.0.2.{i}', 5555, 0, 0)[0]
+                 for i in range(10)]
+        orders = {health_sender.amphora_id_order(dests, f'amp-{i}')[0][4]
+                  for i in range(100)}
+        # The amphorae are spread across the controllers
+        self.assertGreater(len(orders), 1)
+
+        # Removing a controller only moves its own amphorae
+        for i in range(100):
+            order = health_sender.amphora_id_order(dests, f'amp-{i}')
+            self.assertEqual(
+                [dest for dest in order if dest != dests[0]],
+                health_sender.amphora_id_order(dests[1:], f'amp-{i}'))
+
+    def test_without_stats_deltas(self):
+        msg = {'ver': 2, 'listeners': {'listener-id': {
+            'stats': {'tx': 1, 'rx': 2, 'conns': 3, 'totconns': 4,
+                      'ereq': 5}}}}
+        self.assertIs(msg, health_sender.without_stats_deltas(msg))
+
+        msg['ver'] = 3
+        result = health_sender.without_stats_deltas(msg)
+        self.assertEqual(
+            {'ver': 3, 'listeners': {'listener-id': {
+                'stats': {'tx': 0, 'rx': 0, 'conns': 3, 'totconns': 0,
+                          'ereq': 0}}}},
+            result)
+        self.assertEqual(1, msg['listeners']['listener-id']['stats']['tx'])
@@ -49,7 +49,9 @@ STATS_SOCKET_SAMPLE = (
     "0,0,552,0,,1,5,2,,0,,2,0,,0,L7OK,,30001,,,,,,,0,,,,0,0,,,,,-1,,,0,0,0,0,"
     "\n"
     "tcp-servers:listener-id,BACKEND,0,0,0,0,200,0,0,0,0,0,,0,0,0,0,UP,1,0,0,,"
-    "1,552,552,,1,5,0,,0,,1,0,,0,,,,,,,,,,,,,,0,0,0,0,0,0,-1,,,0,0,0,0,"
+    "1,552,552,,1,5,0,,0,,1,0,,0,,,,,,,,,,,,,,0,0,0,0,0,0,-1,,,0,0,0,0,\n"
+    "prometheus-exporter,BACKEND,0,0,0,0,200,0,0,0,0,0,,0,0,0,0,UP,0,0,0,,"
+    "0,552,0,,1,6,0,,0,,1,0,,0,,,,,,,,,,,,,,0,0,0,0,0,0,-1,,,0,0,0,0,"
 )
 
 INFO_SOCKET_SAMPLE = (
@@ -118,6 +120,72 @@ class QueryTestCase(base.TestCase):
             self.q.get_pool_status()
         )
 
+    def test_show_stat(self):
+        query_mock = mock.Mock()
+        self.q._query = query_mock
+        query_mock.return_value = STATS_SOCKET_SAMPLE
+
+        stats = self.q.show_stat(object_type=6)
+
+        query_mock.assert_called_once_with('show stat -1 6 -1')
+        self.assertEqual(8, len(stats))
+        self.assertEqual(
+            query.HAProxyStat(pxname='http-servers:listener-id',
+                              svname='id-34821', status='DOWN', scur='0',
+                              bin='0', bout='0', stot='0', ereq='',
+                              weight='1'),
+            stats[0])
+        self.assertNotIn('prometheus-exporter',
+                         [stat.pxname for stat in stats])
+
+    def test_parse_stat_csv(self):
+        stats_csv = (
+            "# pxname,svname,qcur,qmax,scur,smax,slim,stot,bin,bout,dreq,"
+            "dresp,ereq,econ,eresp,wretr,wredis,status,weight,check_desc,\n"
+            "listener-id,FRONTEND,,,3,5,50000,42,1024,2048,0,0,7,,,,,OPEN,"
+            ",\n"
+            "pool-id:listener-id,member-id,0,0,1,2,,40,1000,2000,,0,,0,0,0,0,"
+            "DOWN,1,\"Layer4 timeout, check failed\"\n"
+            "prometheus-exporter,FRONTEND,,,0,0,50000,0,0,0,0,0,0,,,,,OPEN,,"
+            "\n")
+
+        self.assertEqual(
+            [query.HAProxyStat(pxname='listener-id', svname='FRONTEND',
+                               status='OPEN', scur='3', bin='1024',
+                               bout='2048', stot='42', ereq='7', weight=''),
+             query.HAProxyStat(pxname='pool-id:listener-id',
+                               svname='member-id', status='DOWN', scur='1',
+                               bin='1000', bout='2000', stot='40', ereq='',
+                               weight='1')],
+            query.parse_stat_csv(stats_csv))
+
+    def test_parse_stat_csv_empty(self):
+        self.assertEqual([], query.parse_stat_csv(''))
+
+    def test_get_pool_status_with_stats(self):
+        query_mock = mock.Mock()
+        self.q._query = query_mock
+        stats = [
+            query.HAProxyStat(pxname='listener-id', svname='FRONTEND',
+                              status='OPEN', scur='0', bin='0', bout='0',
+                              stot='0', ereq='0', weight=''),
+            query.HAProxyStat(pxname='pool-id:listener-id',
+                              svname='member-id', status='UP', scur='0',
+                              bin='0', bout='0', stot='0', ereq='',
+                              weight='1'),
+            query.HAProxyStat(pxname='pool-id:listener-id', svname='BACKEND',
+                              status='UP', scur='0', bin='0', bout='0',
+                              stot='0', ereq='', weight='1')]
+
+        self.assertEqual(
+            {'pool-id:listener-id': {
+                'status': constants.UP,
+                'listener_uuid': 'listener-id',
+                'pool_uuid': 'pool-id',
+                'members': {'member-id': constants.UP}}},
+            self.q.get_pool_status(stats))
+        query_mock.assert_not_called()
+
     def test_show_info(self):
         query_mock = mock.Mock()
         self.q._query = query_mock
@@ -144,6 +212,14 @@ class QueryTestCase(base.TestCase):
             self.q.show_info()
         )
 
+    def test_run_command(self):
+        query_mock = mock.Mock()
+        query_mock.return_value = ''
+        self.q._query = query_mock
+
+        self.assertEqual('', self.q.run_command('set server b/s weight 5'))
+        query_mock.assert_called_once_with('set server b/s weight 5')
+
     def test_save_state(self):
         filename = 'state_file'
 
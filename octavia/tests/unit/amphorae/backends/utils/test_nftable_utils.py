@@ -41,13 +41,56 @@ class TestNFTableUtils(base.TestCase):
 
         mock_open.assert_not_called()
 
+    def _expected_batch(self, rules_cmds=(), elements=()):
+        table = f'{consts.NFT_FAMILY} {consts.NFT_VIP_TABLE}'
+        return [
+            mock.call(f'table {table} {{\n'),
+            mock.call(f'  chain {consts.NFT_VIP_CHAIN} {{\n'),
+            mock.call('    type filter hook ingress device fake-eth2 '
+                      f'priority {consts.NFT_SRIOV_PRIORITY}; policy drop;\n'),
+            mock.call('  }\n'),
+            mock.call(f'  set {consts.NFT_VIP_PORTS_SET} {{\n'),
+            mock.call('    type inet_proto . inet_service;\n'),
+            mock.call('  }\n'),
+            mock.call(f'  set {consts.NFT_VIP_IPV4_SET} {{\n'),
+            mock.call('    type ipv4_addr . inet_proto . inet_service; '
+                      'flags interval;\n'),
+            mock.call('  }\n'),
+            mock.call(f'  set {consts.NFT_VIP_IPV6_SET} {{\n'),
+            mock.call('    type ipv6_addr . inet_proto . inet_service; '
+                      'flags interval;\n'),
+            mock.call('  }\n'),
+            mock.call('}\n'),
+            mock.call(f'flush chain {table} {consts.NFT_VIP_CHAIN}\n'),
+            mock.call(f'flush set {table} {consts.NFT_VIP_PORTS_SET}\n'),
+            mock.call(f'flush set {table} {consts.NFT_VIP_IPV4_SET}\n'),
+            mock.call(f'flush set {table} {consts.NFT_VIP_IPV6_SET}\n'),
+            mock.call(f'table {table} {{\n'),
+            mock.call(f'  chain {consts.NFT_VIP_CHAIN} {{\n'),
+            mock.call('    icmp type destination-unreachable accept\n'),
+            mock.call('    icmpv6 type { nd-neighbor-solicit, '
+                      'nd-router-advert, nd-neighbor-advert, packet-too-big, '
+                      'destination-unreachable } accept\n'),
+            mock.call('    udp sport 67 udp dport 68 accept\n'),
+            mock.call('    udp sport 547 udp dport 546 accept\n'),
+            mock.call('    meta l4proto . th dport '
+                      f'@{consts.NFT_VIP_PORTS_SET} accept\n'),
+            mock.call('    ip saddr . meta l4proto . th dport '
+                      f'@{consts.NFT_VIP_IPV4_SET} accept\n'),
+            mock.call('    ip6 saddr . meta l4proto . th dport '
+                      f'@{consts.NFT_VIP_IPV6_SET} accept\n')] + [
+            mock.call(f'    {rule_cmd}\n') for rule_cmd in rules_cmds] + [
+            mock.call('  }\n'),
+            mock.call('}\n')] + [
+            mock.call(element) for element in elements]
+
     @mock.patch('os.open')
     @mock.patch('os.path.isfile')
     def test_write_nftable_vip_rules_file_rules(self, mock_isfile,
                                                 mock_open):
         """Test when a rules file exists and rules are passed in
 
-        This should create a simple rules file with the base chain and rules.
+        This should create a rules file that replaces the chain and the sets.
         """
         mock_isfile.return_value = True
         mock_open.return_value = 'fake-fd'
@@ -58,11 +101,25 @@ class TestNFTableUtils(base.TestCase):
         test_rule_2 = {consts.CIDR: '192.0.2.0/24',
                        consts.PROTOCOL: consts.VRRP,
                        consts.PORT: 4321}
+        test_rule_3 = {consts.CIDR: '198.51.100.0/24',
+                       consts.PROTOCOL: lib_consts.PROTOCOL_UDP,
+                       consts.PORT: 53}
+        # Collapsed with the previous CIDR
+        test_rule_4 = {consts.CIDR: '198.51.100.128/25',
+                       consts.PROTOCOL: lib_consts.PROTOCOL_UDP,
+                       consts.PORT: 53}
+        test_rule_5 = {consts.CIDR: '2001:db8::/32',
+                       consts.PROTOCOL: lib_consts.PROTOCOL_SCTP,
+                       consts.PORT: 80}
+        test_rule_6 = {consts.CIDR: '203.0.113.0/24',
+                       consts.PROTOCOL: lib_consts.PROTOCOL_TCP,
+                       consts.PORT: 443}
 
         mocked_open = mock.mock_open()
         with mock.patch.object(os, 'fdopen', mocked_open):
             nftable_utils.write_nftable_vip_rules_file(
-                'fake-eth2', [test_rule_1, test_rule_2])
+                'fake-eth2', [test_rule_1, test_rule_2, test_rule_3,
+                              test_rule_4, test_rule_5, test_rule_6])
 
         mocked_open.assert_called_once_with('fake-fd', 'w')
         mock_open.assert_called_once_with(
@@ -70,28 +127,35 @@ class TestNFTableUtils(base.TestCase):
             (os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
             (stat.S_IRUSR | stat.S_IWUSR))
 
+        table = f'{consts.NFT_FAMILY} {consts.NFT_VIP_TABLE}'
         handle = mocked_open()
-        handle.write.assert_has_calls([
-            mock.call(f'table {consts.NFT_FAMILY} {consts.NFT_VIP_TABLE} '
-                      '{}\n'),
-            mock.call(f'delete table {consts.NFT_FAMILY} '
-                      f'{consts.NFT_VIP_TABLE}\n'),
-            mock.call(f'table {consts.NFT_FAMILY} {consts.NFT_VIP_TABLE} '
-                      '{\n'),
-            mock.call(f'  chain {consts.NFT_VIP_CHAIN} {{\n'),
-            mock.call('    type filter hook ingress device fake-eth2 '
-                      f'priority {consts.NFT_SRIOV_PRIORITY}; policy drop;\n'),
-            mock.call('      icmp type destination-unreachable accept\n'),
-            mock.call('      icmpv6 type { nd-neighbor-solicit, '
-                      'nd-router-advert, nd-neighbor-advert, packet-too-big, '
-                      'destination-unreachable } accept\n'),
-            mock.call('      udp sport 67 udp dport 68 accept\n'),
-            mock.call('      udp sport 547 udp dport 546 accept\n'),
-            mock.call('      tcp dport 1234 accept\n'),
-            mock.call('      ip saddr 192.0.2.0/24 ip protocol 112 accept\n'),
-            mock.call('  }\n'),
-            mock.call('}\n')
-        ])
+        self.assertEqual(self._expected_batch(
+            rules_cmds=['ip saddr 192.0.2.0/24 ip protocol 112 accept'],
+            elements=[
+                f'add element {table} {consts.NFT_VIP_PORTS_SET} {{\n',
+                '  tcp . 1234',
+                '\n}\n',
+                f'add element {table} {consts.NFT_VIP_IPV4_SET} {{\n',
+                '  198.51.100.0/24 . udp . 53,\n'
+                '  203.0.113.0/24 . tcp . 443',
+                '\n}\n',
+                f'add element {table} {consts.NFT_VIP_IPV6_SET} {{\n',
+                '  2001:db8::/32 . sctp . 80',
+                '\n}\n']),
+            handle.write.mock_calls)
+
+    @mock.patch('os.open')
+    @mock.patch('os.path.isfile')
+    def test_write_nftable_vip_rules_file_invalid_cidr(self, mock_isfile,
+                                                       mock_open):
+        mock_isfile.return_value = True
+
+        self.assertRaises(
+            exc.HTTPBadRequest, nftable_utils.write_nftable_vip_rules_file,
+            'fake-eth2', [{consts.CIDR: '192/32',
+                           consts.PROTOCOL: lib_consts.PROTOCOL_TCP,
+                           consts.PORT: 1237}])
+        mock_open.assert_not_called()
 
     @mock.patch('os.open')
     @mock.patch('os.path.isfile')
@@ -115,21 +179,7 @@ class TestNFTableUtils(base.TestCase):
             (stat.S_IRUSR | stat.S_IWUSR))
 
         handle = mocked_open()
-        handle.write.assert_has_calls([
-            mock.call(f'table {consts.NFT_FAMILY} {consts.NFT_VIP_TABLE} '
-                      '{\n'),
-            mock.call(f'  chain {consts.NFT_VIP_CHAIN} {{\n'),
-            mock.call('    type filter hook ingress device fake-eth2 '
-                      f'priority {consts.NFT_SRIOV_PRIORITY}; policy drop;\n'),
-            mock.call('      icmp type destination-unreachable accept\n'),
-            mock.call('      icmpv6 type { nd-neighbor-solicit, '
-                      'nd-router-advert, nd-neighbor-advert, packet-too-big, '
-                      'destination-unreachable } accept\n'),
-            mock.call('      udp sport 67 udp dport 68 accept\n'),
-            mock.call('      udp sport 547 udp dport 546 accept\n'),
-            mock.call('  }\n'),
-            mock.call('}\n')
-        ])
+        self.assertEqual(self._expected_batch(), handle.write.mock_calls)
 
     @mock.patch('octavia.common.utils.ip_version')
     def test__build_rule_cmd(self, mock_ip_version):
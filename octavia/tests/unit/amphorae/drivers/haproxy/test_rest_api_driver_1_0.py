@@ -12,7 +12,9 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import gzip
 import hashlib
+import threading
 from unittest import mock
 
 from oslo_config import cfg
@@ -72,8 +74,16 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
             API_VERSION].get_info.return_value = {
             'haproxy_version': '1.6.3-1ubuntu0.1',
             'api_version': API_VERSION}
+        self.cert_manifest = {}
+        self.driver.clients[
+            API_VERSION].get_cert_manifest.return_value = self.cert_manifest
+        # Amphora agent without the bundle API
+        self.driver.clients[
+            API_VERSION].upload_bundle.side_effect = exc.NotFound
         self.driver.jinja_combo = mock.MagicMock()
         self.driver.lvs_jinja = mock.MagicMock()
+        self.driver.amphora_repo = mock.MagicMock()
+        self.mock_db_session = mock.patch('octavia.db.api.session').start()
 
         # Build sample Listener and VIP configs
         self.sl = sample_configs_combined.sample_listener_tuple(
@@ -168,6 +178,178 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
         self.driver.clients[API_VERSION].upload_config.assert_not_called()
         self.driver.clients[API_VERSION].reload_listener.assert_not_called()
 
+    @mock.patch('octavia.db.repositories.ListenerRepository.update')
+    def test_update_amphora_listeners_concurrent_certs(self, mock_update):
+        listeners = [
+            mock.MagicMock(id=f'listener{i}',
+                           protocol=constants.PROTOCOL_TERMINATED_HTTPS)
+            for i in range(3)]
+        loadbalancer = mock.MagicMock(listeners=listeners)
+        # The certificates of the listeners are processed at the same time
+        barrier = threading.Barrier(2, timeout=10)
+
+        def process_listener_certs(listener, *args, **kwargs):
+            if listener.id == 'listener2':
+                raise Exception('boom')
+            barrier.wait()
+            return {listener.tls_certificate_id: listener.id}
+
+        with mock.patch.object(self.driver, '_process_listener_certs',
+                               side_effect=process_listener_certs):
+            self.driver.update_amphora_listeners(loadbalancer, self.amp,
+                                                 self.timeout_dict)
+
+        self.driver.jinja_combo.build_config.assert_called_once_with(
+            host_amphora=self.amp, listeners=listeners[:2],
+            tls_certs={listeners[0].tls_certificate_id: 'listener0',
+                       listeners[1].tls_certificate_id: 'listener1'},
+            haproxy_versions=mock.ANY, amp_details=mock.ANY)
+        # The failed listener is skipped
+        mock_update.assert_called_once_with(
+            mock.ANY, 'listener2', provisioning_status=constants.ERROR,
+            operating_status=constants.ERROR)
+
+    def test_update_amphora_listeners_certs_failure(self):
+        listeners = [
+            mock.MagicMock(id='listener0', protocol=constants.PROTOCOL_UDP),
+            mock.MagicMock(id='listener1',
+                           protocol=constants.PROTOCOL_TERMINATED_HTTPS)]
+        loadbalancer = mock.MagicMock(listeners=listeners)
+        release = threading.Event()
+        done = threading.Event()
+
+        def process_listener_certs(listener, *args, **kwargs):
+            release.wait(timeout=10)
+            done.set()
+            return {}
+
+        def upload_udp_config(*args, **kwargs):
+            release.set()
+            raise ValueError('boom')
+
+        client = self.driver.clients[API_VERSION]
+        client.upload_udp_config.side_effect = upload_udp_config
+        with mock.patch.object(self.driver, '_process_listener_certs',
+                               side_effect=process_listener_certs):
+            self.assertRaises(ValueError,
+                              self.driver.update_amphora_listeners,
+                              loadbalancer, self.amp, self.timeout_dict)
+
+        # The certificate tasks are done when the update fails
+        self.assertTrue(done.is_set())
+
+    @mock.patch('octavia.common.tls_utils.cert_parser.load_certificates_data')
+    def test_update_amphora_listeners_bundle(self, mock_load_cert):
+        self.driver.cert_manager.get_secret.return_value = b'the_secret'
+        mock_load_cert.return_value = {
+            'tls_cert': self.sl.default_tls_container, 'sni_certs': []}
+        self.driver.jinja_combo.build_config.return_value = 'the_config'
+        client = self.driver.clients[API_VERSION]
+        client.upload_bundle.side_effect = None
+        secret_md5 = md5(b'the_secret', usedforsecurity=False).hexdigest()
+        secret_name = hashlib.sha1(b'the_secret').hexdigest() + '.pem'
+
+        # The certificates that are not in the manifest are sent
+        client.upload_bundle.return_value = []
+        self.driver.update_amphora_listeners(self.lb, self.amp,
+                                             self.timeout_dict)
+        client.upload_bundle.assert_called_once_with(
+            self.amp, self.lb.id, mock.ANY, contents=mock.ANY,
+            config='the_config', reload=True, timeout_dict=self.timeout_dict)
+        md5sums = client.upload_bundle.call_args[0][2]
+        self.assertEqual(secret_md5, md5sums[secret_name])
+        self.assertIn(self.sl.default_tls_container.id + '.pem', md5sums)
+        self.assertIn(self.sl.id + '.pem', md5sums)
+        self.assertEqual(
+            set(md5sums.values()),
+            set(client.upload_bundle.call_args[1]['contents']))
+        client.get_cert_md5sum.assert_not_called()
+        client.upload_cert_pem.assert_not_called()
+        client.upload_config.assert_not_called()
+        client.reload_listener.assert_not_called()
+
+        # The amphora has all the certificates of the manifest
+        self.cert_manifest.update(md5sums)
+        client.upload_bundle.reset_mock()
+        self.driver.update_amphora_listeners(self.lb, self.amp,
+                                             self.timeout_dict)
+        client.upload_bundle.assert_called_once_with(
+            self.amp, self.lb.id, md5sums, contents={}, config='the_config',
+            reload=True, timeout_dict=self.timeout_dict)
+
+        # Only the missing certificates are sent
+        client.upload_bundle.reset_mock()
+        client.upload_bundle.side_effect = [[secret_md5], []]
+        self.driver.update_amphora_listeners(self.lb, self.amp,
+                                             self.timeout_dict)
+        client.upload_bundle.assert_called_with(
+            self.amp, self.lb.id, md5sums,
+            contents={secret_md5: b'the_secret'}, config='the_config',
+            reload=True, timeout_dict=self.timeout_dict)
+
+        # The certificates are still missing
+        client.upload_bundle.side_effect = [[secret_md5], [secret_md5]]
+        self.assertRaises(exc.Conflict, self.driver.update_amphora_listeners,
+                          self.lb, self.amp, self.timeout_dict)
+
+    def test_upload_cert_manifest(self):
+        client = self.driver.clients[API_VERSION]
+
+        # The certificate of the manifest is still verified, it could have
+        # been deleted by another process
+        self.cert_manifest['cert.pem'] = 'md5'
+        client.get_cert_md5sum.return_value = 'md5'
+        self.driver._upload_cert(self.amp, self.lb.id, b'pem', 'md5',
+                                 'cert.pem')
+        client.get_cert_md5sum.assert_called_once_with(
+            self.amp, self.lb.id, 'cert.pem', ignore=(404,))
+        client.upload_cert_pem.assert_not_called()
+
+        # The certificate is uploaded and added to the manifest
+        client.get_cert_md5sum.return_value = None
+        self.driver._upload_cert(self.amp, self.lb.id, b'pem', 'md5',
+                                 'cert.pem')
+        client.upload_cert_pem.assert_called_once_with(
+            self.amp, self.lb.id, 'cert.pem', b'pem')
+        self.assertEqual({'cert.pem': 'md5'}, self.cert_manifest)
+
+    @mock.patch('octavia.amphorae.drivers.haproxy.rest_api_driver.'
+                'HaproxyAmphoraLoadBalancerDriver._process_secret')
+    @mock.patch('octavia.common.tls_utils.cert_parser.load_certificates_data')
+    def test_update_members(self, mock_load_cert, mock_secret):
+        mock_secret.return_value = 'filename.pem'
+        mock_load_cert.return_value = {
+            'tls_cert': self.sl.default_tls_container, 'sni_certs': [],
+            'client_ca_cert': None}
+        self.driver.jinja_combo.build_config.return_value = 'the_config'
+        client = self.driver.clients[API_VERSION]
+
+        # The members are updated without a reload
+        client.update_members.return_value = True
+        self.driver.update_members(self.lb)
+        client.update_members.assert_called_once_with(
+            self.amp, self.lb.id, 'the_config', timeout_dict=None)
+        client.upload_config.assert_not_called()
+        client.reload_listener.assert_not_called()
+
+        # The changes require a reload
+        client.update_members.return_value = False
+        self.driver.update_members(self.lb)
+        client.upload_config.assert_called_once_with(
+            self.amp, self.lb.id, 'the_config', timeout_dict=None)
+        client.reload_listener.assert_called_once_with(
+            self.amp, self.lb.id, timeout_dict=None)
+
+        # The amphora agent does not support the API
+        client.upload_config.reset_mock()
+        client.reload_listener.reset_mock()
+        client.update_members.side_effect = exc.NotFound
+        self.driver.update_members(self.lb)
+        client.upload_config.assert_called_once_with(
+            self.amp, self.lb.id, 'the_config', timeout_dict=None)
+        client.reload_listener.assert_called_once_with(
+            self.amp, self.lb.id, timeout_dict=None)
+
     @mock.patch('octavia.db.api.session')
     @mock.patch('octavia.db.repositories.ListenerRepository.update')
     @mock.patch('octavia.common.tls_utils.cert_parser.load_certificates_data')
@@ -257,9 +439,9 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
             self.amp, self.lb.id, timeout_dict=None)
         secret_calls = [
             mock.call(self.sl, self.sl.client_ca_tls_certificate_id, self.amp,
-                      self.lb.id),
+                      self.lb.id, bundle=mock.ANY),
             mock.call(self.sl, self.sl.client_crl_container_id, self.amp,
-                      self.lb.id)
+                      self.lb.id, bundle=mock.ANY)
         ]
         mock_secret.assert_has_calls(secret_calls)
 
@@ -368,7 +550,7 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
             fake_context, sample_listener.client_ca_tls_certificate_id)
         mock_upload_cert.assert_called_once_with(
             self.amp, sample_listener.id, pem=fake_secret,
-            md5sum=ref_md5, name=ref_name)
+            md5sum=ref_md5, name=ref_name, bundle=None)
         self.assertEqual(ref_name, result)
 
     @mock.patch('octavia.amphorae.drivers.haproxy.rest_api_driver.'
@@ -390,9 +572,11 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
 
         pool_certs_calls = [
             mock.call(sample_listener, sample_listener.default_pool,
-                      self.amp, sample_listener.load_balancer.id),
+                      self.amp, sample_listener.load_balancer.id,
+                      bundle=None),
             mock.call(sample_listener, sample_listener.pools[1],
-                      self.amp, sample_listener.load_balancer.id)
+                      self.amp, sample_listener.load_balancer.id,
+                      bundle=None)
         ]
 
         mock_pool_cert.assert_has_calls(pool_certs_calls, any_order=True)
@@ -442,15 +626,17 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
         secret_calls = [
             mock.call(sample_listener,
                       sample_listener.default_pool.ca_tls_certificate_id,
-                      self.amp, sample_listener.load_balancer.id),
+                      self.amp, sample_listener.load_balancer.id,
+                      bundle=None),
             mock.call(sample_listener,
                       sample_listener.default_pool.crl_container_id,
-                      self.amp, sample_listener.load_balancer.id)]
+                      self.amp, sample_listener.load_balancer.id,
+                      bundle=None)]
 
         mock_build_pem.assert_called_once_with(pool_cert)
         mock_upload_cert.assert_called_once_with(
             self.amp, sample_listener.load_balancer.id, pem=fake_pem,
-            md5sum=ref_md5, name=ref_name)
+            md5sum=ref_md5, name=ref_name, bundle=None)
         mock_secret.assert_has_calls(secret_calls)
         self.assertEqual(ref_result, result)
 
@@ -510,6 +696,34 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
             API_VERSION].reload_listener.assert_called_once_with(
             amp1, loadbalancer.id, timeout_dict)
 
+    def test_reload_amphorae_concurrently(self):
+        amp1 = mock.MagicMock(api_version=API_VERSION)
+        amp2 = mock.MagicMock(api_version=API_VERSION)
+        loadbalancer = mock.MagicMock()
+        loadbalancer.amphorae = [amp1, amp2]
+        loadbalancer.listeners = [
+            mock.MagicMock(protocol=constants.PROTOCOL_HTTP)]
+        # Both amphorae must be reloading at the same time
+        barrier = threading.Barrier(2, timeout=10)
+        reload_listener = self.driver.clients[API_VERSION].reload_listener
+        reload_listener.side_effect = lambda *args: barrier.wait()
+
+        self.driver.reload(loadbalancer)
+
+        reload_listener.assert_has_calls(
+            [mock.call(amp1, loadbalancer.id, None),
+             mock.call(amp2, loadbalancer.id, None)], any_order=True)
+
+        # All the amphorae are reloaded before raising the first error
+        reload_listener.reset_mock()
+        reload_listener.side_effect = [exc.InternalServerError(), None]
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="haproxy_amphora", amphora_update_threads=1)
+
+        self.assertRaises(exc.InternalServerError, self.driver.reload,
+                          loadbalancer)
+        self.assertEqual(2, reload_listener.call_count)
+
     def test_start_with_amphora(self):
         # Execute driver method
         amp = mock.MagicMock()
@@ -688,6 +902,20 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
                          'api_version': '1.0'}
         result = self.driver.get_info(self.amp)
         self.assertEqual(expected_info, result)
+        # The changed versions are stored
+        self.driver.amphora_repo.update.assert_called_once_with(
+            self.mock_db_session().begin().__enter__(), self.amp.id,
+            haproxy_version='1.6.3-1ubuntu0.1')
+        # The amphora object is updated for the rest of the flow
+        self.assertEqual('1.6.3-1ubuntu0.1', self.amp.haproxy_version)
+        self.assertEqual(['1', '6'],
+                         self.driver._get_haproxy_versions(self.amp))
+
+    @mock.patch('octavia.amphorae.drivers.haproxy.rest_api_driver.'
+                'SESSION_POOL')
+    def test_close_connections(self, mock_session_pool):
+        self.driver.close_connections(self.amp.id)
+        mock_session_pool.close.assert_called_once_with(self.amp.id)
 
     def test_get_diagnostics(self):
         # TODO(johnsom) Implement once this exists on the amphora agent.
@@ -867,6 +1095,19 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
         self.driver.clients[API_VERSION].get_info.assert_called_once_with(
             self.amp, timeout_dict=None)
         self.assertEqual(ref_haproxy_versions, result)
+        # The version is stored for the next updates
+        self.driver.amphora_repo.update.assert_called_once_with(
+            self.mock_db_session().begin().__enter__(), self.amp.id,
+            haproxy_version='1.6.3-1ubuntu0.1')
+
+    def test_get_haproxy_versions_stored(self):
+        mock_amp = mock.MagicMock()
+        mock_amp.haproxy_version = '2.4.22-0ubuntu0.22.04.3'
+        result = self.driver._get_haproxy_versions(mock_amp)
+        self.assertEqual(['2', '4'], result)
+        self.driver.clients['base'].get_api_version.assert_not_called()
+        self.driver.clients[API_VERSION].get_info.assert_not_called()
+        self.driver.amphora_repo.update.assert_not_called()
 
     def test_get_haproxy_versions_with_timeout_dict(self):
         ref_haproxy_versions = ['1', '6']
@@ -890,8 +1131,12 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
         result = self.driver._populate_amphora_api_version(mock_amp)
         self.assertEqual(API_VERSION, mock_amp.api_version)
         self.assertEqual(ref_haproxy_version, result)
+        self.driver.amphora_repo.update.assert_called_once_with(
+            self.mock_db_session().begin().__enter__(), mock_amp.id,
+            api_version=API_VERSION)
 
         # Existing version passed in
+        self.driver.amphora_repo.update.reset_mock()
         fake_version = '9999.9999'
         ref_haproxy_version = list(map(int, fake_version.split('.')))
         mock_amp = mock.MagicMock()
@@ -899,6 +1144,7 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
         result = self.driver._populate_amphora_api_version(mock_amp)
         self.assertEqual(fake_version, mock_amp.api_version)
         self.assertEqual(ref_haproxy_version, result)
+        self.driver.amphora_repo.update.assert_not_called()
 
     def test_update_amphora_agent_config(self):
         self.driver.update_amphora_agent_config(
@@ -906,6 +1152,9 @@ class TestHaproxyAmphoraLoadBalancerDriverTest(base.TestCase):
         self.driver.clients[
             API_VERSION].update_agent_config.assert_called_once_with(
             self.amp, octavia_utils.b('test'), timeout_dict=None)
+        # The versions of the amphora are refreshed
+        self.driver.clients[API_VERSION].get_info.assert_called_once_with(
+            self.amp, raise_retry_exception=False, timeout_dict=None)
 
 
 class TestAmphoraAPIClientTest(base.TestCase):
@@ -932,6 +1181,37 @@ class TestAmphoraAPIClientTest(base.TestCase):
                              constants.REQ_READ_TIMEOUT: 2,
                              constants.CONN_MAX_RETRIES: 3,
                              constants.CONN_RETRY_INTERVAL: 4}
+        self.session_pool = driver.AmphoraSessionPool()
+        mock.patch.object(driver, 'SESSION_POOL', self.session_pool).start()
+
+    def test_session_pool(self):
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="haproxy_amphora", connection_pool_size=2,
+                    connection_pool_maxsize=3)
+
+        session1 = self.session_pool.get(FAKE_UUID_1)
+        self.assertIs(session1, self.session_pool.get(FAKE_UUID_1))
+        adapter = session1.get_adapter(self.base_url)
+        self.assertEqual(FAKE_UUID_1, adapter.uuid)
+        self.assertEqual(3, adapter._pool_maxsize)
+        self.assertEqual(cfg.CONF.haproxy_amphora.client_cert, session1.cert)
+
+        session2 = self.session_pool.get(uuidutils.generate_uuid())
+        self.assertIsNot(session1, session2)
+
+        # The least recently used session is closed
+        self.session_pool.get(FAKE_UUID_1)
+        with mock.patch.object(session2, 'close') as mock_close:
+            self.session_pool.get(uuidutils.generate_uuid())
+            mock_close.assert_called_once_with()
+        self.assertIs(session1, self.session_pool.get(FAKE_UUID_1))
+
+        with mock.patch.object(session1, 'close') as mock_close:
+            self.session_pool.close(FAKE_UUID_1)
+            mock_close.assert_called_once_with()
+        self.assertIsNot(session1, self.session_pool.get(FAKE_UUID_1))
+        # Unknown amphora
+        self.session_pool.close(uuidutils.generate_uuid())
 
     def test_base_url(self):
         url = self.driver._base_url(FAKE_IP)
@@ -948,6 +1228,60 @@ class TestAmphoraAPIClientTest(base.TestCase):
                           self.driver.request, 'get', self.amp,
                           'unavailableURL', self.timeout_dict)
 
+    @mock.patch('random.uniform', side_effect=lambda low, high: high)
+    @mock.patch('requests.Session.get')
+    @mock.patch('octavia.amphorae.drivers.haproxy.rest_api_driver.time.sleep')
+    def test_request_backoff(self, mock_sleep, mock_get, mock_uniform):
+        mock_get.side_effect = requests.ConnectionError
+        self.assertRaises(driver_except.TimeOutException,
+                          self.driver.request, 'get', self.amp,
+                          'unavailableURL', self.timeout_dict)
+
+        # The waits double up to the retry interval, for a total wait of
+        # the retry threshold multiplied by the retry interval
+        self.assertEqual([mock.call(1), mock.call(2), mock.call(4),
+                          mock.call(4), mock.call(4)],
+                         mock_sleep.call_args_list)
+        mock_uniform.assert_has_calls([mock.call(0.5, 1), mock.call(1, 2)])
+        self.assertEqual(5, mock_get.call_count)
+
+        # A response resets the backoff
+        mock_get.side_effect = None
+        self.driver.request('get', self.amp, 'info', self.timeout_dict)
+        self.assertEqual(
+            0, self.session_pool.get(self.amp.id).connection_failures)
+
+    @mock.patch('requests.Session.get', side_effect=requests.ConnectionError)
+    @mock.patch('octavia.amphorae.drivers.haproxy.rest_api_driver.time.sleep')
+    def test_request_fixed_interval(self, mock_sleep, mock_get):
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="haproxy_amphora",
+                    connection_retry_initial_interval=4)
+        self.assertRaises(driver_except.TimeOutException,
+                          self.driver.request, 'get', self.amp,
+                          'unavailableURL', self.timeout_dict)
+        self.assertEqual([mock.call(4)] * 3, mock_sleep.call_args_list)
+        self.assertEqual(3, mock_get.call_count)
+
+    @mock.patch('octavia.db.api.session')
+    @mock.patch('octavia.amphorae.drivers.haproxy.rest_api_driver.time.sleep')
+    def test_wait_before_retry_booting(self, mock_sleep, mock_session):
+        session = self.session_pool.get(self.amp.id)
+        session.connection_failures = 2
+        self.amp.status = constants.AMPHORA_BOOTING
+        self.driver.amphora_health_repo = mock.MagicMock()
+        self.driver.amphora_health_repo.get.side_effect = [None,
+                                                           mock.MagicMock()]
+
+        # The wait ends after the first heartbeat of the agent
+        self.assertEqual(4, self.driver._wait_before_retry(self.amp, session,
+                                                           4))
+        self.assertEqual([mock.call(1.0)] * 2, mock_sleep.call_args_list)
+        self.driver.amphora_health_repo.get.assert_called_with(
+            mock_session.return_value.begin.return_value.__enter__
+            .return_value, amphora_id=self.amp.id)
+        self.assertEqual(3, session.connection_failures)
+
     @requests_mock.mock()
     def test_get_api_version(self, mock_requests):
         ref_api_version = {'api_version': '0.1'}
@@ -965,6 +1299,27 @@ class TestAmphoraAPIClientTest(base.TestCase):
         information = self.driver.get_info(self.amp)
         self.assertEqual(info, information)
 
+    @requests_mock.mock()
+    def test_get_info_if_none_match(self, m):
+        info = {"hostname": "some_hostname", "version": "some_version",
+                "api_version": "1.0", "uuid": FAKE_UUID_1}
+        m.get(f"{self.base_url_ver}/info",
+              [{'json': info, 'headers': {'ETag': '"etag1"'}},
+               {'status_code': 304},
+               {'json': {}, 'headers': {'ETag': '"etag2"'}}])
+
+        self.assertEqual(info, self.driver.get_info(self.amp))
+        self.assertNotIn('If-None-Match', m.last_request.headers)
+
+        # The amphora returns a 304 when the info is unchanged
+        self.assertEqual(info, self.driver.get_info(self.amp))
+        self.assertEqual('"etag1"', m.last_request.headers['If-None-Match'])
+
+        self.assertEqual({}, self.driver.get_info(self.amp))
+        self.assertEqual('"etag1"', m.last_request.headers['If-None-Match'])
+        self.assertEqual(('"etag2"', {}),
+                         self.session_pool.get(self.amp.id).info)
+
     @requests_mock.mock()
     def test_get_info_with_timeout_dict(self, m):
         info = {"hostname": "some_hostname", "version": "some_version",
@@ -1365,6 +1720,146 @@ class TestAmphoraAPIClientTest(base.TestCase):
                                   config)
         self.assertTrue(m.called)
 
+    @requests_mock.mock()
+    def test_upload_config_compressed(self, m):
+        url = (f"{self.base_url_ver}/loadbalancer/{self.amp.id}/"
+               f"{FAKE_UUID_1}/haproxy")
+        m.put(url, status_code=202)
+        config = 'x' * driver.COMPRESS_MIN_SIZE
+        driver.GZIP_CACHE.clear()
+        self.addCleanup(driver.GZIP_CACHE.clear)
+
+        # The agent does not support the gzip content encoding
+        self.driver.upload_config(self.amp, FAKE_UUID_1, config)
+        self.assertNotIn('Content-Encoding', m.last_request.headers)
+        self.assertEqual(config, m.last_request.text)
+
+        m.get(f"{self.base_url_ver}/details",
+              json={'content_encodings': ['gzip']})
+        self.driver.get_details(self.amp)
+        self.driver.upload_config(self.amp, FAKE_UUID_1, config)
+        self.assertEqual('gzip', m.last_request.headers['Content-Encoding'])
+        self.assertEqual(config.encode('utf-8'),
+                         gzip.decompress(m.last_request.body))
+        # The compressed bodies are cached by digest, not by content
+        self.assertEqual(
+            [hashlib.sha256(config.encode('utf-8')).digest()],
+            list(driver.GZIP_CACHE._configs))
+
+        # The small configurations are not compressed
+        self.driver.upload_config(self.amp, FAKE_UUID_1, 'small')
+        self.assertEqual('small', m.last_request.text)
+
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="haproxy_amphora", compress_uploads=False)
+        self.driver.upload_config(self.amp, FAKE_UUID_1, config)
+        self.assertEqual(config, m.last_request.text)
+
+    @requests_mock.mock()
+    def test_upload_bundle(self, m):
+        url = (f"{self.base_url_ver}/loadbalancer/{self.amp.id}/"
+               f"{FAKE_UUID_1}/bundle")
+        md5sums = {'cert.pem': 'd41d8cd98f00b204e9800998ecf8427e'}
+        m.put(url, status_code=202)
+        self.assertEqual([], self.driver.upload_bundle(
+            self.amp, FAKE_UUID_1, md5sums,
+            contents={'d41d8cd98f00b204e9800998ecf8427e': b'cert'},
+            config='the_config', reload=True))
+        self.assertEqual(
+            {'certificates': md5sums,
+             'contents': {'d41d8cd98f00b204e9800998ecf8427e': 'Y2VydA=='},
+             'config': 'the_config',
+             'reload': True},
+            m.last_request.json())
+
+        self.driver.upload_bundle(self.amp, FAKE_UUID_1, md5sums)
+        self.assertEqual(
+            {'certificates': md5sums, 'contents': {}, 'reload': False},
+            m.last_request.json())
+
+        m.put(url, status_code=409,
+              json={'message': 'Missing certificates',
+                    'missing': ['d41d8cd98f00b204e9800998ecf8427e']})
+        self.assertEqual(['d41d8cd98f00b204e9800998ecf8427e'],
+                         self.driver.upload_bundle(self.amp, FAKE_UUID_1,
+                                                   md5sums))
+
+        m.put(url, status_code=404)
+        self.assertRaises(exc.NotFound, self.driver.upload_bundle,
+                          self.amp, FAKE_UUID_1, md5sums)
+
+        # The agent is not asked again for the bundles
+        call_count = m.call_count
+        self.assertRaises(exc.NotFound, self.driver.upload_bundle,
+                          self.amp, FAKE_UUID_1, md5sums)
+        self.assertEqual(call_count, m.call_count)
+
+    @requests_mock.mock()
+    def test_cert_manifest(self, m):
+        url = (f"{self.base_url_ver}/loadbalancer/{FAKE_UUID_1}/"
+               f"certificates/{FAKE_PEM_FILENAME}")
+        manifest = self.driver.get_cert_manifest(self.amp, FAKE_UUID_1)
+        self.assertEqual({}, manifest)
+
+        m.get(url, json={"md5sum": "some_real_sum"})
+        self.driver.get_cert_md5sum(self.amp, FAKE_UUID_1, FAKE_PEM_FILENAME)
+        self.assertEqual({FAKE_PEM_FILENAME: "some_real_sum"}, manifest)
+
+        m.get(url, status_code=404,
+              headers={'content-type': 'application/json'})
+        self.driver.get_cert_md5sum(self.amp, FAKE_UUID_1, FAKE_PEM_FILENAME,
+                                    ignore=(404,))
+        self.assertEqual({}, manifest)
+
+        bundle_url = (f"{self.base_url_ver}/loadbalancer/{self.amp.id}/"
+                      f"{FAKE_UUID_1}/bundle")
+        md5sums = {'cert.pem': 'md5', FAKE_PEM_FILENAME: 'other_md5'}
+        m.put(bundle_url, status_code=202)
+        self.driver.upload_bundle(self.amp, FAKE_UUID_1, md5sums)
+        self.assertEqual(md5sums, manifest)
+
+        m.put(bundle_url, status_code=409, json={'missing': ['md5']})
+        self.driver.upload_bundle(self.amp, FAKE_UUID_1, md5sums)
+        self.assertEqual({FAKE_PEM_FILENAME: 'other_md5'}, manifest)
+
+        m.delete(url)
+        self.driver.delete_cert_pem(self.amp, FAKE_UUID_1, FAKE_PEM_FILENAME)
+        self.assertEqual({}, manifest)
+
+        # The certificates are deleted with the load balancer
+        manifest['cert.pem'] = 'md5'
+        m.delete(f"{self.base_url_ver}/listeners/{FAKE_UUID_1}")
+        self.driver.delete_listener(self.amp, FAKE_UUID_1)
+        self.assertEqual(
+            {}, self.driver.get_cert_manifest(self.amp, FAKE_UUID_1))
+
+        # The manifest is lost when the amphora is deleted
+        manifest = self.driver.get_cert_manifest(self.amp, FAKE_UUID_1)
+        manifest['cert.pem'] = 'md5'
+        self.session_pool.close(self.amp.id)
+        self.assertEqual(
+            {}, self.driver.get_cert_manifest(self.amp, FAKE_UUID_1))
+
+    @requests_mock.mock()
+    def test_update_members(self, m):
+        url = (f"{self.base_url_ver}/loadbalancer/{self.amp.id}/"
+               f"{FAKE_UUID_1}/haproxy/members")
+        m.put(url, status_code=202)
+        self.assertTrue(self.driver.update_members(self.amp, FAKE_UUID_1,
+                                                   'the_config'))
+        self.assertEqual('the_config', m.last_request.body)
+
+        m.put(url, status_code=409)
+        self.assertFalse(self.driver.update_members(self.amp, FAKE_UUID_1,
+                                                    'the_config'))
+
+        # Old amphora agents don't have the endpoint, it is not retried
+        m.reset_mock()
+        m.put(url, status_code=404)
+        self.assertRaises(exc.NotFound, self.driver.update_members,
+                          self.amp, FAKE_UUID_1, 'the_config')
+        self.assertEqual(1, m.call_count)
+
     @requests_mock.mock()
     def test_upload_invalid_config(self, m):
         config = '{"name": "bad_config"}'
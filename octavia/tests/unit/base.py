@@ -19,7 +19,9 @@ import oslo_messaging as messaging
 from oslo_messaging import conffixture as messaging_conffixture
 import testtools
 
+from octavia.certificates.manager import cert_mgr
 from octavia.common import clients
+from octavia.common.jinja.haproxy.combined_listeners import jinja_cfg
 from octavia.common import rpc
 
 # needed for tests to function when run independently:
@@ -41,6 +43,9 @@ class TestCase(testtools.TestCase):
     def clean_caches(self):
         clients.NovaAuth.nova_client = None
         clients.NeutronAuth.neutron_client = None
+        cert_mgr.CACHE.invalidate()
+        jinja_cfg.RENDER_CACHE.clear()
+        jinja_cfg.MEMBER_CACHE.clear()
 
 
 class TestRpc(testtools.TestCase):
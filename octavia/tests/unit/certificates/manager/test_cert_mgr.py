@@ -0,0 +1,194 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from concurrent import futures
+import threading
+from unittest import mock
+
+from oslo_config import cfg
+from oslo_config import fixture as oslo_fixture
+from oslo_context import context as oslo_context
+
+from octavia.certificates.common import local
+from octavia.certificates.manager import cert_mgr
+import octavia.tests.unit.base as base
+
+
+class FakeCertManager:
+
+    def __init__(self):
+        self.get_cert_mock = mock.MagicMock()
+        self.get_secret_mock = mock.MagicMock()
+        self.delete_cert = mock.MagicMock()
+        self.unset_acls = mock.MagicMock()
+        self.set_acls = mock.MagicMock()
+
+    def get_cert(self, context, cert_ref, resource_ref=None, check_only=False,
+                 service_name=None):
+        return self.get_cert_mock(cert_ref, check_only=check_only)
+
+    def get_secret(self, context, secret_ref):
+        return self.get_secret_mock(secret_ref)
+
+
+class TestCertCache(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        self.cache = cert_mgr.CertCache()
+        mock.patch('octavia.certificates.manager.cert_mgr.CACHE',
+                   self.cache).start()
+        self.mock_time = mock.patch('time.monotonic', return_value=100).start()
+        self.fake_manager = FakeCertManager()
+        self.manager = cert_mgr.CachedCertManager(self.fake_manager)
+        self.context = oslo_context.RequestContext(project_id='project1')
+
+    def test_get_secret(self):
+        self.fake_manager.get_secret_mock.return_value = 'secret'
+
+        self.assertEqual('secret', self.manager.get_secret(self.context,
+                                                           'ref1'))
+        self.assertEqual('secret', self.manager.get_secret(self.context,
+                                                           'ref1'))
+        self.fake_manager.get_secret_mock.assert_called_once_with('ref1')
+
+        # The entries are encrypted
+        self.assertNotIn(b'secret', self.cache._entries[
+            ('secret', 'ref1', 'project1')][1][0][1])
+
+        # The entries are per project
+        self.manager.get_secret(
+            oslo_context.RequestContext(project_id='project2'), 'ref1')
+        self.assertEqual(2, self.fake_manager.get_secret_mock.call_count)
+
+        # The entries expire
+        self.mock_time.return_value = 161
+        self.manager.get_secret(self.context, 'ref1')
+        self.assertEqual(3, self.fake_manager.get_secret_mock.call_count)
+
+        # The entries are invalidated
+        self.cache.invalidate('ref1')
+        self.manager.get_secret(self.context, 'ref1')
+        self.assertEqual(4, self.fake_manager.get_secret_mock.call_count)
+
+    def test_get_cert(self):
+        cert = mock.MagicMock()
+        cert.get_certificate.return_value = b'cert'
+        cert.get_private_key.return_value = 'key'
+        cert.get_intermediates.return_value = [b'int']
+        cert.get_private_key_passphrase.return_value = None
+        self.fake_manager.get_cert_mock.return_value = cert
+
+        # The loaded and the cached certificates have the same type
+        loaded = self.manager.get_cert(self.context, 'ref1', check_only=True)
+        cached = self.manager.get_cert(self.context, 'ref1', check_only=True)
+        self.fake_manager.get_cert_mock.assert_called_once_with(
+            'ref1', check_only=True)
+        self.assertIsInstance(loaded, local.LocalCert)
+        self.assertIsInstance(cached, local.LocalCert)
+        self.assertEqual(b'cert', loaded.get_certificate())
+        self.assertEqual(b'cert', cached.get_certificate())
+        self.assertEqual('key', cached.get_private_key())
+        self.assertEqual([b'int'], cached.get_intermediates())
+        self.assertIsNone(cached.get_private_key_passphrase())
+
+        # The certificates retrieved with a registration are cached apart
+        self.manager.get_cert(self.context, 'ref1')
+        self.assertEqual(2, self.fake_manager.get_cert_mock.call_count)
+
+    def test_get_disabled(self):
+        self.conf.config(group='certificates', cache_ttl=0)
+        self.manager.get_secret(self.context, 'ref1')
+        self.manager.get_secret(self.context, 'ref1')
+        self.assertEqual(2, self.fake_manager.get_secret_mock.call_count)
+        self.assertEqual({}, self.cache._entries)
+
+    def test_get_bounded(self):
+        self.conf.config(group='certificates', cache_size=2,
+                         cache_encryption=False)
+        for ref in ('ref1', 'ref2', 'ref1', 'ref3'):
+            self.manager.get_secret(self.context, ref)
+
+        self.assertEqual([('secret', 'ref1', 'project1'),
+                          ('secret', 'ref3', 'project1')],
+                         list(self.cache._entries))
+        self.assertEqual(3, self.fake_manager.get_secret_mock.call_count)
+
+    def test_get_concurrent(self):
+        self._test_get_concurrent()
+
+    def test_get_concurrent_disabled(self):
+        self.conf.config(group='certificates', cache_ttl=0)
+        self._test_get_concurrent()
+        self.assertEqual({}, self.cache._entries)
+
+    def _test_get_concurrent(self):
+        loading = threading.Event()
+        loaded = threading.Event()
+
+        def get_secret(secret_ref):
+            loading.set()
+            loaded.wait(10)
+            return b'secret'
+        self.fake_manager.get_secret_mock.side_effect = get_secret
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(self.manager.get_secret, self.context,
+                                    'ref1')
+            loading.wait(10)
+            # The second get waits for the load of the first one
+            second = executor.submit(self.manager.get_secret, self.context,
+                                     'ref1')
+            loaded.set()
+        self.assertEqual(b'secret', first.result())
+        self.assertEqual(b'secret', second.result())
+        self.fake_manager.get_secret_mock.assert_called_once_with('ref1')
+        self.assertEqual({}, self.cache._loading)
+
+        # A failed load is not cached
+        self.fake_manager.get_secret_mock.side_effect = ValueError('boom')
+        self.assertRaises(ValueError, self.manager.get_secret, self.context,
+                          'ref2')
+        self.assertEqual({}, self.cache._loading)
+        self.fake_manager.get_secret_mock.side_effect = None
+        self.fake_manager.get_secret_mock.return_value = b'secret2'
+        self.assertEqual(b'secret2',
+                         self.manager.get_secret(self.context, 'ref2'))
+
+    def test_invalidate_all(self):
+        self.fake_manager.get_cert_mock.return_value = local.LocalCert(
+            b'cert', b'key')
+        self.fake_manager.get_secret_mock.return_value = b'secret'
+        self.manager.get_secret(self.context, 'ref1')
+        self.manager.get_cert(self.context, 'ref2')
+        self.cache.invalidate()
+        self.assertEqual({}, self.cache._entries)
+
+    def test_delete_cert(self):
+        self.fake_manager.get_secret_mock.return_value = b'secret'
+        self.manager.get_secret(self.context, 'ref1')
+
+        self.manager.delete_cert(self.context, 'ref1', 'resource_ref')
+        self.fake_manager.delete_cert.assert_called_once_with(
+            self.context, 'ref1', 'resource_ref', service_name=None)
+        self.assertEqual({}, self.cache._entries)
+
+        self.manager.get_secret(self.context, 'ref1')
+        self.manager.unset_acls(self.context, 'ref1')
+        self.fake_manager.unset_acls.assert_called_once_with(self.context,
+                                                             'ref1')
+        self.assertEqual({}, self.cache._entries)
+
+        # The other methods are not cached
+        self.manager.set_acls(self.context, 'ref1')
+        self.fake_manager.set_acls.assert_called_once_with(self.context,
+                                                           'ref1')
@@ -41,6 +41,9 @@ class TestAmphoraAgentCMD(base.TestCase):
         self.assertEqual(
             ssl.CERT_REQUIRED,
             mock_amp.call_args[0][1]['cert_reqs'])
+        # The requests are handled by threads
+        self.assertEqual('gthread', mock_amp.call_args[0][1]['worker_class'])
+        self.assertEqual(8, mock_amp.call_args[0][1]['threads'])
 
         mock_health_proc.start.assert_called_once_with()
         mock_amp_instance.run.assert_called_once()
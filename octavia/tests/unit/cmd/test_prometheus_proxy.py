@@ -11,7 +11,11 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import gzip
+import http.client
+import io
 import signal
+import threading
 from unittest import mock
 
 from octavia.cmd import prometheus_proxy
@@ -65,10 +69,12 @@ class TestPrometheusProxyCMD(base.TestCase):
 
         self.assertEqual(expected_result, result)
 
+    @mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                prometheus_proxy.MetricsCache(1))
     @mock.patch('octavia.cmd.prometheus_proxy.PRINT_REJECTED', True)
     # No need to print all of the rejected lines to the log
     @mock.patch('builtins.print')
-    @mock.patch('urllib.request.urlopen')
+    @mock.patch('octavia.cmd.prometheus_proxy.UPSTREAM_POOL.open')
     @mock.patch('os.cpu_count', return_value=2)
     @mock.patch('psutil.getloadavg', return_value=(1, 2, 3))
     @mock.patch('psutil.virtual_memory', return_value=(1, 2, 23.5))
@@ -86,6 +92,9 @@ class TestPrometheusProxyCMD(base.TestCase):
         proxy.end_headers = mock_end_headers
         mock_wfile = mock.MagicMock()
         proxy.wfile = mock_wfile
+        proxy.headers = {}
+        proxy.path = '/metrics'
+        proxy.request_version = 'HTTP/1.0'
 
         with open("octavia/tests/common/sample_haproxy_prometheus",
                   "rb") as file:
@@ -94,20 +103,335 @@ class TestPrometheusProxyCMD(base.TestCase):
             proxy.do_GET()
 
             mock_send_response.assert_called_once_with(200)
+            mock_send_header.assert_any_call('content-length', mock.ANY)
+            # The scraper connection is kept open
+            self.assertNotIn(mock.call('connection', 'close'),
+                             mock_send_header.mock_calls)
 
             with open("octavia/tests/common/sample_octavia_prometheus",
                       "rb") as file2:
                 octavia_metrics = file2.read()
                 mock_wfile.write.assert_called_once_with(octavia_metrics)
 
-    @mock.patch('urllib.request.urlopen')
+    @mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                prometheus_proxy.MetricsCache(0))
+    @mock.patch('octavia.cmd.prometheus_proxy.CHUNK_SIZE', 1024)
+    @mock.patch('octavia.cmd.prometheus_proxy.UPSTREAM_POOL.open')
+    @mock.patch('os.cpu_count', return_value=2)
+    @mock.patch('psutil.getloadavg', return_value=(1, 2, 3))
+    @mock.patch('psutil.virtual_memory', return_value=(1, 2, 23.5))
+    @mock.patch('http.server.SimpleHTTPRequestHandler.__init__')
+    def test_do_get_chunked(self, mock_req_handler_init, mock_virt_mem,
+                            mock_getloadavg, mock_cpu_count, mock_urlopen):
+        mock_req_handler_init.return_value = None
+        proxy = prometheus_proxy.PrometheusProxy()
+
+        proxy.send_response = mock.MagicMock()
+        proxy.send_header = mock.MagicMock()
+        proxy.end_headers = mock.MagicMock()
+        proxy.wfile = io.BytesIO()
+        proxy.headers = {}
+        proxy.path = '/metrics'
+        proxy.request_version = 'HTTP/1.1'
+
+        with open("octavia/tests/common/sample_haproxy_prometheus",
+                  "rb") as file:
+            mock_urlopen.return_value = file
+
+            proxy.do_GET()
+
+        proxy.send_response.assert_called_once_with(200)
+        proxy.send_header.assert_any_call('transfer-encoding', 'chunked')
+
+        # Decode the chunked payload
+        stream = io.BytesIO(proxy.wfile.getvalue())
+        payload = b''
+        chunk_count = 0
+        while True:
+            size = int(stream.readline().strip(), 16)
+            if size == 0:
+                self.assertEqual(b'\r\n', stream.readline())
+                break
+            payload += stream.read(size)
+            self.assertEqual(b'\r\n', stream.read(2))
+            chunk_count += 1
+        self.assertEqual(b'', stream.read())
+        self.assertGreater(chunk_count, 1)
+
+        with open("octavia/tests/common/sample_octavia_prometheus",
+                  "rb") as file2:
+            self.assertEqual(file2.read(), payload)
+
+    def test_rewrite_metric_line(self):
+        self.assertEqual(
+            '# TYPE octavia_listener_current_sessions gauge\n',
+            prometheus_proxy.rewrite_metric_line(
+                '# TYPE haproxy_frontend_current_sessions gauge\n'))
+        self.assertEqual(
+            'octavia_member_current_sessions{pool="p:l",member="m"} 3\n',
+            prometheus_proxy.rewrite_metric_line(
+                'haproxy_server_current_sessions{proxy="p:l",server="m"} 3\n'))
+        # Metrics are matched on the exact name, not on a prefix
+        self.assertIsNone(prometheus_proxy.rewrite_metric_line(
+            'haproxy_frontend_current_sessions_total 1\n'))
+        self.assertIsNone(prometheus_proxy.rewrite_metric_line(
+            '# HELP haproxy_unknown_metric Unknown.\n'))
+        self.assertIsNone(prometheus_proxy.rewrite_metric_line('#\n'))
+
+    @mock.patch('octavia.cmd.prometheus_proxy.UPSTREAM_POOL.open')
+    @mock.patch('os.cpu_count', return_value=2)
+    @mock.patch('psutil.getloadavg', return_value=(1, 2, 3))
+    @mock.patch('psutil.virtual_memory', return_value=(1, 2, 23.5))
+    @mock.patch('http.server.SimpleHTTPRequestHandler.__init__')
+    def test_do_get_gzip(self, mock_req_handler_init, mock_virt_mem,
+                         mock_getloadavg, mock_cpu_count, mock_urlopen):
+        mock_req_handler_init.return_value = None
+        proxy = prometheus_proxy.PrometheusProxy()
+
+        proxy.send_response = mock.MagicMock()
+        proxy.send_header = mock.MagicMock()
+        proxy.end_headers = mock.MagicMock()
+        proxy.headers = {'accept-encoding': 'deflate, gzip;q=1.0'}
+        proxy.path = '/metrics'
+
+        with open("octavia/tests/common/sample_octavia_prometheus",
+                  "rb") as file2:
+            octavia_metrics = file2.read()
+
+        for ttl, request_version in ((1, 'HTTP/1.1'), (0, 'HTTP/1.0')):
+            proxy.send_header.reset_mock()
+            proxy.wfile = io.BytesIO()
+            proxy.request_version = request_version
+            with mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                            prometheus_proxy.MetricsCache(ttl)), open(
+                    "octavia/tests/common/sample_haproxy_prometheus",
+                    "rb") as file:
+                mock_urlopen.return_value = file
+
+                proxy.do_GET()
+
+            proxy.send_header.assert_any_call('content-encoding', 'gzip')
+            self.assertEqual(octavia_metrics,
+                             gzip.decompress(proxy.wfile.getvalue()))
+
+    @mock.patch('http.server.SimpleHTTPRequestHandler.__init__')
+    def test_accepts_gzip(self, mock_req_handler_init):
+        mock_req_handler_init.return_value = None
+        proxy = prometheus_proxy.PrometheusProxy()
+
+        for accept_encoding, expected in (
+                ('', False), ('deflate', False), ('gzip', True),
+                ('deflate, GZIP', True), ('gzip; q=0', False),
+                ('gzip;q=0.5', True)):
+            proxy.headers = {'accept-encoding': accept_encoding}
+            self.assertEqual(expected, proxy._accepts_gzip(), accept_encoding)
+
+    @mock.patch('time.monotonic')
+    def test_metrics_cache(self, mock_monotonic):
+        cache = prometheus_proxy.MetricsCache(2)
+        fetch = mock.MagicMock(side_effect=[b'first', b'second',
+                                            ValueError('boom'), b'third'])
+
+        mock_monotonic.return_value = 100
+        self.assertEqual(b'first', cache.get(None, fetch).payload)
+        mock_monotonic.return_value = 101.9
+        self.assertEqual(b'first', cache.get(None, fetch).payload)
+        self.assertEqual(1, fetch.call_count)
+
+        # Expired
+        mock_monotonic.return_value = 102
+        metrics = cache.get(None, fetch)
+        self.assertEqual(b'second', metrics.payload)
+        self.assertEqual(b'second', gzip.decompress(metrics.gzip_payload))
+        self.assertEqual(2, fetch.call_count)
+
+        # Failures are not cached
+        mock_monotonic.return_value = 105
+        self.assertRaises(ValueError, cache.get, None, fetch)
+        self.assertEqual(b'third', cache.get(None, fetch).payload)
+
+    def test_metrics_cache_scopes(self):
+        cache = prometheus_proxy.MetricsCache(2)
+        fetch = mock.MagicMock(side_effect=[b'all', b'listener'])
+
+        self.assertEqual(b'all', cache.get(None, fetch).payload)
+        self.assertEqual(b'listener',
+                         cache.get(frozenset(['listener']), fetch).payload)
+        self.assertEqual(b'all', cache.get(None, fetch).payload)
+        self.assertEqual(2, fetch.call_count)
+
+    def test_parse_scopes(self):
+        self.assertIsNone(prometheus_proxy.parse_scopes(''))
+        self.assertIsNone(prometheus_proxy.parse_scopes('scope='))
+        self.assertIsNone(prometheus_proxy.parse_scopes('scope=,'))
+        self.assertEqual(frozenset(['listener', 'pool']),
+                         prometheus_proxy.parse_scopes(
+                             'scope=listener,pool'))
+        self.assertEqual(frozenset(['loadbalancer', 'member']),
+                         prometheus_proxy.parse_scopes(
+                             'scope=member&other=1&scope=loadbalancer'))
+        self.assertRaisesRegex(ValueError, 'Unknown metric scope.*server',
+                               prometheus_proxy.parse_scopes,
+                               'scope=listener,server')
+
+    def test_rewrite_metric_line_scopes(self):
+        scopes = frozenset(['listener'])
+        self.assertEqual(
+            '# TYPE octavia_listener_current_sessions gauge\n',
+            prometheus_proxy.rewrite_metric_line(
+                '# TYPE haproxy_frontend_current_sessions gauge\n', scopes))
+        self.assertIsNone(prometheus_proxy.rewrite_metric_line(
+            '# TYPE haproxy_server_current_sessions gauge\n', scopes))
+        self.assertIsNone(prometheus_proxy.rewrite_metric_line(
+            'haproxy_server_current_sessions{proxy="p:l",server="m"} 3\n',
+            scopes))
+
+    @mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                prometheus_proxy.MetricsCache(1))
+    @mock.patch('octavia.cmd.prometheus_proxy.UPSTREAM_POOL.open')
+    @mock.patch('http.server.SimpleHTTPRequestHandler.__init__')
+    def test_do_get_scopes(self, mock_req_handler_init, mock_open):
+        mock_req_handler_init.return_value = None
+        proxy = prometheus_proxy.PrometheusProxy()
+
+        proxy.send_response = mock.MagicMock()
+        proxy.send_header = mock.MagicMock()
+        proxy.end_headers = mock.MagicMock()
+        proxy.wfile = io.BytesIO()
+        proxy.headers = {}
+        proxy.path = '/metrics?scope=listener,pool'
+
+        with open("octavia/tests/common/sample_haproxy_prometheus",
+                  "rb") as file:
+            mock_open.return_value = file
+
+            proxy.do_GET()
+
+        mock_open.assert_called_once_with(frozenset(['listener', 'pool']))
+        proxy.send_response.assert_called_once_with(200)
+        metrics = proxy.wfile.getvalue().decode('utf-8').splitlines()
+        self.assertTrue(metrics)
+        for line in metrics:
+            name = line.split(' ')[2] if line.startswith('#') else line
+            self.assertTrue(name.startswith(('octavia_listener_',
+                                             'octavia_pool_')), line)
+
+        # Unknown scopes are rejected
+        proxy.send_response.reset_mock()
+        mock_open.reset_mock()
+        proxy.path = '/metrics?scope=frontend'
+        proxy.do_GET()
+        proxy.send_response.assert_called_once_with(400)
+        mock_open.assert_not_called()
+
+    def test_metrics_cache_coalescing(self):
+        cache = prometheus_proxy.MetricsCache(1)
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def fetch():
+            fetching.set()
+            release.wait()
+            return b'metrics'
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(cache.get(None, fetch)))]
+        threads[0].start()
+        fetching.wait()
+        # These scrapes wait for the in-flight fetch
+        mock_fetch = mock.MagicMock()
+        threads += [threading.Thread(
+            target=lambda: results.append(cache.get(None, mock_fetch)))
+            for _ in range(3)]
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        mock_fetch.assert_not_called()
+        self.assertEqual(4, len(results))
+        for metrics in results:
+            self.assertIs(results[0], metrics)
+
+    @mock.patch('http.client.HTTPConnection')
+    def test_upstream_connection_pool(self, mock_http_conn):
+        pool = prometheus_proxy.UpstreamConnectionPool(
+            'http://127.0.0.1:9101/metrics', max_idle=1)
+        mock_conn = mock_http_conn.return_value
+        mock_response = mock_conn.getresponse.return_value
+        mock_response.status = 200
+        mock_response.will_close = False
+        mock_response.__iter__.return_value = [b'metric 1\n']
+
+        with pool.open() as source:
+            self.assertEqual([b'metric 1\n'], list(source))
+
+        mock_http_conn.assert_called_once_with(
+            '127.0.0.1', 9101, timeout=prometheus_proxy.UPSTREAM_TIMEOUT)
+        mock_conn.request.assert_called_once_with('GET', '/metrics')
+        mock_conn.close.assert_not_called()
+
+        # The HAProxy scopes of the metrics are requested
+        mock_conn.reset_mock()
+        with pool.open(frozenset(['member', 'loadbalancer'])) as source:
+            list(source)
+        mock_conn.request.assert_called_once_with(
+            'GET', '/metrics?scope=global&scope=server')
+
+        # The idle connection is reused
+        mock_http_conn.reset_mock()
+        with pool.open() as source:
+            list(source)
+        mock_http_conn.assert_not_called()
+        mock_conn.request.assert_called_once_with('GET', '/metrics')
+
+        # The connection is closed if the response was not entirely read
+        with pool.open():
+            pass
+        mock_conn.close.assert_called_once_with()
+
+        # A new connection is opened if the exporter closed the idle one
+        with pool.open() as source:
+            list(source)
+        mock_conn.reset_mock()
+        mock_conn.getresponse.side_effect = [
+            http.client.RemoteDisconnected, mock_response]
+        with pool.open() as source:
+            list(source)
+        self.assertEqual(2, mock_conn.request.call_count)
+        mock_conn.close.assert_called_once_with()
+
+        # ... but a new connection is not retried
+        mock_http_conn.reset_mock()
+        mock_conn.reset_mock()
+        mock_conn.getresponse.side_effect = ConnectionRefusedError
+        self.assertRaises(ConnectionRefusedError, pool.open)
+        self.assertRaises(ConnectionRefusedError, pool.open)
+        self.assertEqual(3, mock_conn.request.call_count)
+
+        # HTTP errors are raised, the connection is kept
+        mock_conn.getresponse.side_effect = None
+        mock_response.status = 503
+        self.assertRaisesRegex(Exception, 'HTTP 503', pool.open)
+        mock_response.read.assert_called_once_with()
+        mock_http_conn.reset_mock()
+        mock_response.status = 200
+        with pool.open() as source:
+            list(source)
+        mock_http_conn.assert_not_called()
+
+    @mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                prometheus_proxy.MetricsCache(1))
+    @mock.patch('octavia.cmd.prometheus_proxy.UPSTREAM_POOL.open')
     @mock.patch('os.cpu_count', return_value=2)
     @mock.patch('psutil.getloadavg', return_value=(1, 2, 3))
     @mock.patch('psutil.virtual_memory', return_value=(1, 2, 23.5))
     @mock.patch('http.server.SimpleHTTPRequestHandler.__init__')
     def test_do_get_exception(self, mock_req_handler_init, mock_virt_mem,
                               mock_getloadavg, mock_cpu_count, mock_urlopen):
-        mock_urlopen.side_effect = [Exception('boom')]
+        mock_urlopen.side_effect = [Exception('boom'), Exception('boom')]
         mock_req_handler_init.return_value = None
         proxy = prometheus_proxy.PrometheusProxy()
 
@@ -117,11 +441,21 @@ class TestPrometheusProxyCMD(base.TestCase):
         proxy.send_header = mock_send_header
         mock_end_headers = mock.MagicMock()
         proxy.end_headers = mock_end_headers
+        proxy.headers = {}
+        proxy.path = '/metrics'
 
         proxy.do_GET()
 
         mock_send_response.assert_called_once_with(502)
 
+        # Without cache
+        mock_send_response.reset_mock()
+        with mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                        prometheus_proxy.MetricsCache(0)):
+            proxy.do_GET()
+
+        mock_send_response.assert_called_once_with(502)
+
     @mock.patch('signal.signal')
     def test_signalhandler(self, mock_signal):
 
@@ -146,6 +480,9 @@ class TestPrometheusProxyCMD(base.TestCase):
         mock_exit_event.wait.assert_called_once()
         mock_http.shutdown.assert_called_once()
 
+    @mock.patch('octavia.cmd.prometheus_proxy.METRICS_CACHE',
+                prometheus_proxy.MetricsCache(1))
+    @mock.patch('sys.argv', ['prometheus-proxy', '--cache-ttl', '3'])
     @mock.patch('threading.Thread')
     @mock.patch('http.server.ThreadingHTTPServer.serve_forever')
     @mock.patch('octavia.amphorae.backends.utils.network_namespace.'
@@ -164,3 +501,4 @@ class TestPrometheusProxyCMD(base.TestCase):
 
         mock_signal_handler.assert_called_once()
         mock_serve_forever.assert_called_once()
+        self.assertEqual(3, prometheus_proxy.METRICS_CACHE.ttl)
@@ -2094,3 +2094,56 @@ class TestHaproxyCfg(base.TestCase):
             mock_amp, mock_listeners, tls_certs=mock_tls_certs,
             socket_path=mock_socket_path, amp_details=None,
             feature_compatibility=expected_fc)
+
+    def test_render_cache(self):
+        listener = sample_configs_combined.sample_listener_tuple(
+            topology=constants.TOPOLOGY_ACTIVE_STANDBY)
+        amp1 = sample_configs_combined.sample_amphora_tuple(
+            role=constants.ROLE_MASTER)
+        amp2 = sample_configs_combined.sample_amphora_tuple(
+            id='sample_amphora_id_2', role=constants.ROLE_BACKUP)
+
+        with mock.patch.object(self.jinja_cfg, '_get_template',
+                               wraps=self.jinja_cfg._get_template) as mock_t:
+            config = self.jinja_cfg.render_loadbalancer_obj(
+                amp1, [listener])
+            # The configuration is reused for the peer amphora
+            self.assertEqual(config, self.jinja_cfg.render_loadbalancer_obj(
+                amp2, [listener]))
+            mock_t.assert_called_once_with()
+
+            # A change of the load balancer renders a new configuration
+            listener.pools[0].members.pop()
+            self.assertNotEqual(
+                config, self.jinja_cfg.render_loadbalancer_obj(
+                    amp1, [listener]))
+            self.assertEqual(2, mock_t.call_count)
+
+        # The host amphora can be used by the other templates
+        self.jinja_cfg.haproxy_template = '/etc/octavia/haproxy.cfg.j2'
+        with mock.patch.object(self.jinja_cfg, '_get_template') as mock_t:
+            mock_t.return_value.render.return_value = 'the_config'
+            self.jinja_cfg.render_loadbalancer_obj(amp1, [listener])
+            self.jinja_cfg.render_loadbalancer_obj(amp2, [listener])
+            self.jinja_cfg.render_loadbalancer_obj(amp2, [listener])
+            self.assertEqual(2, mock_t.call_count)
+
+    def test_render_members(self):
+        listener = sample_configs_combined.sample_listener_tuple()
+        amp = sample_configs_combined.sample_amphora_tuple()
+        config = self.jinja_cfg.render_loadbalancer_obj(amp, [listener])
+        jinja_cfg.RENDER_CACHE.clear()
+
+        with mock.patch.object(jinja_cfg.MACROS, 'member_macro',
+                               wraps=jinja_cfg.MACROS.member_macro) as mock_m:
+            # The server lines of the unchanged members are reused
+            self.assertEqual(config, self.jinja_cfg.render_loadbalancer_obj(
+                amp, [listener]))
+            mock_m.assert_not_called()
+
+            listener.pools[0].members[0] = (
+                listener.pools[0].members[0]._replace(weight=42))
+            config = self.jinja_cfg.render_loadbalancer_obj(amp, [listener])
+            mock_m.assert_called_once()
+            self.assertIn('server sample_member_id_1 10.0.0.99:82 weight 42 ',
+                          config)
@@ -1279,5 +1279,8 @@ def sample_base_expected_config(frontend=None, logging=None, backend=None,
             "    log /run/rsyslog/octavia/log local0\n"
             "    log /run/rsyslog/octavia/log local1 notice\n"
             "    stats socket /var/lib/octavia/sample_loadbalancer_id_1.sock"
-            " mode 0666 level user\n" +
+            " mode 0666 level user\n"
+            "    stats socket"
+            " /var/lib/octavia/sample_loadbalancer_id_1-admin.sock"
+            " mode 0600 level admin\n" +
             global_opts + defaults + peers + frontend + logging + backend)
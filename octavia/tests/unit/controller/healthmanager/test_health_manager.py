@@ -135,3 +135,71 @@ class TestHealthManager(base.TestCase):
 
         self.assertRaises(TestException, hm.health_check)
         self.assertEqual(0, mock_session.rollback.call_count)
+
+    @mock.patch('octavia.db.repositories.HealthManagerMemberRepository.'
+                'get_live_member_ids')
+    @mock.patch('octavia.db.repositories.HealthManagerMemberRepository.'
+                'replace')
+    @mock.patch('octavia.db.api.get_session')
+    def test_update_membership(self, session_mock, replace_mock,
+                               get_live_member_ids_mock):
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(host='hm2')
+        conf.config(group="health_manager", amphora_partitioning=True,
+                    heartbeat_timeout=60)
+        get_live_member_ids_mock.return_value = ['hm1', 'hm3']
+
+        hm = healthmanager.HealthManager(threading.Event())
+        hm.update_membership()
+
+        replace_mock.assert_called_once_with(
+            session_mock.return_value, 'hm2', last_update=mock.ANY)
+        self.assertEqual(['hm1', 'hm2', 'hm3'], hm.member_ids)
+
+        # The registration is not refreshed before health_check_interval
+        hm.update_membership()
+        replace_mock.assert_called_once()
+
+        # Amphorae are partitioned across the members
+        owners = {amp_id: [member_id for member_id in hm.member_ids
+                           if healthmanager.utils.rendezvous_hash_order(
+                               amp_id, hm.member_ids)[0] == member_id]
+                  for amp_id in (uuidutils.generate_uuid()
+                                 for _ in range(30))}
+        for amp_id, amp_owners in owners.items():
+            self.assertEqual(amp_owners == ['hm2'],
+                             hm.is_amphora_owner(amp_id))
+
+    @mock.patch('octavia.db.repositories.HealthManagerMemberRepository.'
+                'replace')
+    @mock.patch('octavia.db.api.get_session')
+    def test_update_membership_disabled(self, session_mock, replace_mock):
+        hm = healthmanager.HealthManager(threading.Event())
+        hm.update_membership()
+
+        replace_mock.assert_not_called()
+        self.assertTrue(hm.is_amphora_owner(AMPHORA_ID))
+
+    @mock.patch('octavia.controller.healthmanager.health_manager.'
+                'HealthManager.update_membership')
+    @mock.patch('octavia.db.repositories.AmphoraHealthRepository.'
+                'get_stale_amphora', return_value=None)
+    @mock.patch('octavia.db.api.get_session')
+    def test_health_check_partitioning(self, session_mock,
+                                       get_stale_amp_mock,
+                                       update_membership_mock):
+        conf = self.useFixture(oslo_fixture.Config(cfg.CONF))
+        conf.config(group="health_manager", amphora_partitioning=True)
+
+        hm = healthmanager.HealthManager(threading.Event())
+        hm.health_check()
+
+        update_membership_mock.assert_called_once_with()
+        get_stale_amp_mock.assert_called_once_with(
+            session_mock.return_value, amphora_filter=hm.is_amphora_owner)
+
+        # A DB error while updating the membership does not stop the check
+        get_stale_amp_mock.reset_mock()
+        update_membership_mock.side_effect = db_exc.DBError
+        hm.health_check()
+        get_stale_amp_mock.assert_called_once()
@@ -223,6 +223,29 @@ class TestAmphoraDriverTasks(base.TestCase):
         self.assertEqual(2, repo.ListenerRepository.update.call_count)
         self.assertIsNone(amp)
 
+    @mock.patch('octavia.db.repositories.LoadBalancerRepository.get')
+    def test_members_update(self,
+                            mock_lb_get,
+                            mock_driver,
+                            mock_generate_uuid,
+                            mock_log,
+                            mock_get_session,
+                            mock_listener_repo_get,
+                            mock_listener_repo_update,
+                            mock_amphora_repo_get,
+                            mock_amphora_repo_update):
+        members_update_obj = amphora_driver_tasks.MembersUpdate()
+        lb = data_models.LoadBalancer(id='lb1')
+        mock_lb_get.side_effect = [lb, None]
+        members_update_obj.execute(lb.id)
+        mock_driver.update_members.assert_called_once_with(lb)
+        mock_driver.update.assert_not_called()
+
+        mock_driver.update_members.reset_mock()
+
+        members_update_obj.execute(None)
+        mock_driver.update_members.assert_not_called()
+
     @mock.patch('octavia.db.repositories.LoadBalancerRepository.get')
     @mock.patch('octavia.controller.worker.task_utils.TaskUtils.'
                 'mark_listener_prov_status_error')
@@ -385,6 +408,22 @@ class TestAmphoraDriverTasks(base.TestCase):
         mock_driver.get_info.assert_called_once_with(
             _db_amphora_mock)
 
+    def test_amphora_close_connections(self,
+                                       mock_driver,
+                                       mock_generate_uuid,
+                                       mock_log,
+                                       mock_get_session,
+                                       mock_listener_repo_get,
+                                       mock_listener_repo_update,
+                                       mock_amphora_repo_get,
+                                       mock_amphora_repo_update):
+
+        amphora_close_connections_obj = (
+            amphora_driver_tasks.AmphoraCloseConnections())
+        amphora_close_connections_obj.execute(_amphora_mock)
+
+        mock_driver.close_connections.assert_called_once_with(AMP_ID)
+
     def test_amphora_get_diagnostics(self,
                                      mock_driver,
                                      mock_generate_uuid,
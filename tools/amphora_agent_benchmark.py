@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Measures the latency of the read-only endpoints of an amphora agent,
+# optionally while the agent is kept busy by the reloads of a load balancer,
+# and checks it against a latency SLO.
+#
+# Example, from a controller:
+#
+#   tools/amphora_agent_benchmark.py --amphora-id <amphora id>
+#       --cert /etc/octavia/certs/client.pem
+#       --ca /etc/octavia/certs/server_ca.pem
+#       --busy-lb <load balancer id> https://<lb_network_ip>:9443
+
+import argparse
+import sys
+import threading
+import time
+
+import requests
+
+from octavia.amphorae.backends.agent import api_server
+from octavia.amphorae.drivers.haproxy import rest_api_driver
+
+ENDPOINTS = ('info', 'details', 'listeners')
+TIMEOUT = 60
+
+
+def percentile(latencies, percent):
+    latencies = sorted(latencies)
+    index = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+    return latencies[index]
+
+
+def get_session(args):
+    session = requests.Session()
+    session.cert = args.cert
+    session.verify = args.ca
+    adapter = rest_api_driver.CustomHostNameCheckingAdapter()
+    adapter.uuid = args.amphora_id
+    session.mount('https://', adapter)
+    return session
+
+
+def measure(args, url):
+    latencies = []
+    lock = threading.Lock()
+
+    def run(count):
+        session = get_session(args)
+        for dummy in range(count):
+            start = time.monotonic()
+            session.get(url, timeout=TIMEOUT).raise_for_status()
+            latency = time.monotonic() - start
+            with lock:
+                latencies.append(latency)
+
+    threads = [
+        threading.Thread(target=run, args=(
+            args.requests // args.concurrency +
+            (1 if i < args.requests % args.concurrency else 0),))
+        for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def keep_busy(args, url, stop_event):
+    session = get_session(args)
+    while not stop_event.is_set():
+        session.put(url, timeout=TIMEOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the read-only endpoints of an amphora agent.')
+    parser.add_argument('url', help='The URL of the amphora agent, '
+                                    'e.g. https://192.0.2.10:9443')
+    parser.add_argument('--amphora-id', required=True,
+                        help='The id of the amphora, its certificate CN.')
+    parser.add_argument('--cert', required=True,
+                        help='The client certificate and key of the '
+                             'controller.')
+    parser.add_argument('--ca', required=True,
+                        help='The CA of the amphora agent certificates.')
+    parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                        help='A read-only endpoint to benchmark, defaults '
+                             'to all of them.')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='The number of requests per endpoint.')
+    parser.add_argument('--concurrency', type=int, default=2,
+                        help='The number of concurrent requests.')
+    parser.add_argument('--busy-lb',
+                        help='Keep reloading this load balancer during '
+                             'the benchmark.')
+    parser.add_argument('--slo-p99', type=float, default=500,
+                        help='The maximum 99th percentile latency, in '
+                             'milliseconds.')
+    args = parser.parse_args()
+
+    base_url = f'{args.url.rstrip("/")}/{api_server.VERSION}/'
+    stop_event = threading.Event()
+    busy_thread = None
+    if args.busy_lb:
+        busy_thread = threading.Thread(
+            target=keep_busy,
+            args=(args, f'{base_url}loadbalancer/{args.busy_lb}/reload',
+                  stop_event))
+        busy_thread.start()
+
+    failed = False
+    try:
+        for endpoint in args.endpoint or ENDPOINTS:
+            latencies = [latency * 1000 for latency in measure(
+                args, base_url + endpoint)]
+            p99 = percentile(latencies, 99)
+            print(f'{endpoint}: requests={len(latencies)} '
+                  f'p50={percentile(latencies, 50):.1f}ms '
+                  f'p90={percentile(latencies, 90):.1f}ms '
+                  f'p99={p99:.1f}ms max={max(latencies):.1f}ms')
+            if p99 > args.slo_p99:
+                print(f'{endpoint}: the p99 latency exceeds the SLO of '
+                      f'{args.slo_p99:.1f}ms')
+                failed = True
+    finally:
+        stop_event.set()
+        if busy_thread:
+            busy_thread.join()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# Measures the rendering time of the HAProxy configuration of a large load
+# balancer, when it is rendered for the first time and after the update of a
+# member, and checks it against a time budget.
+#
+# Example, from the root of the repository:
+#
+#   tools/haproxy_config_benchmark.py --members 10000 --l7rules 1000
+
+import argparse
+import sys
+import time
+
+from octavia.common import config
+from octavia.common import constants
+from octavia.common.jinja.haproxy.combined_listeners import jinja_cfg
+from octavia.tests.unit.common.sample_configs import sample_configs_combined
+
+HAPROXY_VERSIONS = ['2', '4']
+
+
+def get_listener(members, l7rules):
+    listener = sample_configs_combined.sample_listener_tuple(
+        proto=constants.PROTOCOL_HTTP, l7=True)
+    listener.pools[0].members[:] = [
+        sample_configs_combined.sample_member_tuple(
+            f'member_{i}', f'10.{i // 65536}.{i // 256 % 256}.{i % 256}')
+        for i in range(members)]
+    listener.l7policies[0].l7rules[:] = [
+        sample_configs_combined.sample_l7rule_tuple(
+            f'l7rule_{i}', value=f'/api/{i}')
+        for i in range(l7rules)]
+    return listener
+
+
+def measure(templater, amphora, listener, count, update_member=False):
+    durations = []
+    for i in range(count):
+        jinja_cfg.RENDER_CACHE.clear()
+        if update_member:
+            members = listener.pools[0].members
+            members[0] = members[0]._replace(weight=i % 256)
+        else:
+            jinja_cfg.MEMBER_CACHE.clear()
+        start = time.monotonic()
+        templater.build_config(amphora, [listener], {}, HAPROXY_VERSIONS, {})
+        durations.append((time.monotonic() - start) * 1000)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the rendering of the HAProxy configurations.')
+    parser.add_argument('--members', type=int, default=10000,
+                        help='The number of members of the pool.')
+    parser.add_argument('--l7rules', type=int, default=1000,
+                        help='The number of rules of the L7 policy.')
+    parser.add_argument('--count', type=int, default=5,
+                        help='The number of renders per measure.')
+    parser.add_argument('--max-render', type=float, default=3000,
+                        help='The maximum median time of a first render, in '
+                             'milliseconds.')
+    parser.add_argument('--max-update', type=float, default=1000,
+                        help='The maximum median time of a render after a '
+                             'member update, in milliseconds.')
+    args = parser.parse_args()
+
+    config.register_cli_opts()
+    templater = jinja_cfg.JinjaTemplater()
+    amphora = sample_configs_combined.sample_amphora_tuple()
+    listener = get_listener(args.members, args.l7rules)
+
+    failed = False
+    for name, update_member, budget in (
+            ('render', False, args.max_render),
+            ('update', True, args.max_update)):
+        durations = sorted(measure(templater, amphora, listener, args.count,
+                                   update_member=update_member))
+        median = durations[len(durations) // 2]
+        print(f'{name}: members={args.members} l7rules={args.l7rules} '
+              f'median={median:.1f}ms max={durations[-1]:.1f}ms')
+        if median > budget:
+            print(f'{name}: the median time exceeds the budget of '
+                  f'{budget:.1f}ms')
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())